@@ -0,0 +1,148 @@
+# batch.py
+#
+# 複数キャンペーンをまとめて解く。
+#   python batch.py                 # campaign.csv の全キャンペーン
+#   python batch.py CAM1 CAM3 -j 2  # 指定したキャンペーンだけ、2プロセスで
+# 入力は1回だけ読み込み、各ワーカープロセスには initializer で1度だけ渡す。
+# 出力は OUTPUT_DIR/<campaign_id>/ に main.py と同じ3ファイル、
+# 全体のまとめは OUTPUT_DIR/batch_summary.csv。
+
+import argparse
+import csv
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Any, List
+
+from config import OUTPUT_DIR, WARM_START, PRESOLVE_PRUNING, ENCODING, CANDIDATE_BACKEND
+from reader import load_previous_schedule
+from solver_cp_sat import solve_shifts, split_workers
+from profiling import RunProfiler
+from main import (
+    setup_logging,
+    load_inputs,
+    export_shifts_by_teacher,
+    export_shifts_by_student,
+    export_shortage_csv
+)
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_FIELDS = ["campaign_id", "campaign_name", "timeslots", "shifts", "shortage_total",
+                  "status", "stop_reason", "objective", "best_bound", "wall_time", "output_dir"]
+
+# ワーカープロセス内で共有する入力 (_init_worker で設定)
+_shared_inputs: Dict[str, Any] = {}
+
+
+def _init_worker(inputs: Dict[str, Any]):
+    global _shared_inputs
+    _shared_inputs = inputs
+    setup_logging()
+
+
+def solve_campaign(campaign_id: str) -> Dict[str, Any]:
+    """1キャンペーン分を解いて OUTPUT_DIR/<campaign_id>/ に出力し、サマリ行を返す。"""
+    inputs = _shared_inputs
+    out_dir = os.path.join(OUTPUT_DIR, campaign_id)
+    previous_assignment = set()
+    if WARM_START:
+        previous_assignment = load_previous_schedule(os.path.join(out_dir, "teacher_schedules.csv"))
+
+    stats = {}
+    shifts, shortage = solve_shifts(
+        teachers=inputs["teachers"],
+        students=inputs["students"],
+        timeslots=inputs["timeslots"],
+        campaigns=inputs["campaigns"],
+        regular_classes=inputs["regular_classes"],
+        subjects=inputs["subjects"],
+        campaign_id=campaign_id,
+        constraint_weights=inputs["constraint_weights"],
+        solver_params=inputs["solver_params"],
+        solve_stats=stats,
+        previous_assignment=previous_assignment,
+        prune=PRESOLVE_PRUNING,
+        encoding=ENCODING,
+        candidate_backend=CANDIDATE_BACKEND
+    )
+    if shifts or shortage:
+        export_shifts_by_teacher(shifts, os.path.join(out_dir, "teacher_schedules.csv"))
+        export_shifts_by_student(shifts, os.path.join(out_dir, "student_schedules.csv"))
+        export_shortage_csv(shortage, inputs["students"], inputs["subjects"],
+                            os.path.join(out_dir, "shortage.csv"))
+
+    campaign = inputs["campaigns"][campaign_id]
+    return {
+        "campaign_id": campaign_id,
+        "campaign_name": campaign.name,
+        "timeslots": sum(1 for ts in inputs["timeslots"].values() if ts.campaign_id == campaign_id),
+        "shifts": len(shifts),
+        "shortage_total": sum(shortage.values()),
+        "status": stats.get("status", "NO_TIMESLOTS"),
+        "stop_reason": stats.get("stop_reason", ""),
+        "objective": stats.get("objective"),
+        "best_bound": stats.get("best_bound"),
+        "wall_time": stats.get("wall_time"),
+        "output_dir": out_dir,
+    }
+
+
+def run_batch(campaign_ids: List[str] = None, max_workers: int = None) -> List[Dict[str, Any]]:
+    profiler = RunProfiler()
+    inputs = load_inputs(profiler)
+
+    all_ids = list(inputs["campaigns"].keys())
+    if campaign_ids:
+        unknown = [c for c in campaign_ids if c not in inputs["campaigns"]]
+        if unknown:
+            logger.error(f"Unknown campaign ids: {unknown}")
+        campaign_ids = [c for c in campaign_ids if c in inputs["campaigns"]]
+    else:
+        campaign_ids = all_ids
+    logger.info(f"Solving {len(campaign_ids)} campaigns: {campaign_ids}")
+
+    # 同時に走る solve_shifts の数で CP-SAT のワーカーを割る (全プロセスが全コア分のワーカーを立てないように)
+    n_processes = max(1, min(max_workers or os.cpu_count() or 1, len(campaign_ids)))
+    worker_inputs = dict(inputs, solver_params=split_workers(inputs["solver_params"], n_processes))
+
+    summary = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=n_processes, initializer=_init_worker,
+                             initargs=(worker_inputs,)) as pool:
+        futures = {pool.submit(solve_campaign, c_id): c_id for c_id in campaign_ids}
+        for future in as_completed(futures):
+            c_id = futures[future]
+            try:
+                row = future.result()
+            except Exception as e:
+                logger.error(f"Campaign {c_id} failed: {e}")
+                row = {"campaign_id": c_id, "status": "ERROR", "stop_reason": str(e)}
+            logger.info(f"Campaign {c_id}: {row.get('status')} shifts={row.get('shifts')} "
+                        f"shortage={row.get('shortage_total')}")
+            summary.append(row)
+    summary.sort(key=lambda r: campaign_ids.index(r["campaign_id"]))
+    logger.info(f"Batch finished in {time.perf_counter() - start:.2f}s")
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    summary_path = os.path.join(OUTPUT_DIR, "batch_summary.csv")
+    with open(summary_path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        writer.writerows(summary)
+    logger.info(f"Batch summary exported to {summary_path}")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Solve several campaigns in parallel worker processes.")
+    parser.add_argument("campaign_ids", nargs="*", help="省略時は campaign.csv の全キャンペーン")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="プロセス数 (省略時は CPU 数)")
+    args = parser.parse_args()
+    setup_logging()
+    run_batch(args.campaign_ids, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+# benchmark: ソルバーの性能計測用スクリプト群
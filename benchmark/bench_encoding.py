@@ -0,0 +1,62 @@
+# benchmark/bench_encoding.py
+#
+# solve_shifts の encoding="reified" と encoding="linear" を比べる。
+#   python -m benchmark.bench_encoding [data_dir] [--scales 1,4,8] [--time-limit 30]
+# 各ケースで 最初の解までの時間 / 終了までの時間 / 目的値 / 上界 を表にして出す。
+
+import argparse
+import logging
+import time
+
+from solver_cp_sat import solve_shifts
+from benchmark.common import FirstSolutionTimer, replicate_dataset
+from reader import load_inputs_dir
+
+
+def run_case(dataset, campaign_id, encoding, solver_params):
+    timer = FirstSolutionTimer()
+    stats = {}
+    solve_shifts(campaign_id=campaign_id, solver_params=solver_params, solve_stats=stats,
+                 encoding=encoding, on_solution=timer, stream_interval=0.0, **dataset)
+    total = time.perf_counter() - timer.start
+    return {
+        "encoding": encoding,
+        "first_solution": timer.first_solution(stats),
+        "solve_time": stats.get("wall_time"),
+        "total_time": total,
+        "status": stats.get("status"),
+        "objective": stats.get("objective"),
+        "best_bound": stats.get("best_bound"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare reified vs linear indicator encodings.")
+    parser.add_argument("data_dir", nargs="?", default="api_data")
+    parser.add_argument("--campaign", default="CAM1")
+    parser.add_argument("--scales", default="1,4,8",
+                        help="教師・生徒を何倍に複製して試すか (カンマ区切り)")
+    parser.add_argument("--time-limit", type=float, default=30.0)
+    parser.add_argument("--workers", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    base = load_inputs_dir(args.data_dir)
+    solver_params = {"max_time_in_seconds": args.time_limit,
+                     "num_search_workers": args.workers,
+                     "random_seed": 1}
+
+    print(f"{'scale':>5} {'encoding':>8} {'first[s]':>9} {'solve[s]':>9} {'total[s]':>9} "
+          f"{'status':>9} {'objective':>10} {'bound':>10}")
+    for scale in [int(v) for v in args.scales.split(",")]:
+        dataset = replicate_dataset(base, scale) if scale > 1 else base
+        for encoding in ("reified", "linear"):
+            r = run_case(dataset, args.campaign, encoding, solver_params)
+            first = f"{r['first_solution']:.3f}" if r["first_solution"] is not None else "-"
+            print(f"{scale:>5} {encoding:>8} {first:>9} {r['solve_time']:>9.3f} {r['total_time']:>9.3f} "
+                  f"{r['status']:>9} {r['objective'] if r['objective'] is not None else '-':>10} "
+                  f"{r['best_bound'] if r['best_bound'] is not None else '-':>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# benchmark/bench_forms.py
+#
+# google_api_data.run_pipeline の段ごとの時間を回答数別に測る。
+#   python -m benchmark.bench_forms [--sizes 250,500,1000,2000] [--days 30] [--repeat 3]
+# 合成の回答 (benchmark.generate_forms) を StubClient 経由で取り込み、キャッシュ・ID 台帳・CSV 出力なしで
+# 全段を実行する。各段の最良値と、回答1件あたりの時間 (µs) を表にする。
+# 引き当ては FormIndex の dict なので、回答数を倍にしても1件あたりの時間はほぼ変わらない。
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+from google_api_data import STAGES, form_sources, fetch_forms, run_pipeline
+from sheets_ingest import StubClient
+from benchmark.generate_forms import generate_forms
+
+
+def run_case(sheet_values, repeat):
+    """repeat 回実行し、段ごとの最良の時間と全体の最良の時間を返す。"""
+    best = {}
+    best_total = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = run_pipeline(sheet_values, cache_dir=None, export_csv=False, id_registry_file=None)
+        total = time.perf_counter() - start
+        best_total = total if best_total is None else min(best_total, total)
+        for name, seconds in result["times"].items():
+            best[name] = min(best.get(name, seconds), seconds)
+    return best, best_total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the form pipeline stages by number of responses.")
+    parser.add_argument("--sizes", default="250,500,1000,2000", help="回答数 (カンマ区切り)")
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    stage_names = [name for name, *_ in STAGES]
+    width = max(len(name) for name in stage_names)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in (int(v) for v in args.sizes.split(",")):
+            forms_dir = generate_forms(os.path.join(tmp, str(size)), n_responses=size,
+                                       n_days=args.days, seed=args.seed)
+            sheet_values = fetch_forms(StubClient.from_dir(forms_dir), form_sources("teacher", "student"))
+            results.append((size, *run_case(sheet_values, args.repeat)))
+
+    print(f"{'stage':>{width}} | " + " ".join(f"{size:>9}" for size, *_ in results)
+          + " | " + " ".join(f"{f'µs/{size}':>9}" for size, *_ in results))
+    for name in stage_names + ["total"]:
+        seconds = [total if name == "total" else times.get(name, 0.0) for _, times, total in results]
+        print(f"{name:>{width}} | " + " ".join(f"{s * 1000:>7.1f}ms" for s in seconds)
+              + " | " + " ".join(f"{s / size * 1e6:>9.1f}" for s, (size, *_) in zip(seconds, results)))
+
+
+if __name__ == "__main__":
+    main()
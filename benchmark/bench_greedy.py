@@ -0,0 +1,87 @@
+# benchmark/bench_greedy.py
+#
+# heuristic.solve_shifts_greedy と solve_shifts (CP-SAT) を同じ入力で比べる。
+#   python -m benchmark.bench_greedy [data_dir ...] [--sizes 10:60:4,20:120:8] [--time-limit 30]
+# data_dir は data/ や api_data/ と同じ構成、sizes は 教師数:生徒数:日数 の合成キャンペーン。
+# 各ケースで greedy / CP-SAT / CP-SAT + greedy ヒント の 時間・目的値 を表にして出す。
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+from solver_cp_sat import solve_shifts
+from heuristic import solve_shifts_greedy, assignment_from_shifts
+from reader import load_inputs_dir
+from benchmark.generate import generate_campaign
+from benchmark.common import FirstSolutionTimer
+
+
+def run_cp_sat(dataset, campaign_id, solver_params, hint_assignment=None):
+    timer = FirstSolutionTimer()
+    stats = {}
+    solve_shifts(campaign_id=campaign_id, solver_params=solver_params, solve_stats=stats,
+                 hint_assignment=hint_assignment, on_solution=timer, stream_interval=0.0, **dataset)
+    return {"time": time.perf_counter() - timer.start, "first_solution": timer.first_solution(stats),
+            "objective": stats.get("objective"), "stop_reason": stats.get("stop_reason")}
+
+
+def run_case(dataset, campaign_id, solver_params, greedy_time_limit):
+    stats = {}
+    start = time.perf_counter()
+    shifts, _ = solve_shifts_greedy(campaign_id=campaign_id, solve_stats=stats,
+                                    time_limit=greedy_time_limit, **dataset)
+    greedy = {"time": time.perf_counter() - start, "objective": stats.get("objective"),
+              "stop_reason": stats.get("stop_reason")}
+    cold = run_cp_sat(dataset, campaign_id, solver_params)
+    warm = run_cp_sat(dataset, campaign_id, solver_params, assignment_from_shifts(shifts))
+    return greedy, cold, warm
+
+
+def _fmt(value, spec):
+    return format(value, spec) if value is not None else format("-", spec.split(".")[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the greedy heuristic with CP-SAT on shared inputs.")
+    parser.add_argument("data_dirs", nargs="*", default=["data", "api_data"])
+    parser.add_argument("--sizes", default="10:60:4,20:120:8",
+                        help="合成キャンペーンの 教師数:生徒数:日数 (カンマ区切り、空なら作らない)")
+    parser.add_argument("--campaign", default="CAM1")
+    parser.add_argument("--time-limit", type=float, default=30.0, help="CP-SAT の打ち切り時間")
+    parser.add_argument("--greedy-time-limit", type=float, default=1.0, help="局所探索の打ち切り時間")
+    parser.add_argument("--workers", type=int, default=0)
+    parser.add_argument("--hint-completion-time", type=float, default=10.0,
+                        help="ヒントを補助変数まで埋める前解きの上限 (秒、--time-limit の 1 割まで。0 なら x だけのヒント)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    solver_params = {"max_time_in_seconds": args.time_limit,
+                     "num_search_workers": args.workers,
+                     "random_seed": args.seed,
+                     "hint_completion_time": args.hint_completion_time}
+
+    print(f"{'case':>14} | {'greedy[s]':>9} {'greedy obj':>10} | {'cp-sat[s]':>9} {'first[s]':>8} "
+          f"{'cp-sat obj':>10} | {'hinted[s]':>9} {'first[s]':>8} {'hinted obj':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        cases = [(os.path.basename(os.path.normpath(d)), d) for d in args.data_dirs]
+        for size in filter(None, args.sizes.split(",")):
+            n_teachers, n_students, n_days = (int(v) for v in size.split(":"))
+            out_dir = generate_campaign(os.path.join(tmp, size.replace(":", "_")), n_teachers=n_teachers,
+                                        n_students=n_students, n_days=n_days, seed=args.seed)
+            cases.append((size, out_dir))
+
+        for name, data_dir in cases:
+            greedy, cold, warm = run_case(load_inputs_dir(data_dir), args.campaign,
+                                          solver_params, args.greedy_time_limit)
+            print(f"{name:>14} | {greedy['time']:>9.3f} {_fmt(greedy['objective'], '>10.0f')} | "
+                  f"{cold['time']:>9.3f} {_fmt(cold['first_solution'], '>8.3f')} "
+                  f"{_fmt(cold['objective'], '>10.0f')} | "
+                  f"{warm['time']:>9.3f} {_fmt(warm['first_solution'], '>8.3f')} "
+                  f"{_fmt(warm['objective'], '>10.0f')}")
+
+
+if __name__ == "__main__":
+    main()
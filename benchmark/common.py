@@ -0,0 +1,51 @@
+# benchmark/common.py
+
+import copy
+import time
+from typing import Dict, Any, Optional
+
+
+class FirstSolutionTimer:
+    """
+    solve_shifts(on_solution=timer, stream_interval=0) に渡して、最初の解までの時間を測る。
+    solve_shifts の前に作り、終わったら first_solution(solve_stats) で Solve 開始からの秒数を得る
+    (モデル構築と complete_hint の時間は solve_stats["build_time"] として差し引く)。
+    """
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first_call = None
+
+    def __call__(self, shifts, shortage, objective):
+        if self.first_call is None:
+            self.first_call = time.perf_counter()
+
+    def first_solution(self, solve_stats: Dict[str, Any]) -> Optional[float]:
+        if self.first_call is None:
+            return None
+        return self.first_call - self.start - solve_stats.get("build_time", 0.0)
+
+
+def replicate_dataset(dataset: Dict[str, Any], factor: int) -> Dict[str, Any]:
+    """
+    教師・生徒・レギュラー授業を factor 倍に複製した dataset を返す (timeslot は共通)。
+    ID には "_{k}" を付けて区別する。
+    """
+    teachers, students, regulars = {}, {}, {}
+    for k in range(factor):
+        for t_id, t_obj in dataset["teachers"].items():
+            t_copy = copy.copy(t_obj)
+            t_copy.teacher_id = f"{t_id}_{k}"
+            teachers[t_copy.teacher_id] = t_copy
+        for s_id, s_obj in dataset["students"].items():
+            s_copy = copy.copy(s_obj)
+            s_copy.student_id = f"{s_id}_{k}"
+            students[s_copy.student_id] = s_copy
+        for rc_id, rc in dataset["regular_classes"].items():
+            rc_copy = copy.copy(rc)
+            rc_copy.regular_class_id = f"{rc_id}_{k}"
+            rc_copy.teacher_id = f"{rc.teacher_id}_{k}"
+            rc_copy.enrolled_student_ids = [f"{s_id}_{k}" for s_id in rc.enrolled_student_ids]
+            regulars[rc_copy.regular_class_id] = rc_copy
+    scaled = dict(dataset)
+    scaled.update(teachers=teachers, students=students, regular_classes=regulars)
+    return scaled
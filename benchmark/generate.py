@@ -0,0 +1,180 @@
+# benchmark/generate.py
+#
+# reader.py が読む CSV と同じ形式の合成キャンペーンを作る。
+#   python -m benchmark.generate out_dir --teachers 20 --students 120 --days 8
+
+import argparse
+import csv
+import datetime
+import os
+import random
+
+GRADES = {
+    "Elementary": range(1, 7),
+    "Middle": range(1, 4),
+    "High": range(1, 4),
+}
+SUBJECTS = {
+    "Elementary": [("ES_Japanese", "国語"), ("ES_Math", "算数"), ("ES_Science", "理科"),
+                   ("ES_Social", "社会"), ("ES_English", "英語")],
+    "Middle": [("MS_Japanese", "国語"), ("MS_Math", "数学"), ("MS_Science", "理科"),
+               ("MS_Social", "社会"), ("MS_English", "英語")],
+    "High": [("HS_Japanese", "国語"), ("HS_Math2B", "数学ⅡB"), ("HS_Math3C", "数学ⅢC"),
+             ("HS_English", "英語"), ("HS_Physics", "物理"), ("HS_Chemistry", "化学")],
+}
+DEFAULT_WEIGHTS = {
+    "maxTwoStudentsBonus": 10,
+    "sameGradeBonus": 5,
+    "regularClassContinuityBonus": 8,
+    "teacherGapPenalty": 2,
+    "studentGapPenalty": 2,
+    "singleStudentPenalty": 4,
+    "shortagePenalty": 30,
+    "teacherDesiredPenalty": 3,
+}
+
+
+def _write(path, header, rows):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+def generate_campaign(out_dir: str,
+                      n_teachers: int = 10,
+                      n_students: int = 60,
+                      n_days: int = 4,
+                      periods=range(2, 7),
+                      teacher_density: float = 0.6,
+                      student_density: float = 0.5,
+                      subjects_per_teacher: int = 4,
+                      subjects_per_student: int = 2,
+                      max_required: int = 3,
+                      regular_class_ratio: float = 0.3,
+                      start_date: str = "2025-08-01",
+                      campaign_id: str = "CAM1",
+                      seed: int = 0) -> str:
+    """
+    out_dir に subjects / teachers / students / student_requirements / timeslots /
+    teacher_availability / student_availability / regular_classes / constraint_weights / campaign
+    の10 CSV を書き出し、out_dir を返す。
+      *_density           : 各コマが空いている確率
+      regular_class_ratio : レギュラー授業を1コマ持つ教師の割合
+    """
+    rng = random.Random(seed)
+    os.makedirs(out_dir, exist_ok=True)
+
+    # subjects
+    all_subjects = []
+    for category, subj_list in SUBJECTS.items():
+        for subj_id, subj_name in subj_list:
+            all_subjects.append((subj_id, subj_name, category))
+    _write(os.path.join(out_dir, "subjects.csv"),
+           ["subject_id", "subject_name", "category"], all_subjects)
+    subject_names = {sid: name for sid, name, _ in all_subjects}
+
+    # timeslots / campaign
+    day0 = datetime.date.fromisoformat(start_date)
+    dates = [(day0 + datetime.timedelta(days=d)).isoformat() for d in range(n_days)]
+    timeslots = []
+    for date in dates:
+        for period in periods:
+            timeslots.append((f"TS{len(timeslots) + 1}", date, period, campaign_id, f"{period}限"))
+    _write(os.path.join(out_dir, "timeslots.csv"),
+           ["timeslot_id", "date", "period_index", "campaign_id", "period_label"], timeslots)
+    _write(os.path.join(out_dir, "campaign.csv"),
+           ["campaign_id", "name", "start_date", "end_date", "description"],
+           [(campaign_id, "合成キャンペーン", dates[0], dates[-1], f"{n_days}日間の合成データ")])
+
+    # teachers: カテゴリを1つ選び、その中から担当科目を選ぶ
+    teachers = []
+    teacher_subjects = {}
+    for i in range(1, n_teachers + 1):
+        category = rng.choice(list(SUBJECTS))
+        pool = [sid for sid, _ in SUBJECTS[category]]
+        subj_ids = rng.sample(pool, min(subjects_per_teacher, len(pool)))
+        t_id = f"T{i}"
+        teacher_subjects[t_id] = subj_ids
+        desired = rng.randint(len(timeslots) // 4, len(timeslots) // 2)
+        teachers.append((t_id, f"教師{i}", desired, rng.randint(1, 3), "|".join(subj_ids)))
+    _write(os.path.join(out_dir, "teachers.csv"),
+           ["teacher_id", "teacher_name", "desired_shift_count", "min_classes", "teachable_subjects"],
+           teachers)
+
+    # students / requirements
+    students = []
+    requirements = []
+    student_category = {}
+    for i in range(1, n_students + 1):
+        category = rng.choice(list(SUBJECTS))
+        s_id = f"S{i}"
+        student_category[s_id] = category
+        grade = f"{category}{rng.choice(list(GRADES[category]))}"
+        gap = rng.choice(["NoGapPreferred", "GapAllowed"])
+        students.append((s_id, f"生徒{i}", grade, gap))
+        pool = [sid for sid, _ in SUBJECTS[category]]
+        for subj_id in rng.sample(pool, min(subjects_per_student, len(pool))):
+            requirements.append((s_id, f"生徒{i}", subj_id, rng.randint(1, max_required)))
+    _write(os.path.join(out_dir, "students.csv"),
+           ["student_id", "student_name", "grade", "gap_preference"], students)
+    _write(os.path.join(out_dir, "student_requirements.csv"),
+           ["student_id", "student_name", "subject_id", "required_count"], requirements)
+
+    # availability
+    teacher_avail = []
+    for t_id, t_name, *_ in teachers:
+        for ts_id, date, _, _, label in timeslots:
+            if rng.random() < teacher_density:
+                teacher_avail.append((t_id, t_name, ts_id, date, label))
+    _write(os.path.join(out_dir, "teacher_availability.csv"),
+           ["teacher_id", "teacher_name", "timeslot_id", "date", "period_label"], teacher_avail)
+
+    student_avail = []
+    for s_id, s_name, *_ in students:
+        for ts_id, date, _, _, label in timeslots:
+            if rng.random() < student_density:
+                student_avail.append((s_id, s_name, ts_id, date, label))
+    _write(os.path.join(out_dir, "student_availability.csv"),
+           ["student_id", "student_name", "timeslot_id", "date", "period_label"], student_avail)
+
+    # regular classes: 同じカテゴリの生徒を1人選んで1コマ
+    regulars = []
+    for t_id, t_name, *_ in teachers:
+        if rng.random() >= regular_class_ratio:
+            continue
+        subj_id = rng.choice(teacher_subjects[t_id])
+        category = next(c for c, lst in SUBJECTS.items() if subj_id in dict(lst))
+        candidates = [s_id for s_id, c in student_category.items() if c == category]
+        if not candidates:
+            continue
+        ts_id = rng.choice(timeslots)[0]
+        regulars.append((f"RC{len(regulars) + 1}", t_id, t_name, subj_id, subject_names[subj_id],
+                         ts_id, rng.choice(candidates)))
+    _write(os.path.join(out_dir, "regular_classes.csv"),
+           ["regular_class_id", "teacher_id", "teacher_name", "subject_id", "subject_name",
+            "timeslot_id", "enrolled_student_ids"], regulars)
+
+    _write(os.path.join(out_dir, "constraint_weights.csv"), ["key", "value"],
+           list(DEFAULT_WEIGHTS.items()))
+    return out_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic campaign in the reader.py CSV format.")
+    parser.add_argument("out_dir")
+    parser.add_argument("--teachers", type=int, default=10)
+    parser.add_argument("--students", type=int, default=60)
+    parser.add_argument("--days", type=int, default=4)
+    parser.add_argument("--teacher-density", type=float, default=0.6)
+    parser.add_argument("--student-density", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    generate_campaign(args.out_dir, n_teachers=args.teachers, n_students=args.students,
+                      n_days=args.days, teacher_density=args.teacher_density,
+                      student_density=args.student_density, seed=args.seed)
+    print(f"Synthetic campaign written to {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# benchmark/generate_forms.py
+#
+# google_api_data.py が読むフォームの回答 (教師・生徒のシート) と同じ形式の合成データを作る。
+#   python -m benchmark.generate_forms out_dir --responses 2000 --days 30
+# out_dir/teacher.csv, out_dir/student.csv を書くので、そのまま
+#   python google_api_data.py --stub-dir out_dir
+# で読み込める。
+
+import argparse
+import csv
+import datetime
+import os
+import random
+
+from google_api_data import TEACHABLE_SUBJECTS, REQUIREMENT_SUBJECTS, REGULAR_CLASS_SUBJECTS
+
+WEEKDAYS = "月火水木金土日"
+CATEGORIES = {"小学生": "elementary", "中学生": "middle", "高校生": "high"}
+REGULAR_CLASSES_PER_TEACHER = 6
+
+
+def _write(path, rows):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        csv.writer(f).writerows(rows)
+
+
+def _periods(rng, density):
+    return ", ".join(f"{p}限" for p in range(2, 7) if rng.random() < density)
+
+
+def generate_forms(out_dir: str,
+                   n_responses: int = 2000,
+                   teacher_ratio: float = 0.2,
+                   n_days: int = 30,
+                   teacher_density: float = 0.6,
+                   student_density: float = 0.5,
+                   regular_class_ratio: float = 0.5,
+                   start_date: str = "2025-08-01",
+                   seed: int = 0) -> str:
+    """
+    n_responses 件の回答 (うち teacher_ratio が教師) を out_dir に書き出し、out_dir を返す。
+      *_density           : 各コマに "N限" が入る確率
+      regular_class_ratio : 担当生徒名i〜授業時間i (i = 1..6) の各組が埋まる確率
+    """
+    rng = random.Random(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    day0 = datetime.date.fromisoformat(start_date)
+    days = [day0 + datetime.timedelta(days=d) for d in range(n_days)]
+    n_teachers = max(1, int(n_responses * teacher_ratio))
+    n_students = max(1, n_responses - n_teachers)
+    student_names = [f"生徒{i}" for i in range(1, n_students + 1)]
+
+    # 生徒フォーム
+    requirement_headers = list(REQUIREMENT_SUBJECTS)
+    student_headers = (["タイムスタンプ", "名前", "所属を選んでください",
+                        "学年(elementary)", "学年(middle)", "学年(high)", "空きコマに関する質問"]
+                       + requirement_headers
+                       + [f"希望授業枠 [{d.month}/{d.day}]" for d in days])
+    student_rows = [student_headers]
+    for i, name in enumerate(student_names):
+        category = rng.choice(list(CATEGORIES))
+        grades = {key: "" for key in CATEGORIES.values()}
+        grades[CATEGORIES[category]] = f"{rng.randint(1, 6 if category == '小学生' else 3)}年"
+        prefix = category + "："
+        requirements = [rng.choice(["", "0コマ", "1コマ", "2コマ", "3コマ"]) if h.startswith(prefix) else ""
+                        for h in requirement_headers]
+        student_rows.append([f"2025/07/01 {i % 24}:{i % 60:02d}:00", name, category,
+                             grades["elementary"], grades["middle"], grades["high"],
+                             rng.choice(["空きコマは避けたい", "気にしない"])]
+                            + requirements
+                            + [_periods(rng, student_density) for _ in days])
+
+    # 教師フォーム
+    teacher_headers = (["タイムスタンプ", "名前", "指導可能科目", "最低限出勤コマ数"]
+                       + [f"シフト希望 [{d.month}/{d.day}（{WEEKDAYS[d.weekday()]}）]" for d in days])
+    for k in range(1, REGULAR_CLASSES_PER_TEACHER + 1):
+        teacher_headers += [f"担当生徒名{k}", f"授業{k}", f"授業日{k}", f"授業時間{k}"]
+    teacher_rows = [teacher_headers]
+    subjects = list(TEACHABLE_SUBJECTS)
+    regular_subjects = list(REGULAR_CLASS_SUBJECTS)
+    for i in range(1, n_teachers + 1):
+        row = [f"2025/07/01 {i % 24}:{i % 60:02d}:00", f"教師{i}",
+               ", ".join(rng.sample(subjects, rng.randint(1, 6))), str(rng.randint(0, 3))]
+        row += [_periods(rng, teacher_density) for _ in days]
+        for _ in range(REGULAR_CLASSES_PER_TEACHER):
+            if rng.random() < regular_class_ratio:
+                row += [rng.choice(student_names), rng.choice(regular_subjects),
+                        WEEKDAYS[rng.randrange(7)] + "曜日", f"{rng.randint(2, 6)}限"]
+            else:
+                row += ["", "", "", ""]
+        teacher_rows.append(row)
+
+    _write(os.path.join(out_dir, "teacher.csv"), teacher_rows)
+    _write(os.path.join(out_dir, "student.csv"), student_rows)
+    return out_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic Google Form responses.")
+    parser.add_argument("out_dir")
+    parser.add_argument("--responses", type=int, default=2000)
+    parser.add_argument("--teacher-ratio", type=float, default=0.2)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    generate_forms(args.out_dir, n_responses=args.responses, teacher_ratio=args.teacher_ratio,
+                   n_days=args.days, seed=args.seed)
+    print(f"Synthetic form responses written to {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
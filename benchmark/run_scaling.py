@@ -0,0 +1,126 @@
+# benchmark/run_scaling.py
+#
+# 合成キャンペーンをサイズ別に作り、load → model build → solve → export を計測する。
+#   python -m benchmark.run_scaling --sizes 5:30:2,10:60:4,20:120:8 --time-limit 30
+# sizes は 教師数:生徒数:日数。結果は --out (JSON) と同名の .csv に追記する。
+# 各ケースは別プロセスで走らせるので、ピークメモリ (ru_maxrss) はケースごとの値になる。
+
+import argparse
+import csv
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from reader import load_inputs_dir
+from benchmark.generate import generate_campaign
+
+RESULT_FIELDS = [
+    "timestamp", "teachers", "students", "days", "seed", "encoding",
+    "load_time", "build_time", "solve_time", "export_time", "total_time",
+    "peak_rss_mb", "num_variables", "num_constraints",
+    "status", "stop_reason", "objective", "best_bound",
+]
+
+
+def _peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux は KB、macOS は bytes
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def run_case(n_teachers: int, n_students: int, n_days: int, seed: int,
+             solver_params: dict, encoding: str = "reified") -> dict:
+    # main / solver はワーカープロセス内で import する (親のメモリを測らないため)
+    import main as main_module
+    from solver_cp_sat import solve_shifts
+
+    result = {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "teachers": n_teachers, "students": n_students, "days": n_days, "seed": seed,
+              "encoding": encoding}
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = generate_campaign(os.path.join(tmp, "data"), n_teachers=n_teachers,
+                                     n_students=n_students, n_days=n_days, seed=seed)
+        total_start = time.perf_counter()
+
+        t0 = time.perf_counter()
+        dataset = load_inputs_dir(data_dir)
+        result["load_time"] = time.perf_counter() - t0
+
+        stats = {}
+        shifts, shortage = solve_shifts(campaign_id="CAM1", solver_params=solver_params,
+                                        solve_stats=stats, encoding=encoding, **dataset)
+        result["build_time"] = stats.get("build_time")
+        result["solve_time"] = stats.get("wall_time")
+
+        t0 = time.perf_counter()
+        out_dir = os.path.join(tmp, "output")
+        main_module.export_shifts_by_teacher(shifts, os.path.join(out_dir, "teacher_schedules.csv"))
+        main_module.export_shifts_by_student(shifts, os.path.join(out_dir, "student_schedules.csv"))
+        main_module.export_shortage_csv(shortage, dataset["students"], dataset["subjects"],
+                                        os.path.join(out_dir, "shortage.csv"))
+        result["export_time"] = time.perf_counter() - t0
+        result["total_time"] = time.perf_counter() - total_start
+
+    result["peak_rss_mb"] = _peak_rss_mb()
+    for key in ("num_variables", "num_constraints", "status", "stop_reason", "objective", "best_bound"):
+        result[key] = stats.get(key)
+    return result
+
+
+def append_results(results, json_path: str):
+    """json_path (配列) と同名の .csv の両方に追記する。"""
+    existing = []
+    if os.path.exists(json_path):
+        with open(json_path, "r", encoding="utf-8") as f:
+            existing = json.load(f)
+    dir_path = os.path.dirname(json_path)
+    if dir_path:
+        os.makedirs(dir_path, exist_ok=True)
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(existing + results, f, ensure_ascii=False, indent=2)
+
+    csv_path = os.path.splitext(json_path)[0] + ".csv"
+    write_header = not os.path.exists(csv_path)
+    with open(csv_path, "a", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+        if write_header:
+            writer.writeheader()
+        writer.writerows(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scaling benchmark for solve_shifts on synthetic campaigns.")
+    parser.add_argument("--sizes", default="5:30:2,10:60:4,20:120:8",
+                        help="教師数:生徒数:日数 をカンマ区切りで")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--time-limit", type=float, default=30.0)
+    parser.add_argument("--workers", type=int, default=0)
+    parser.add_argument("--encoding", default="reified", choices=["reified", "linear"])
+    parser.add_argument("--out", default="output/benchmark/results.json")
+    args = parser.parse_args()
+
+    solver_params = {"max_time_in_seconds": args.time_limit,
+                     "num_search_workers": args.workers,
+                     "random_seed": args.seed}
+    results = []
+    for size in args.sizes.split(","):
+        n_teachers, n_students, n_days = (int(v) for v in size.split(":"))
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            r = pool.submit(run_case, n_teachers, n_students, n_days, args.seed, solver_params,
+                            args.encoding).result()
+        results.append(r)
+        print(f"{size:>12}  load {r['load_time']:.2f}s  build {r['build_time']:.2f}s  "
+              f"solve {r['solve_time']:.2f}s  export {r['export_time']:.2f}s  "
+              f"rss {r['peak_rss_mb']:.0f}MB  vars {r['num_variables']}  cons {r['num_constraints']}  "
+              f"{r['stop_reason']}  obj {r['objective']}")
+
+    append_results(results, args.out)
+    print(f"Results appended to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
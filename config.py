@@ -18,3 +18,100 @@ STUDENT_AVAILABILITY_CSV = os.path.join(DATA_DIR, "student_availability.csv")
 REGULAR_CLASSES_CSV = os.path.join(DATA_DIR, "regular_classes.csv")
 CONSTRAINT_WEIGHTS_CSV = os.path.join(DATA_DIR, "constraint_weights.csv")
 CAMPAIGN_CSV = os.path.join(DATA_DIR, "campaign.csv")
+SOLVER_PARAMS_CSV = os.path.join(DATA_DIR, "solver_params.csv")
+
+# CP-SAT の探索パラメータ (solver_params.csv の値で上書きされる)
+#   max_time_in_seconds : 探索の打ち切り時間 (秒, 0 なら無制限)
+#   num_search_workers  : 並列ワーカー数 (0 なら全コア)
+#   relative_gap_limit / absolute_gap_limit : 目的値と上界の差がこれ以下なら終了
+#   random_seed         : 乱数シード
+#   log_search_progress : CP-SAT の探索ログを出すか
+#   hint_completion_time: warm start のヒントを補助変数まで埋める前解きの上限 (秒, 0 なら埋めない)。
+#                         max_time_in_seconds の 1 割までに抑え、かかった時間は max_time_in_seconds から引く
+SOLVER_PARAMS = {
+    "max_time_in_seconds": 0,
+    "num_search_workers": 0,
+    "relative_gap_limit": 0.0,
+    "absolute_gap_limit": 0.0,
+    "random_seed": 0,
+    "log_search_progress": False,
+    "hint_completion_time": 10.0,
+}
+
+# 前回の出力 (teacher_schedules.csv) を解のヒントとして使う (warm start)
+# 前回の割当から外れた分を罰したい場合は constraint_weights.csv に scheduleChangePenalty を設定する
+WARM_START = True
+PREVIOUS_SCHEDULE_CSV = os.path.join(OUTPUT_DIR, "teacher_schedules.csv")
+
+# 差分モード: 前回実行時の入力と比べ、変更のあった教師・生徒の周辺だけを解き直す
+# (それ以外は前回の teacher_schedules.csv の割当に固定)
+INCREMENTAL = False
+LAST_RUN_INPUTS_JSON = os.path.join(OUTPUT_DIR, "last_run_inputs.json")
+
+# 分割モード: "date" or "week" を指定すると、timeslot をブロックに分けて並列に解く
+# (None なら1つのモデルで解く)。DECOMPOSE_WORKERS はプロセス数 (None なら CPU 数)
+DECOMPOSE_BY = None
+DECOMPOSE_WORKERS = None
+
+# 前処理: min_classes に届かない教師の x を作らない / 入れ替え可能な教師の対称性を除く
+PRESOLVE_PRUNING = True
+
+# 指標変数の表し方: "reified" (==/!= の OnlyEnforceIf ペア) or "linear" (線形式・AddMaxEquality)
+ENCODING = "reified"
+
+# 解法: "cp_sat" (solve_shifts) / "greedy" (heuristic.solve_shifts_greedy。最適ではないがすぐ終わる)
+#       / "lns" (lns.solve_shifts_lns。近傍だけを CP-SAT で解き直し続ける。大きなキャンペーン向け)
+# GREEDY_HINTS なら CP-SAT の前に greedy で解を作り、前回スケジュールの代わりにヒントとして渡す
+# GREEDY_TIME_LIMIT は greedy の局所探索の打ち切り時間 (秒)
+SOLVER_ENGINE = "cp_sat"
+GREEDY_HINTS = False
+GREEDY_TIME_LIMIT = 0.5
+
+# LNS: 全体の打ち切り時間 / 近傍1つの打ち切り時間 (秒) / 使う近傍の種類 / プロセス数
+LNS_TIME_LIMIT = 60.0
+LNS_SUB_TIME_LIMIT = 5.0
+LNS_NEIGHBORHOODS = ("date", "teacher", "grade", "subject")
+LNS_WORKERS = 1
+
+# x 候補の列挙: "bitmask" (Python のビット演算) or "numpy" (bool 行列の AND と np.nonzero)
+CANDIDATE_BACKEND = "bitmask"
+
+# 実行ごとの計測レポート (フェーズ別の時間・変数数・ソルバー結果) の出力先
+RUN_REPORT_JSON = os.path.join(OUTPUT_DIR, "run_report.json")
+
+# 探索中に改善解が見つかるたびに OUTPUT_DIR の CSV を書き換える
+# STREAM_MIN_INTERVAL 秒に1回までに間引く
+STREAM_SOLUTIONS = True
+STREAM_MIN_INTERVAL = 5.0
+
+# 読み込んだ入力一式を pickle でキャッシュし、CSV が変わっていなければ再パースしない
+# (鍵はファイルの size と mtime。INPUT_CACHE_VERIFY_HASH なら中身の sha1 も見る)
+INPUT_CACHE = True
+INPUT_CACHE_PATH = os.path.join(OUTPUT_DIR, ".cache", "inputs.pickle")
+INPUT_CACHE_VERIFY_HASH = False
+
+# google_api_data.py (フォームの回答 → DATA_DIR の CSV)
+# サービスアカウントの JSON は環境変数か google_api_data.py --service-account で渡す
+GOOGLE_SERVICE_ACCOUNT_FILE = os.environ.get("GOOGLE_SERVICE_ACCOUNT_FILE")
+TEACHER_FORM_SHEET = "https://docs.google.com/spreadsheets/d/1xKQcSv2R3KhkD3oSbymHrW8YR21CvlphIyFoUu4Ji94/edit"
+STUDENT_FORM_SHEET = "https://docs.google.com/spreadsheets/d/1gSj43cZJRVierQkN8sQU1hVCMSLsMEspc4rRf1jpjYQ/edit"
+# 段ごとの結果とハッシュの置き場 (入力が変わっていない段は作り直さない)
+FORM_PIPELINE_CACHE_DIR = os.path.join(OUTPUT_DIR, ".cache", "forms")
+# INPUT_SOURCE = "forms" のときの置き場。google_api_data.py (DATA_DIR の CSV を書く) とは分けて、
+# 一方の実行で段の結果だけが進み、もう一方の CSV と食い違うことがないようにする
+FORM_INPUT_CACHE_DIR = os.path.join(OUTPUT_DIR, ".cache", "form_inputs")
+# 名前 (タイムスロットは日付と時限) → teacher_id / student_id / timeslot_id の台帳。
+# キャッシュと違って消すと ID が振り直しになるので、生成した CSV と同じ DATA_DIR に置く
+FORM_ID_REGISTRY_FILE = os.path.join(DATA_DIR, "id_registry.json")
+
+# 入力の読み方: "csv" (DATA_DIR の CSV を reader.py で読む)
+#             / "forms" (フォームの回答から直接 Teacher / Student / TimeSlot などを作る。CSV を読み直さない)
+# "forms" のとき FORM_EXPORT_CSV なら生成した CSV を監査用に FORM_AUDIT_DIR に書く
+# (ソルバーの入力である DATA_DIR の CSV は書き換えない。ID は FORM_ID_REGISTRY_FILE を共有する)。
+# FORM_STUB_DIR を指定するとシートの代わりに <dir>/teacher.csv, <dir>/student.csv を読む
+INPUT_SOURCE = "csv"
+FORM_EXPORT_CSV = False
+FORM_AUDIT_DIR = os.path.join(OUTPUT_DIR, "form_audit")
+FORM_STUB_DIR = None
+# フォームの取り込みを差分にする (前回からの新しい行・タイムスタンプが変わった行だけを取りに行く)
+FORM_INCREMENTAL_SYNC = False
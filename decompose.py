@@ -0,0 +1,265 @@
+# decompose.py
+
+import copy
+import logging
+import datetime
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Any, Tuple
+from ortools.sat.python import cp_model
+from models import Teacher, Student, TimeSlot, Campaign, RegularClass, Shift, Subject
+from solver_cp_sat import solve_shifts, split_workers
+
+logger = logging.getLogger(__name__)
+
+
+def block_key(ts: TimeSlot, block_by: str):
+    """timeslot をどのブロックに入れるか。block_by は "date" か "week" (ISO週)。"""
+    if block_by == "week":
+        try:
+            year, week, _ = datetime.date.fromisoformat(ts.date).isocalendar()
+            return f"{year}-W{week:02d}"
+        except ValueError:
+            return ts.date
+    return ts.date
+
+
+def allocate_quotas(teachers: Dict[str, Teacher],
+                    students: Dict[str, Student],
+                    blocks: Dict[Any, List[TimeSlot]]):
+    """
+    マスター問題: 生徒×科目の必要コマ数を各ブロックに割り振る。
+      q[s, subj, b] <= その生徒が b で受けられるコマ数 (同じ科目を教えられる教師が空いているコマ)
+      sum_subj q[s, *, b] <= 生徒の b での空きコマ数
+      sum_s q[*, subj, b] <= 2 * (subj を教えられる教師の b での空きコマ数)
+      sum_b q[s, subj, *] <= 必要コマ数
+    を満たしつつ sum q を最大化する。
+    教師の desired_shift_count と min_classes は各ブロックの空きコマ数に比例して配分する
+    (どちらもキャンペーン全体の値なので、split_proportionally でブロックごとの取り分の合計をちょうど元の値にする)。
+
+    戻り値: (student_quota[b][s_id][subj_id], teacher_desired[b][t_id], teacher_min[b][t_id])
+    """
+    model = cp_model.CpModel()
+
+    block_mask = {}
+    for b, ts_list in blocks.items():
+        mask = 0
+        for ts in ts_list:
+            mask |= 1 << ts.index
+        block_mask[b] = mask
+
+    # 科目ごとに、その科目を教えられる教師の空きコマ (ブロックごと)
+    subj_teacher_mask = defaultdict(int)
+    subj_teacher_slots = defaultdict(int)
+    for t_id, t_obj in teachers.items():
+        for sbj_obj in t_obj.teachable_subjects:
+            for b, mask in block_mask.items():
+                t_mask = t_obj.availability_mask & mask
+                subj_teacher_mask[(sbj_obj.subject_id, b)] |= t_mask
+                subj_teacher_slots[(sbj_obj.subject_id, b)] += bin(t_mask).count("1")
+
+    q = {}
+    q_by_subject_block = defaultdict(list)
+    for s_id, s_obj in students.items():
+        reqs = {sbj: n for sbj, n in s_obj.requirements.items() if n > 0}
+        q_by_subject = defaultdict(list)
+        for b, mask in block_mask.items():
+            s_mask = s_obj.availability_mask & mask
+            if not s_mask:
+                continue
+            q_in_block = []
+            for sbj_id, req_num in reqs.items():
+                cap = bin(s_mask & subj_teacher_mask[(sbj_id, b)]).count("1")
+                if cap == 0:
+                    continue
+                var = model.NewIntVar(0, min(cap, req_num), f"q_{s_id}_{sbj_id}_{b}")
+                q[(s_id, sbj_id, b)] = var
+                q_in_block.append(var)
+                q_by_subject[sbj_id].append(var)
+                q_by_subject_block[(sbj_id, b)].append(var)
+            if q_in_block:
+                model.Add(sum(q_in_block) <= bin(s_mask).count("1"))
+        for sbj_id, vars_ in q_by_subject.items():
+            model.Add(sum(vars_) <= reqs[sbj_id])
+
+    for (sbj_id, b), vars_ in q_by_subject_block.items():
+        model.Add(sum(vars_) <= 2 * subj_teacher_slots[(sbj_id, b)])
+
+    model.Maximize(sum(q.values()))
+    solver = cp_model.CpSolver()
+    solver.parameters.max_time_in_seconds = 10.0
+    status = solver.Solve(model)
+
+    student_quota = {b: defaultdict(dict) for b in blocks}
+    if status in [cp_model.OPTIMAL, cp_model.FEASIBLE]:
+        for (s_id, sbj_id, b), var in q.items():
+            val = solver.Value(var)
+            if val > 0:
+                student_quota[b][s_id][sbj_id] = val
+    else:
+        logger.warning("Master problem found no allocation. All requirements become shortage.")
+
+    teacher_desired = {b: {} for b in blocks}
+    teacher_min = {b: {} for b in blocks}
+    for t_id, t_obj in teachers.items():
+        counts = {b: bin(t_obj.availability_mask & mask).count("1") for b, mask in block_mask.items()}
+        total = sum(counts.values())
+        for b, n in split_proportionally(t_obj.desired_shift_count, counts).items():
+            teacher_desired[b][t_id] = n
+        for b, n in split_proportionally(t_obj.min_classes, counts).items():
+            teacher_min[b][t_id] = n
+
+    return student_quota, teacher_desired, teacher_min
+
+
+def split_proportionally(amount: int, weights: Dict[Any, int]) -> Dict[Any, int]:
+    """amount を weights に比例して整数で分ける (最大剰余法。合計はちょうど amount、重み 0 には 0)。"""
+    total = sum(weights.values())
+    if amount <= 0 or total == 0:
+        return {k: 0 for k in weights}
+    exact = {k: amount * w / total for k, w in weights.items()}
+    shares = {k: int(v) for k, v in exact.items()}
+    rest = amount - sum(shares.values())
+    for k in sorted(weights, key=lambda k: shares[k] - exact[k])[:rest]:
+        shares[k] += 1
+    return shares
+
+
+def _solve_block(args):
+    """ProcessPoolExecutor から呼ぶ1ブロック分のソルブ。"""
+    (b, teachers, students, timeslots, campaigns, regular_classes,
+     subjects, campaign_id, constraint_weights, solver_params, options) = args
+    shifts, shortage = solve_shifts(**options,
+        teachers=teachers,
+        students=students,
+        timeslots=timeslots,
+        campaigns=campaigns,
+        regular_classes=regular_classes,
+        subjects=subjects,
+        campaign_id=campaign_id,
+        constraint_weights=constraint_weights,
+        solver_params=solver_params
+    )
+    return b, shifts, shortage
+
+
+def solve_shifts_decomposed(teachers: Dict[str, Teacher],
+                            students: Dict[str, Student],
+                            timeslots: Dict[str, TimeSlot],
+                            campaigns: Dict[str, Campaign],
+                            regular_classes: Dict[str, RegularClass],
+                            subjects: Dict[str, Subject],
+                            campaign_id: str,
+                            constraint_weights: Dict[str, float],
+                            solver_params: Dict[str, Any] = None,
+                            block_by: str = "date",
+                            max_workers: int = None,
+                            prune: bool = True,
+                            encoding: str = "reified",
+                            candidate_backend: str = "bitmask") -> Tuple[List[Shift], Dict]:
+    """
+    solve_shifts の分割版。戻り値の形は solve_shifts と同じ (shifts, shortage)。
+      1) target timeslot を日付 (or 週) ごとのブロックに分ける
+      2) allocate_quotas で生徒の必要コマ数と教師の desired_shift_count を各ブロックに配分
+      3) 各ブロックを solve_shifts でプロセス並列に解く
+       (min_classes もブロックごとの取り分に分け、CP-SAT のワーカー数はプロセス数で割る)
+      4) シフトと不足コマをマージ
+      5) 修復: ブロックを休んだせいで合計が min_classes に届かなかった教師を外し、
+         その教師が授業を持っていたブロックだけを解き直す (外れた授業の生徒を他の教師に回すため)。
+         解き直しで別の教師が min_classes を割れば、その教師も外して繰り返す
+    日をまたぐ結合は 2) の配分だけなので、1つの巨大なモデルより大幅に軽い。
+    prune / encoding / candidate_backend は各ブロックの solve_shifts にそのまま渡す。
+    """
+    target_timeslots = [ts for ts in timeslots.values() if ts.campaign_id == campaign_id]
+    if not target_timeslots:
+        logger.warning(f"No timeslots for campaign_id={campaign_id}")
+        return [], {}
+
+    blocks = defaultdict(list)
+    for ts in target_timeslots:
+        blocks[block_key(ts, block_by)].append(ts)
+    logger.info(f"Decomposed campaign {campaign_id} into {len(blocks)} blocks by {block_by}.")
+
+    student_quota, teacher_desired, teacher_min = allocate_quotas(teachers, students, blocks)
+    n_processes = min(max_workers or os.cpu_count() or 1, len(blocks))
+    block_params = split_workers(solver_params, n_processes)
+
+    options = {"prune": prune, "encoding": encoding, "candidate_backend": candidate_backend}
+
+    # ブロック b の _solve_block の引数。requirements / desired_shift_count / min_classes を差し替えたコピーを作る
+    # (excluded の教師は空きコマを消して出勤させない)
+    def block_task(b, excluded):
+        block_timeslots = {ts.timeslot_id: ts for ts in blocks[b]}
+        block_students = {}
+        for s_id, s_obj in students.items():
+            s_copy = copy.copy(s_obj)
+            s_copy.requirements = dict(student_quota[b].get(s_id, {}))
+            block_students[s_id] = s_copy
+        block_teachers = {}
+        for t_id, t_obj in teachers.items():
+            t_copy = copy.copy(t_obj)
+            t_copy.desired_shift_count = teacher_desired[b][t_id]
+            t_copy.min_classes = teacher_min[b][t_id]
+            if t_id in excluded:
+                t_copy.available_timeslots = []
+                t_copy.availability_mask = 0
+            block_teachers[t_id] = t_copy
+        block_regulars = {rc_id: rc for rc_id, rc in regular_classes.items()
+                          if rc.timeslot_id in block_timeslots}
+        return (b, block_teachers, block_students, block_timeslots, campaigns,
+                block_regulars, subjects, campaign_id, constraint_weights, block_params, options)
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=n_processes) as pool:
+        for b, shifts, shortage in pool.map(_solve_block, [block_task(b, set()) for b in blocks]):
+            results[b] = (shifts, shortage)
+            logger.info(f"Block {b}: {len(shifts)} shifts.")
+
+        # 修復: ブロックごとの取り分は「出勤するなら」の下限なので、いくつかのブロックを休むと
+        # キャンペーン全体で min_classes を割ることがある。その教師は一括で解いた場合と同じく出勤させず、
+        # 授業のあったブロックを解き直して生徒を他の教師に回す
+        excluded = set()
+        while True:
+            load = defaultdict(int)
+            for shifts, _ in results.values():
+                for sh in shifts:
+                    load[sh.teacher.teacher_id] += len(sh.assigned_students)
+            under_min = {t_id for t_id, n in load.items() if 0 < n < teachers[t_id].min_classes}
+            if not under_min:
+                break
+            excluded |= under_min
+            resolve = sorted(b for b, (shifts, _) in results.items()
+                             if any(sh.teacher.teacher_id in under_min for sh in shifts))
+            logger.warning(f"Repair: {len(under_min)} teachers fall below min_classes over the whole campaign "
+                           f"{sorted(under_min)}; re-solving blocks {resolve} without them")
+            for b, shifts, shortage in pool.map(_solve_block, [block_task(b, excluded) for b in resolve]):
+                results[b] = (shifts, shortage)
+
+    # マージ: shift_id を振り直し、オブジェクトは元の teachers / students に戻す
+    merged_shifts = []
+    for b in sorted(results):
+        for sh in results[b][0]:
+            merged_shifts.append(Shift(
+                shift_id=f"Shift_{len(merged_shifts) + 1}",
+                timeslot=timeslots[sh.timeslot.timeslot_id],
+                teacher=teachers[sh.teacher.teacher_id],
+                subject=subjects[sh.subject.subject_id],
+                assigned_students=[students[st.student_id] for st in sh.assigned_students]
+            ))
+
+    # 不足コマ = 必要コマ - 実際に割り当てたコマ
+    assigned = defaultdict(int)
+    for sh in merged_shifts:
+        for st in sh.assigned_students:
+            assigned[(st.student_id, sh.subject.subject_id)] += 1
+    shortage_result = {}
+    for s_id, s_obj in students.items():
+        for sbj_id, req_num in s_obj.requirements.items():
+            if req_num > 0:
+                shortage_result[(s_id, sbj_id)] = max(0, req_num - assigned[(s_id, sbj_id)])
+    if excluded:
+        logger.warning(f"Repair: excluded {len(excluded)} teachers; total shortage after repair "
+                       f"is {sum(shortage_result.values())}")
+
+    return merged_shifts, shortage_result
@@ -1,137 +1,345 @@
-import gspread
-from google.oauth2.service_account import Credentials
+# google_api_data.py
+#
+# Google フォームの回答 (教師・生徒のスプレッドシート) から DATA_DIR の CSV を作る。
+#   python google_api_data.py                          # シートを取り込み、変わった CSV だけ書き直す
+#   python google_api_data.py --stub-dir forms/        # forms/teacher.csv, forms/student.csv から (オフライン)
+#   python google_api_data.py --offline                # 前回取り込んだ回答をそのまま使う
+#   python google_api_data.py --force                  # キャッシュを無視して全部作り直す
+#   python google_api_data.py --incremental            # 新しい回答・編集された回答の行だけを取り込む
+# 処理は fetch → normalize → generate (timeslots / teachers / ... ) → write の段に分かれている。
+# 各段の結果は cache_dir にハッシュ付きで残し、入力のハッシュが前回と同じ段は作り直さない
+# (生徒のフォームだけ変わったなら、教師側の CSV には触らない)。回答の追加・編集だけなら、
+# teachers / students / requirements / availability の CSV は変わった人の行だけを作り直す。
+# teacher_id / student_id / timeslot_id は ID 台帳 (id_registry.py) から引くので、回答や日付が増えても
+# 既存の ID は変わらない。
+# サービスアカウントの JSON は --service-account か環境変数 GOOGLE_SERVICE_ACCOUNT_FILE で渡す。
+# import しても何もしない。main.py の INPUT_SOURCE = "forms" では load_form_inputs が
+# CSV を経由せずに Teacher / Student / TimeSlot などを作ってソルバーに渡す
+# (CSV は FORM_EXPORT_CSV なら監査用に FORM_AUDIT_DIR に書くだけ)。
 
-# ① ダウンロードしたJSONのファイルパス
-SERVICE_ACCOUNT_FILE = "/Users/cdl/Desktop/triple-water-451506-t4-df3fab7dcfb4.json"
+import argparse
+import csv
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from typing import Dict, List, Any, Optional
 
-# ② スコープの設定（読み書き両方の権限を付与）
-SCOPES = [
-    'https://www.googleapis.com/auth/spreadsheets',
-    'https://www.googleapis.com/auth/drive'
-]
+from config import (
+    LOG_LEVEL,
+    DATA_DIR,
+    SUBJECTS_CSV,
+    CAMPAIGN_CSV,
+    CONSTRAINT_WEIGHTS_CSV,
+    SOLVER_PARAMS_CSV,
+    SOLVER_PARAMS,
+    GOOGLE_SERVICE_ACCOUNT_FILE,
+    TEACHER_FORM_SHEET,
+    STUDENT_FORM_SHEET,
+    FORM_PIPELINE_CACHE_DIR,
+    FORM_INPUT_CACHE_DIR,
+    FORM_EXPORT_CSV,
+    FORM_AUDIT_DIR,
+    FORM_STUB_DIR,
+    FORM_INCREMENTAL_SYNC,
+    FORM_ID_REGISTRY_FILE
+)
+from models import Teacher, Student, TimeSlot, Campaign, RegularClass, Subject
+from reader import load_subjects, load_campaigns, load_constraint_weights, load_solver_params
+from profiling import RunProfiler, NullProfiler
+from sheets_ingest import SheetSource, StubClient, authorize, fetch_sheets, sync_sheets
+from id_registry import IdRegistry, timeslot_key
+
+logger = logging.getLogger(__name__)
+
+# フォームの日付 ("8/1（金）") に付ける年
+FORM_YEAR = 2025
+
+# キャッシュ形式や生成ロジックを変えたら上げる (古いキャッシュは使わずに作り直す)
+PIPELINE_VERSION = 4
+
+# 指導可能科目 (教師フォーム) → subject_id
+TEACHABLE_SUBJECTS = {
+    "国語（小学生）": "ES_Japanese",
+    "算数（小学生）": "ES_Math",
+    "理科（小学生）": "ES_Science",
+    "社会（小学生）": "ES_Social",
+    "英語（小学生）": "ES_English",
+
+    "国語（中学生）": "MS_Japanese",
+    "数学（中学生）": "MS_Math",
+    "理科（中学生）": "MS_Science",
+    "社会（中学生）": "MS_Social",
+    "英語（中学生）": "MS_English",
+
+    "国語（高校生）": "HS_Japanese",
+    "数学ⅠA（高校生）": "HS_Math2B",  # 注: ⅠAからⅡBまでを含む
+    "数学ⅡB（高校生）": "HS_Math2B",
+    "数学ⅢC（高校生）": "HS_Math3C",
+    "英語（高校生）": "HS_English",
+    "物理基礎（高校生）": "HS_PhysicsBasic",
+    "物理（高校生）": "HS_Physics",
+    "化学基礎（高校生）": "HS_ChemistryBasic",
+    "化学（高校生）": "HS_Chemistry",
+    "生物基礎（高校生）": "HS_BiologyBasic",
+    "生物（高校生）": "HS_Biology",
+    "地学基礎（高校生）": "HS_GeologyBasic",
+    "地学（高校生）": "HS_Geology",
+    "世界史（高校生）": "HS_WorldHistory",
+    "日本史（高校生）": "HS_JapaneseHistory",
+    "地理（高校生）": "HS_Geography",
+    "倫理（高校生）": "HS_Ethics",
+    "政経（高校生）": "HS_PoliticsEconomy"
+}
+
+# 受講希望科目 (生徒フォームの列名) → subject_id
+REQUIREMENT_SUBJECTS = {
+    '小学生：受講希望科目 （表を右にスクロールできます） [英語]': 'ES_English',
+    '小学生：受講希望科目 （表を右にスクロールできます） [算数]': 'ES_Math',
+    '小学生：受講希望科目 （表を右にスクロールできます） [国語]': 'ES_Japanese',
+    '小学生：受講希望科目 （表を右にスクロールできます） [理科]': 'ES_Science',
+    '小学生：受講希望科目 （表を右にスクロールできます） [社会]': 'ES_Social',
+
+    '中学生：受講希望科目 （表を右にスクロールできます） [英語]': 'MS_English',
+    '中学生：受講希望科目 （表を右にスクロールできます） [数学]': 'MS_Math',
+    '中学生：受講希望科目 （表を右にスクロールできます） [国語]': 'MS_Japanese',
+    '中学生：受講希望科目 （表を右にスクロールできます） [理科]': 'MS_Science',
+    '中学生：受講希望科目 （表を右にスクロールできます） [社会]': 'MS_Social',
+
+    '高校生：受講希望科目 （表を右にスクロールできます） [英語]': 'HS_English',
+    '高校生：受講希望科目 （表を右にスクロールできます） [数学ⅠA]': 'HS_Math2B',
+    '高校生：受講希望科目 （表を右にスクロールできます） [数学ⅡB]': 'HS_Math2B',
+    '高校生：受講希望科目 （表を右にスクロールできます） [数学ⅢC]': 'HS_Math3C',
+    '高校生：受講希望科目 （表を右にスクロールできます） [国語]': 'HS_Japanese',
+    '高校生：受講希望科目 （表を右にスクロールできます） [化学基礎]': 'HS_ChemistryBasic',
+    '高校生：受講希望科目 （表を右にスクロールできます） [化学]': 'HS_Chemistry',
+    '高校生：受講希望科目 （表を右にスクロールできます） [物理基礎]': 'HS_PhysicsBasic',
+    '高校生：受講希望科目 （表を右にスクロールできます） [物理]': 'HS_Physics',
+    '高校生：受講希望科目 （表を右にスクロールできます） [生物基礎]': 'HS_BiologyBasic',
+    '高校生：受講希望科目 （表を右にスクロールできます） [生物]': 'HS_Biology',
+    '高校生：受講希望科目 （表を右にスクロールできます） [地学基礎]': 'HS_GeologyBasic',
+    '高校生：受講希望科目 （表を右にスクロールできます） [地学]': 'HS_Geology',
+    '高校生：受講希望科目 （表を右にスクロールできます） [地理]': 'HS_Geography',
+    '高校生：受講希望科目 （表を右にスクロールできます） [日本史]': 'HS_JapaneseHistory',
+    '高校生：受講希望科目 （表を右にスクロールできます） [世界史]': 'HS_WorldHistory',
+    '高校生：受講希望科目 （表を右にスクロールできます） [倫理]': 'HS_Ethics',
+    '高校生：受講希望科目 （表を右にスクロールできます） [政経]': 'HS_PoliticsEconomy'
+}
 
-# ③ 認証情報の取得
-creds = Credentials.from_service_account_file(SERVICE_ACCOUNT_FILE, scopes=SCOPES)
+# 通常授業の科目 (教師フォーム) → (subject_id, subject_name)
+REGULAR_CLASS_SUBJECTS = {
+    "国語（小学生）": ("ES_Japanese", "国語"),
+    "算数（小学生）": ("ES_Math", "算数"),
+    "理科（小学生）": ("ES_Science", "理科"),
+    "社会（小学生）": ("ES_Social", "社会"),
+    "英語（小学生）": ("ES_English", "英語"),
 
-# ④ Googleスプレッドシートに接続
-client = gspread.authorize(creds)
+    "国語（中学生）": ("MS_Japanese", "国語"),
+    "数学（中学生）": ("MS_Math", "数学"),
+    "理科（中学生）": ("MS_Science", "理科"),
+    "社会（中学生）": ("MS_Social", "社会"),
+    "英語（中学生）": ("MS_English", "英語"),
 
-# ⑤ スプレッドシートを開く
-SPREADSHEET_URL_teacher = "https://docs.google.com/spreadsheets/d/1xKQcSv2R3KhkD3oSbymHrW8YR21CvlphIyFoUu4Ji94/edit"
-SPREADSHEET_URL_student = "https://docs.google.com/spreadsheets/d/1gSj43cZJRVierQkN8sQU1hVCMSLsMEspc4rRf1jpjYQ/edit"
-SPREADSHEET_ID_teacher = SPREADSHEET_URL_teacher.split('/')[5]
-SPREADSHEET_ID_student = SPREADSHEET_URL_student.split('/')[5]
+    "国語（高校生）": ("HS_Japanese", "国語"),
+    "数学ⅠA（高校生）": ("HS_Math2B", "数学ⅠA"),
+    "数学ⅡB（高校生）": ("HS_Math2B", "数学ⅡB"),
+    "数学ⅢC（高校生）": ("HS_Math3C", "数学ⅢC"),
+    "英語（高校生）": ("HS_English", "英語"),
+    "物理基礎（高校生）": ("HS_PhysicsBasic", "物理基礎"),
+    "物理（高校生）": ("HS_Physics", "物理"),
+    "化学基礎（高校生）": ("HS_ChemistryBasic", "化学基礎"),
+    "化学（高校生）": ("HS_Chemistry", "化学"),
+    "生物基礎（高校生）": ("HS_BiologyBasic", "生物基礎"),
+    "生物（高校生）": ("HS_Biology", "生物"),
+    "地学基礎（高校生）": ("HS_GeologyBasic", "地学基礎"),
+    "地学（高校生）": ("HS_Geology", "地学"),
+    "世界史（高校生）": ("HS_WorldHistory", "世界史"),
+    "日本史（高校生）": ("HS_JapaneseHistory", "日本史"),
+    "地理（高校生）": ("HS_Geography", "地理"),
+    "倫理（高校生）": ("HS_Ethics", "倫理"),
+    "政経（高校生）": ("HS_PoliticsEconomy", "政経")
+}
 
-sheet_teacher = client.open_by_key(SPREADSHEET_ID_teacher).sheet1
-sheet_student = client.open_by_key(SPREADSHEET_ID_student).sheet1
 
-# ⑥ データを取得して整形
-all_values_teacher = sheet_teacher.get_all_values()
-all_values_student = sheet_student.get_all_values()
+# ------------------------------------------------------------
+# fetch: スプレッドシートの取り込み
+# ------------------------------------------------------------
+def form_sources(teacher_sheet: str = TEACHER_FORM_SHEET,
+                 student_sheet: str = STUDENT_FORM_SHEET) -> List[SheetSource]:
+    return [
+        SheetSource("teacher", teacher_sheet),
+        SheetSource("student", student_sheet),
+    ]
+
+
+def fetch_forms(client, sources: List[SheetSource]) -> Dict[str, List[List[str]]]:
+    """教師・生徒のフォームを取り込み {"teacher": 行のリスト, "student": 行のリスト} を返す。"""
+    return fetch_sheets(client, sources)
+
+
+def retrieve_forms(client, sources: List[SheetSource],
+                   cache_dir: Optional[str] = FORM_PIPELINE_CACHE_DIR,
+                   incremental: bool = FORM_INCREMENTAL_SYNC) -> Dict[str, List[List[str]]]:
+    """
+    fetch_forms と同じ結果を返し、取り込んだ回答を cache_dir に残す (--offline と差分取り込みの元になる)。
+    incremental=True なら前回の回答との差分だけを取りに行く (sheets_ingest.sync_sheets)。
+    前回の回答や同期の状態が無ければ、その回は全件を取る。
+    """
+    cache = StageCache(cache_dir)
+    if incremental:
+        previous, state = {}, {}
+        if cache.entry("sync_state") is not None:
+            state = cache.load("sync_state")
+            for src in sources:
+                if cache.entry(f"{src.name}_raw") is not None:
+                    previous[src.name] = cache.load(f"{src.name}_raw")
+        sheet_values, state = sync_sheets(client, sources, previous, state)
+    else:
+        sheet_values = fetch_forms(client, sources)
+        state = {}  # 同期の状態は今回の回答と合わないので捨てる (次の差分取り込みは全件から)
+    for name, rows in sheet_values.items():
+        cache.save(f"{name}_raw", _digest(rows), rows)
+    cache.save("sync_state", "", state)
+    cache.flush()
+    return sheet_values
+
+
+# ------------------------------------------------------------
+# normalize: 名前をキーとして，他のデータに関する辞書を値とする辞書を作成
+# ------------------------------------------------------------
+def normalize_form(all_values: List[List[str]]) -> Dict[str, Any]:
+    """
+    シートの全行 (1行目がヘッダー) を {"headers": ヘッダー, "records": {名前: {列名: 値}}} にする。
+    名前は2列目。同じ名前の回答が複数あれば後のものを使う。
+    """
+    headers = all_values[0] if all_values else []
+    records = {}
+    for row in all_values[1:]:
+        name = row[1]
+        records[name] = {
+            headers[i]: row[i] for i in range(len(headers)) if i != 1
+        }
+    return {"headers": headers, "records": records}
 
-headers_teacher = all_values_teacher[0]
-data_teacher = all_values_teacher[1:]
-headers_student = all_values_student[0]
-data_student = all_values_student[1:]
 
 def parse_periods(period_str):
     """時限文字列をパースして辞書形式に変換"""
     periods = {2: False, 3: False, 4: False, 5: False, 6: False}
     if not period_str:
         return periods
-    
+
     # "2限, 3限, 4限" → [2, 3, 4]
     available = [int(p.strip().replace('限', '')) for p in period_str.split(',') if p.strip()]
-    
+
     for p in available:
         if p in periods:
             periods[p] = True
-    
+
     return periods
 
 
+def header_date(header: str) -> str:
+    """"シフト希望 [8/1（金）]" や "希望授業枠 [8/1]" の日付を "2025-08-01" にする。"""
+    date_info = header.split("[")[1].split("]")[0]
+    month, day = date_info.split("（")[0].split("/")
+    return f"{FORM_YEAR}-{month.zfill(2)}-{day.zfill(2)}"
 
-# 名前をキーとして，他のデータに関する辞書を値とする辞書を作成
-teachers_dict = {}
-# print(headers_teacher)
-for row in data_teacher:
-    name = row[1]
-    teachers_dict[name] = {
-        headers_teacher[i]: row[i] for i in range(len(headers_teacher)) if i != 1
-    }
-# print(teachers_dict)
 
-students_dict = {}
-for row in data_student:
-    name = row[1]
-    students_dict[name] = {
-        headers_student[i]: row[i] for i in range(len(headers_student)) if i != 1
-    }
-# print(students_dict)
+# ------------------------------------------------------------
+# 引き当て表 (名前 → ID, (日付, 時限) → timeslot_id, 列名 → 日付)
+# ------------------------------------------------------------
+# 日付を持つ列の接頭辞 (教師フォームは "シフト希望 [8/1（金）]", 生徒フォームは "希望授業枠 [8/1]")
+DATE_HEADER_PREFIXES = {"teacher_form": "シフト", "student_form": "希望授業枠"}
+
+
+class FormIndex:
+    """
+    1回の実行で各ジェネレータが共有する引き当て表。
+    get(段の名前) で段の結果を受け取り、表はどれも最初に使われたときに1度だけ作る
+    (使わない段の結果はキャッシュから読み込まない)。registry は *_ids の段が ID を引く台帳。
+    """
+
+    def __init__(self, get, registry: Optional[IdRegistry] = None):
+        self._get = get
+        self._tables = {}
+        self.registry = registry if registry is not None else IdRegistry()
+
+    @classmethod
+    def from_values(cls, **values) -> "FormIndex":
+        """段の結果を直接渡して作る (FormIndex.from_values(teacher_form=form, timeslots=rows, ...))。"""
+        return cls(values.__getitem__)
+
+    def _table(self, name, build):
+        if name not in self._tables:
+            self._tables[name] = build()
+        return self._tables[name]
 
-# print(students_dict)
-# print(headers_student)
-# print(data_student)
-print(teachers_dict)
-# print(headers_teacher)
-# print(data_teacher)
+    @property
+    def teacher_ids(self) -> Dict[str, str]:
+        """教師名 → teacher_id (teacher_ids の段。ID 台帳から引く)"""
+        return self._get("teacher_ids")
+
+    @property
+    def student_ids(self) -> Dict[str, str]:
+        """生徒名 → student_id (student_ids の段。ID 台帳から引く)"""
+        return self._get("student_ids")
+
+    @property
+    def timeslot_ids(self) -> Dict[tuple, str]:
+        """(date, period_label) → timeslot_id"""
+        return self._table("timeslot_ids",
+                           lambda: {(row[1], row[4]): row[0] for row in self._get("timeslots")[1:]})
+
+    def header_dates(self, form: str) -> Dict[str, str]:
+        """form ("teacher_form" / "student_form") の日付の列 → "2025-08-01" (列の並び順)"""
+        prefix = DATE_HEADER_PREFIXES[form]
+        return self._table(f"header_dates:{form}", lambda: {
+            h: header_date(h) for h in self._get(form)["headers"] if h.startswith(prefix)})
+
+    @property
+    def weekday_dates(self) -> Dict[str, str]:
+        """"金曜日" → その曜日の日付 (教師フォームのシフト列から)"""
+        def build():
+            weekday_dates = {}
+            for header, date in self.header_dates("teacher_form").items():
+                date_info = header.split('[')[1].split(']')[0]
+                if '（' in date_info:
+                    weekday = date_info.split('（')[1].replace('）', '')
+                    weekday_dates[weekday + '曜日'] = date
+            return weekday_dates
+        return self._table("weekday_dates", build)
 
 
 # ------------------------------------------------------------
 # timeslots.csvデータの生成
 # ------------------------------------------------------------
-# timeslotを作成
-timeslot = []
-for j in headers_teacher:
-    if j.startswith("シフト"):
-        # jを[でスライス
-        j = j.split("[")[1].split("]")[0]
-        # print(j)
-        j = j.split("/")
-        #2025-08-01 このような形式で，jを整形
-        # 月と日を2桁の形式に整形
-        month = j[0].zfill(2)  # 1桁の場合は0埋めして2桁に
-        day = j[1].split("（")[0].zfill(2)  # 1桁の場合は0埋めして2桁に
-        j = f"2025-{month}-{day}"
-        # print(j)
-        timeslot.append(j)
-
-
-def generate_timeslots(dates):
-    """タイムスロットデータを生成する関数"""
+def timeslot_keys(dates):
+    """各日付の2〜6限の (date, period) を日付順に返す"""
+    return [(date, period) for date in sorted(set(dates)) for period in range(2, 7)]
+
+
+def generate_timeslots(dates, timeslot_ids):
+    """タイムスロットデータを生成する関数 (timeslot_ids は timeslot_key → timeslot_id)"""
     timeslots = []
-    slot_id = 1
-    
+
     # ヘッダー
     headers = ['timeslot_id', 'date', 'period_index', 'campaign_id', 'period_label']
     timeslots.append(headers)
-    
-    # 各日付について2〜6限までのタイムスロットを生成
-    for date in sorted(set(dates)):  # 重複を除去してソート
-        for period in range(2, 7):  # 2限から6限まで
-            row = [
-                f'TS{slot_id}',  # timeslot_id
-                date,            # date
-                str(period),     # period_index
-                'CAM1',         # campaign_id
-                f'{period}限'    # period_label
-            ]
-            timeslots.append(row)
-            slot_id += 1
-    
-    return timeslots
 
-# timeslotデータの生成
-unique_dates = list(set(timeslot))  # 重複を除去
-timeslot_data = generate_timeslots(unique_dates)
-
-# CSVファイルとして保存
-import csv
-with open('api_data/timeslots.csv', 'w', newline='', encoding='utf-8') as f:
-    writer = csv.writer(f)
-    writer.writerows(timeslot_data)
+    # 各日付について2〜6限までのタイムスロットを生成
+    for date, period in timeslot_keys(dates):
+        row = [
+            timeslot_ids[timeslot_key(date, f'{period}限')],  # timeslot_id
+            date,            # date
+            str(period),     # period_index
+            'CAM1',         # campaign_id
+            f'{period}限'    # period_label
+        ]
+        timeslots.append(row)
 
-print("Timeslots generated successfully!")
+    return timeslots
 
 
 # ------------------------------------------------------------
@@ -139,130 +347,68 @@ print("Timeslots generated successfully!")
 # ------------------------------------------------------------
 def parse_teachable_subjects(subjects_str):
     """指導可能科目の文字列からsubject_idのリストを抽出する"""
-    # 科目名とsubject_idの対応マップ
-    subject_mapping = {
-        "国語（小学生）": "ES_Japanese",
-        "算数（小学生）": "ES_Math",
-        "理科（小学生）": "ES_Science",
-        "社会（小学生）": "ES_Social",
-        "英語（小学生）": "ES_English",
-        
-        "国語（中学生）": "MS_Japanese",
-        "数学（中学生）": "MS_Math",
-        "理科（中学生）": "MS_Science",
-        "社会（中学生）": "MS_Social",
-        "英語（中学生）": "MS_English",
-        
-        "国語（高校生）": "HS_Japanese",
-        "数学ⅠA（高校生）": "HS_Math2B",  # 注: ⅠAからⅡBまでを含む
-        "数学ⅡB（高校生）": "HS_Math2B",
-        "数学ⅢC（高校生）": "HS_Math3C",
-        "英語（高校生）": "HS_English",
-        "物理基礎（高校生）": "HS_PhysicsBasic",
-        "物理（高校生）": "HS_Physics",
-        "化学基礎（高校生）": "HS_ChemistryBasic",
-        "化学（高校生）": "HS_Chemistry",
-        "生物基礎（高校生）": "HS_BiologyBasic",
-        "生物（高校生）": "HS_Biology",
-        "地学基礎（高校生）": "HS_GeologyBasic",
-        "地学（高校生）": "HS_Geology",
-        "世界史（高校生）": "HS_WorldHistory",
-        "日本史（高校生）": "HS_JapaneseHistory",
-        "地理（高校生）": "HS_Geography",
-        "倫理（高校生）": "HS_Ethics",
-        "政経（高校生）": "HS_PoliticsEconomy"
-    }
-    
     # 入力文字列を科目リストに分割
     subjects_list = [s.strip() for s in subjects_str.split(',')]
-    
+
     # 対応するsubject_idを抽出
     subject_ids = []
     for subject in subjects_list:
-        if subject in subject_mapping:
-            subject_ids.append(subject_mapping[subject])
-    
-    return subject_ids
+        if subject in TEACHABLE_SUBJECTS:
+            subject_ids.append(TEACHABLE_SUBJECTS[subject])
 
-teachers_data = {}
-for i in teachers_dict:
-    teacher_name = i
-    teachable_subjects = parse_teachable_subjects(teachers_dict[i]["指導可能科目"])
-    min_continuous = teachers_dict[i]["最低限出勤コマ数"]
-    teachers_data[teacher_name] = teachable_subjects, min_continuous
+    return subject_ids
 
-# print(teachers_data)
 
-def generate_teachers(teachers_data):
-    """タイムスロットデータを生成する関数"""
+def generate_teachers(teachers_dict, index: FormIndex):
+    """教師データをCSV形式に変換する関数"""
     teachers = []
-    T_id = 1
-    
+
     # ヘッダー
     headers = ["teacher_id","teacher_name","desired_shift_count","min_classes","teachable_subjects"]
     teachers.append(headers)
-    
-    for i in teachers_data:
+
+    teacher_ids = index.teacher_ids
+    for teacher_name, info in teachers_dict.items():
         row = [
-            f'T{T_id}',  # "teacher_id"
-            i,            # "teacher_name"
+            teacher_ids[teacher_name],  # "teacher_id"
+            teacher_name,            # "teacher_name"
             20,     # "desired_shift_count"
-            teachers_data[i][1],         # "min_classes"
-            "|".join(teachers_data[i][0]) # "teachable_subjects"
+            info["最低限出勤コマ数"],         # "min_classes"
+            "|".join(parse_teachable_subjects(info["指導可能科目"])) # "teachable_subjects"
         ]
         teachers.append(row)
-        T_id += 1
-    
-    return teachers
-
-# teachersデータの生成
-teachers_data = generate_teachers(teachers_data)
-
-# CSVファイルとして保存
-import csv
-with open('api_data/teachers.csv', 'w', newline='', encoding='utf-8') as f:
-    writer = csv.writer(f)
-    writer.writerows(teachers_data)
 
-print("teachers.csv generated successfully!")
+    return teachers
 
 
 # ------------------------------------------------------------
 # teacher_availability.csvデータの生成
 # ------------------------------------------------------------
-teacher_availability = {}
-for i in teachers_dict:
-    teacher_name = i
-    teacher_availability[teacher_name] = {}
-    for j in headers_teacher:
-        if j.startswith("シフト"):
-            # シフトの時限を取得
-            available_periods = teachers_dict[teacher_name][j]
-            j = j.split("[")[1].split("]")[0]
-            j = j.split("/")
-            j = f"2025-{j[0].zfill(2)}-{j[1].split('（')[0].zfill(2)}"
-            teacher_availability[teacher_name][j] = available_periods
-# print(teacher_availability)
-
-def generate_teacher_availability_csv(teacher_availability, teachers_data, timeslot_data):
+def teacher_availability_by_date(teachers_dict, header_dates):
+    """{教師名: {日付: "2限, 3限"}}"""
+    teacher_availability = {}
+    for teacher_name, info in teachers_dict.items():
+        teacher_availability[teacher_name] = {
+            date: info[header] for header, date in header_dates.items()
+        }
+    return teacher_availability
+
+
+def generate_teacher_availability_csv(teacher_availability, index: FormIndex):
     """教師の空き時間データをCSV形式に変換する関数"""
     availability_csv = []
-    
+
     # ヘッダー
     headers = ['teacher_id', 'teacher_name', 'timeslot_id', 'date', 'period_label']
     availability_csv.append(headers)
-    
-    # timeslot_dataからtimeslot_idを取得するための辞書を作成
-    timeslot_dict = {}
-    for row in timeslot_data[1:]:  # ヘッダーをスキップ
-        key = (row[1], row[4])  # (date, period_label)をキーとする
-        timeslot_dict[key] = row[0]  # timeslot_idを値とする
-    
+
+    teacher_ids = index.teacher_ids
+    timeslot_ids = index.timeslot_ids
+
     # 各教師の利用可能時間を処理
     for teacher_name, availability in teacher_availability.items():
-        # 教師IDを取得
-        teacher_id = next(row[0] for row in teachers_data[1:] if row[1] == teacher_name)
-        
+        teacher_id = teacher_ids[teacher_name]
+
         for date, periods in availability.items():
             # カンマで区切られた時限を分割
             if periods:  # 空でない場合のみ処理
@@ -270,7 +416,7 @@ def generate_teacher_availability_csv(teacher_availability, teachers_data, times
                 for period in period_list:
                     period_label = f"{period}"
                     # timeslot_idを取得
-                    timeslot_id = timeslot_dict.get((date, period_label))
+                    timeslot_id = timeslot_ids.get((date, period_label))
                     if timeslot_id:
                         row = [
                             teacher_id,
@@ -280,36 +426,22 @@ def generate_teacher_availability_csv(teacher_availability, teachers_data, times
                             period_label
                         ]
                         availability_csv.append(row)
-    
-    return availability_csv
-
-# CSVデータを生成
-teacher_availability_csv = generate_teacher_availability_csv(teacher_availability, teachers_data, timeslot_data)
-
-# CSVファイルとして保存
-import csv
-with open('api_data/teacher_availability.csv', 'w', newline='', encoding='utf-8') as f:
-    writer = csv.writer(f)
-    writer.writerows(teacher_availability_csv)
-
-print("Teacher availability CSV generated successfully!")
 
+    return availability_csv
 
 
 # ------------------------------------------------------------
 # students.csvデータの生成
 # ------------------------------------------------------------
-def generate_students_csv(students_dict):
+def generate_students_csv(students_dict, index: FormIndex):
     """生徒データをCSV形式に変換する関数"""
     students = []
-    
+
     # ヘッダー
     headers = ['student_id', 'student_name', 'grade', 'gap_preference']
     students.append(headers)
-    
-    # 生徒IDのカウンター
-    student_id = 1
-    
+
+    student_ids = index.student_ids
     for student_name, info in students_dict.items():
         # 学年（grade）の判定
         grade_category = info['所属を選んでください']
@@ -325,243 +457,120 @@ def generate_students_csv(students_dict):
         grade_info = grade + grade_number
         # 空きコマの設定
         gap_preference = 'NoGapPreferred' if info['空きコマに関する質問'] == '空きコマは避けたい' else 'GapAllowed'
-        
+
         # 行データの作成
         row = [
-            f'S{student_id}',  # student_id
+            student_ids[student_name],  # student_id
             student_name,      # student_name
             grade_info,            # grade
             gap_preference    # gap_preference
         ]
         students.append(row)
-        student_id += 1
-    
-    return students
 
-# CSVデータを生成
-students_csv = generate_students_csv(students_dict)
-
-# CSVファイルとして保存
-import csv
-with open('api_data/students.csv', 'w', newline='', encoding='utf-8') as f:
-    writer = csv.writer(f)
-    writer.writerows(students_csv)
-
-print("Students CSV generated successfully!")
+    return students
 
 
 # ------------------------------------------------------------
 # student_requirements.csvデータの生成
 # ------------------------------------------------------------
-def generate_student_requirements_csv(students_dict):
+def generate_student_requirements_csv(students_dict, index: FormIndex):
     """生徒の受講希望科目データをCSV形式に変換する関数"""
     requirements = []
-    
+
     # ヘッダー
     headers = ['student_id', 'student_name', 'subject_id', 'required_count']
     requirements.append(headers)
-    
-    # 科目名とsubject_idの対応マップ
-    subject_mapping = {
-        '小学生：受講希望科目 （表を右にスクロールできます） [英語]': 'ES_English',
-        '小学生：受講希望科目 （表を右にスクロールできます） [算数]': 'ES_Math',
-        '小学生：受講希望科目 （表を右にスクロールできます） [国語]': 'ES_Japanese',
-        '小学生：受講希望科目 （表を右にスクロールできます） [理科]': 'ES_Science',
-        '小学生：受講希望科目 （表を右にスクロールできます） [社会]': 'ES_Social',
-        
-        '中学生：受講希望科目 （表を右にスクロールできます） [英語]': 'MS_English',
-        '中学生：受講希望科目 （表を右にスクロールできます） [数学]': 'MS_Math',
-        '中学生：受講希望科目 （表を右にスクロールできます） [国語]': 'MS_Japanese',
-        '中学生：受講希望科目 （表を右にスクロールできます） [理科]': 'MS_Science',
-        '中学生：受講希望科目 （表を右にスクロールできます） [社会]': 'MS_Social',
-        
-        '高校生：受講希望科目 （表を右にスクロールできます） [英語]': 'HS_English',
-        '高校生：受講希望科目 （表を右にスクロールできます） [数学ⅠA]': 'HS_Math2B',
-        '高校生：受講希望科目 （表を右にスクロールできます） [数学ⅡB]': 'HS_Math2B',
-        '高校生：受講希望科目 （表を右にスクロールできます） [数学ⅢC]': 'HS_Math3C',
-        '高校生：受講希望科目 （表を右にスクロールできます） [国語]': 'HS_Japanese',
-        '高校生：受講希望科目 （表を右にスクロールできます） [化学基礎]': 'HS_ChemistryBasic',
-        '高校生：受講希望科目 （表を右にスクロールできます） [化学]': 'HS_Chemistry',
-        '高校生：受講希望科目 （表を右にスクロールできます） [物理基礎]': 'HS_PhysicsBasic',
-        '高校生：受講希望科目 （表を右にスクロールできます） [物理]': 'HS_Physics',
-        '高校生：受講希望科目 （表を右にスクロールできます） [生物基礎]': 'HS_BiologyBasic',
-        '高校生：受講希望科目 （表を右にスクロールできます） [生物]': 'HS_Biology',
-        '高校生：受講希望科目 （表を右にスクロールできます） [地学基礎]': 'HS_GeologyBasic',
-        '高校生：受講希望科目 （表を右にスクロールできます） [地学]': 'HS_Geology',
-        '高校生：受講希望科目 （表を右にスクロールできます） [地理]': 'HS_Geography',
-        '高校生：受講希望科目 （表を右にスクロールできます） [日本史]': 'HS_JapaneseHistory',
-        '高校生：受講希望科目 （表を右にスクロールできます） [世界史]': 'HS_WorldHistory',
-        '高校生：受講希望科目 （表を右にスクロールできます） [倫理]': 'HS_Ethics',
-        '高校生：受講希望科目 （表を右にスクロールできます） [政経]': 'HS_PoliticsEconomy'
-    }
-    
-    student_id = 1
+
+    student_ids = index.student_ids
     for student_name, info in students_dict.items():
+        student_id = student_ids[student_name]
         # 各科目について処理
-        for subject_key, subject_id in subject_mapping.items():
+        for subject_key, subject_id in REQUIREMENT_SUBJECTS.items():
             if subject_key in info and info[subject_key]:
                 # コマ数を抽出（"3コマ" → 3）
                 required_count = int(info[subject_key].replace('コマ', ''))
                 if required_count > 0:
                     row = [
-                        f'S{student_id}',  # student_id
+                        student_id,        # student_id
                         student_name,      # student_name
                         subject_id,        # subject_id
                         required_count     # required_count
                     ]
                     requirements.append(row)
-        student_id += 1
-    
-    return requirements
-
-# CSVデータを生成
-student_requirements_csv = generate_student_requirements_csv(students_dict)
-
-# CSVファイルとして保存
-import csv
-with open('api_data/student_requirements.csv', 'w', newline='', encoding='utf-8') as f:
-    writer = csv.writer(f)
-    writer.writerows(student_requirements_csv)
 
-print("Student requirements CSV generated successfully!")
+    return requirements
 
 
 # ------------------------------------------------------------
 # student_availability.csvデータの生成
 # ------------------------------------------------------------
-def generate_student_availability_csv(students_dict, timeslot_data):
+def generate_student_availability_csv(students_dict, index: FormIndex):
     """生徒の利用可能時間データをCSV形式に変換する関数"""
     availability = []
-    
+
     # ヘッダー
     headers = ['student_id', 'student_name', 'timeslot_id', 'date', 'period_label']
     availability.append(headers)
-    
-    # timeslot_dataからtimeslot_idを取得するための辞書を作成
-    timeslot_dict = {}
-    for row in timeslot_data[1:]:  # ヘッダーをスキップ
-        key = (row[1], row[4])  # (date, period_label)をキーとする
-        timeslot_dict[key] = row[0]  # timeslot_idを値とする
-    
-    student_id = 1
-    for student_name, info in students_dict.items():
-        # 各日付の希望時限を処理
-        for date_key in info:
-            if date_key.startswith('希望授業枠'):
-                if info[date_key]:  # 空でない場合のみ処理
-                    # 日付を抽出 [8/1] → 2025-08-01
-                    date_str = date_key.split('[')[1].split(']')[0]
-                    month, day = date_str.split('/')
-                    formatted_date = f"2025-{month.zfill(2)}-{day.zfill(2)}"
-                    
-                    # 時限リストを処理
-                    periods = [p.strip() for p in info[date_key].split(',')]
-                    for period in periods:
-                        period_label = f"{period}"
-                        # timeslot_idを取得
-                        timeslot_id = timeslot_dict.get((formatted_date, period_label))
-                        if timeslot_id:
-                            row = [
-                                f'S{student_id}',
-                                student_name,
-                                timeslot_id,
-                                formatted_date,
-                                period_label
-                            ]
-                            availability.append(row)
-        student_id += 1
-    
-    return availability
 
-# CSVデータを生成
-student_availability_csv = generate_student_availability_csv(students_dict, timeslot_data)
+    student_ids = index.student_ids
+    timeslot_ids = index.timeslot_ids
+    # "希望授業枠 [8/1]" → 2025-08-01
+    header_dates = index.header_dates("student_form")
 
-# CSVファイルとして保存
-import csv
-with open('api_data/student_availability.csv', 'w', newline='', encoding='utf-8') as f:
-    writer = csv.writer(f)
-    writer.writerows(student_availability_csv)
+    for student_name, info in students_dict.items():
+        student_id = student_ids[student_name]
+        # 各日付の希望時限を処理
+        for date_key, formatted_date in header_dates.items():
+            if info.get(date_key):  # 空でない場合のみ処理
+                # 時限リストを処理
+                periods = [p.strip() for p in info[date_key].split(',')]
+                for period in periods:
+                    period_label = f"{period}"
+                    # timeslot_idを取得
+                    timeslot_id = timeslot_ids.get((formatted_date, period_label))
+                    if timeslot_id:
+                        row = [
+                            student_id,
+                            student_name,
+                            timeslot_id,
+                            formatted_date,
+                            period_label
+                        ]
+                        availability.append(row)
 
-print("Student availability CSV generated successfully!")
+    return availability
 
 
 # ------------------------------------------------------------
 # regular_classes.csvデータの生成
 # ------------------------------------------------------------
-def generate_regular_classes_csv(teachers_dict, teachers_data, timeslot_data, students_csv):
+def generate_regular_classes_csv(teachers_dict, index: FormIndex):
     """通常授業データをCSV形式に変換する関数"""
     regular_classes = []
-    
+
     # ヘッダー
     headers = ['regular_class_id', 'teacher_id', 'teacher_name', 'subject_id', 'subject_name', 'timeslot_id', 'enrolled_student_ids']
     regular_classes.append(headers)
-    
-    # 科目名とsubject_idの対応マップ
-    subject_mapping = {
-        "国語（小学生）": ("ES_Japanese", "国語"),
-        "算数（小学生）": ("ES_Math", "算数"),
-        "理科（小学生）": ("ES_Science", "理科"),
-        "社会（小学生）": ("ES_Social", "社会"),
-        "英語（小学生）": ("ES_English", "英語"),
-        
-        "国語（中学生）": ("MS_Japanese", "国語"),
-        "数学（中学生）": ("MS_Math", "数学"),
-        "理科（中学生）": ("MS_Science", "理科"),
-        "社会（中学生）": ("MS_Social", "社会"),
-        "英語（中学生）": ("MS_English", "英語"),
-        
-        "国語（高校生）": ("HS_Japanese", "国語"),
-        "数学ⅠA（高校生）": ("HS_Math2B", "数学ⅠA"),
-        "数学ⅡB（高校生）": ("HS_Math2B", "数学ⅡB"),
-        "数学ⅢC（高校生）": ("HS_Math3C", "数学ⅢC"),
-        "英語（高校生）": ("HS_English", "英語"),
-        "物理基礎（高校生）": ("HS_PhysicsBasic", "物理基礎"),
-        "物理（高校生）": ("HS_Physics", "物理"),
-        "化学基礎（高校生）": ("HS_ChemistryBasic", "化学基礎"),
-        "化学（高校生）": ("HS_Chemistry", "化学"),
-        "生物基礎（高校生）": ("HS_BiologyBasic", "生物基礎"),
-        "生物（高校生）": ("HS_Biology", "生物"),
-        "地学基礎（高校生）": ("HS_GeologyBasic", "地学基礎"),
-        "地学（高校生）": ("HS_Geology", "地学"),
-        "世界史（高校生）": ("HS_WorldHistory", "世界史"),
-        "日本史（高校生）": ("HS_JapaneseHistory", "日本史"),
-        "地理（高校生）": ("HS_Geography", "地理"),
-        "倫理（高校生）": ("HS_Ethics", "倫理"),
-        "政経（高校生）": ("HS_PoliticsEconomy", "政経")
-    }
-    
-    # 教師IDの辞書を作成
-    teacher_id_dict = {row[1]: row[0] for row in teachers_data[1:]}
-    
-    # 生徒名とIDの対応辞書を作成
-    student_id_dict = {row[1]: row[0] for row in students_csv[1:]}
-    
-    # 曜日と日付の対応を作成
-    weekday_dates = {}
-    for header in teachers_dict[list(teachers_dict.keys())[0]].keys():
-        if header.startswith('シフト'):
-            date_info = header.split('[')[1].split(']')[0]
-            if '（' in date_info:
-                date, weekday = date_info.split('（')
-                weekday = weekday.replace('）', '')
-                month, day = date.split('/')
-                formatted_date = f"2025-{month.zfill(2)}-{day.zfill(2)}"
-                weekday_dates[weekday + '曜日'] = formatted_date
-    
+
+    teacher_id_dict = index.teacher_ids
+    student_id_dict = index.student_ids
+    timeslot_ids = index.timeslot_ids
+    weekday_dates = index.weekday_dates
+
     class_id = 1
     errors = []  # エラーを記録するリスト
-    
+
     for teacher_name, info in teachers_dict.items():
         teacher_id = teacher_id_dict.get(teacher_name)
         if not teacher_id:
             continue
-            
+
         for i in range(1, 7):
             student_name = info.get(f'担当生徒名{i}')
             subject = info.get(f'授業{i}')
             weekday = info.get(f'授業日{i}')
             period = info.get(f'授業時間{i}')
-            
+
             if all([student_name, subject, weekday, period]):
                 # 生徒IDの取得
                 student_id = student_id_dict.get(student_name)
@@ -569,31 +578,27 @@ def generate_regular_classes_csv(teachers_dict, teachers_data, timeslot_data, st
                     errors.append(f"エラー: 生徒「{student_name}」が students.csv に見つかりません。"
                                 f"（教師: {teacher_name}, 授業{i}）")
                     continue
-                
+
                 # 曜日から対応する日付を取得
                 formatted_date = weekday_dates.get(weekday)
                 if not formatted_date:
                     errors.append(f"エラー: 曜日「{weekday}」に対応する日付が見つかりません。"
                                 f"（教師: {teacher_name}, 授業{i}）")
                     continue
-                
+
                 # timeslot_idを取得
                 period_label = f"{period}"
-                timeslot_id = next(
-                    (row[0] for row in timeslot_data[1:] 
-                     if row[1] == formatted_date and row[4] == period_label),
-                    None
-                )
-                
+                timeslot_id = timeslot_ids.get((formatted_date, period_label))
+
                 if not timeslot_id:
                     errors.append(f"エラー: タイムスロットが見つかりません。"
                                 f"（日付: {formatted_date}, 時限: {period_label}, "
                                 f"教師: {teacher_name}, 授業{i}）")
                     continue
-                
-                if subject in subject_mapping:
-                    subject_id, subject_name = subject_mapping[subject]
-                    
+
+                if subject in REGULAR_CLASS_SUBJECTS:
+                    subject_id, subject_name = REGULAR_CLASS_SUBJECTS[subject]
+
                     row = [
                         f'RC{class_id}',
                         teacher_id,
@@ -608,25 +613,494 @@ def generate_regular_classes_csv(teachers_dict, teachers_data, timeslot_data, st
                 else:
                     errors.append(f"エラー: 科目「{subject}」が subject_mapping に見つかりません。"
                                 f"（教師: {teacher_name}, 授業{i}）")
-    
+
     # エラーがある場合は出力
-    if errors:
-        print("\n=== 正規授業データ生成時のエラー ===")
-        for error in errors:
-            print(error)
-        print("================================\n")
-    
+    for error in errors:
+        logger.warning(error)
+
     return regular_classes
 
-# CSVデータを生成（students_csvを引数として追加）
-regular_classes_csv = generate_regular_classes_csv(teachers_dict, teachers_data, timeslot_data, students_csv)
 
-# CSVファイルとして保存
-import csv
-with open('api_data/regular_classes.csv', 'w', newline='', encoding='utf-8') as f:
-    writer = csv.writer(f)
-    writer.writerows(regular_classes_csv)
+# ------------------------------------------------------------
+# パイプライン
+# ------------------------------------------------------------
+# (段の名前, 入力の段, 作る関数, 書き出す CSV (None なら書かない))。並びはそのまま実行順。
+# "teacher_raw" / "student_raw" は fetch の結果 (シートの全行)。
+# 作る関数は (FormIndex, *入力の段の結果) を受け取る。入力の段は、FormIndex 経由で使う段も含めて
+# すべて並べる (キャッシュの鍵になる)。*_ids の段は ID 台帳から ID を引く (ID_STAGES)。
+STAGES = [
+    ("teacher_form", ("teacher_raw",), lambda index, raw: normalize_form(raw), None),
+    ("student_form", ("student_raw",), lambda index, raw: normalize_form(raw), None),
+    ("teacher_ids", ("teacher_form",),
+     lambda index, teacher_form: index.registry.assign("teacher", teacher_form["records"]), None),
+    ("student_ids", ("student_form",),
+     lambda index, student_form: index.registry.assign("student", student_form["records"]), None),
+    ("timeslot_ids", ("teacher_form",),
+     lambda index, teacher_form: index.registry.assign("timeslot", [
+         timeslot_key(date, f"{period}限")
+         for date, period in timeslot_keys(index.header_dates("teacher_form").values())]),
+     None),
+    ("timeslots", ("teacher_form", "timeslot_ids"),
+     lambda index, teacher_form, timeslot_ids: generate_timeslots(
+         index.header_dates("teacher_form").values(), timeslot_ids),
+     "timeslots.csv"),
+    ("teachers", ("teacher_form", "teacher_ids"),
+     lambda index, teacher_form, teacher_ids: generate_teachers(teacher_form["records"], index),
+     "teachers.csv"),
+    ("teacher_availability", ("teacher_form", "teacher_ids", "timeslots"),
+     lambda index, teacher_form, teacher_ids, timeslots: generate_teacher_availability_csv(
+         teacher_availability_by_date(teacher_form["records"], index.header_dates("teacher_form")), index),
+     "teacher_availability.csv"),
+    ("students", ("student_form", "student_ids"),
+     lambda index, student_form, student_ids: generate_students_csv(student_form["records"], index),
+     "students.csv"),
+    ("student_requirements", ("student_form", "student_ids"),
+     lambda index, student_form, student_ids: generate_student_requirements_csv(
+         student_form["records"], index),
+     "student_requirements.csv"),
+    ("student_availability", ("student_form", "student_ids", "timeslots"),
+     lambda index, student_form, student_ids, timeslots: generate_student_availability_csv(
+         student_form["records"], index),
+     "student_availability.csv"),
+    ("regular_classes", ("teacher_form", "student_form", "teacher_ids", "student_ids", "timeslots"),
+     lambda index, teacher_form, student_form, teacher_ids, student_ids, timeslots:
+         generate_regular_classes_csv(teacher_form["records"], index),
+     "regular_classes.csv"),
+]
+
+# ID 台帳から ID を引く段 → 台帳の種類。キャッシュの結果が台帳と食い違う (台帳を消した・直した) なら作り直す。
+ID_STAGES = {"teacher_ids": "teacher", "student_ids": "student", "timeslot_ids": "timeslot"}
+
+# 1人1グループの行を作る段 → その人の回答がある段。2列目が名前で、行は回答の並び順にまとまっている。
+# フォームの変化が「回答の追加・書き換え」だけなら、変わった人の行だけを作り直して差し込む。
+PERSON_STAGES = {
+    "teachers": "teacher_form",
+    "teacher_availability": "teacher_form",
+    "students": "student_form",
+    "student_requirements": "student_form",
+    "student_availability": "student_form",
+}
+
+
+def _digest(value: Any) -> str:
+    return hashlib.sha1(json.dumps(value, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def write_csv(rows: List[list], path: str, append: bool = False):
+    """rows を path に書く (一時ファイルに書いてから置き換える)。append=True なら path の末尾に足す。"""
+    if append:
+        with open(path, 'a', newline='', encoding='utf-8') as f:
+            csv.writer(f).writerows(rows)
+        return
+    dir_path = os.path.dirname(path)
+    if dir_path:
+        os.makedirs(dir_path, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerows(rows)
+    os.replace(tmp_path, path)
+
+
+def csv_signature(path: str) -> Optional[list]:
+    """CSV のパス・size・mtime (無ければ None)。段の結果を書いた CSV がそのまま残っているかの判定に使う。"""
+    if not os.path.exists(path):
+        return None
+    st = os.stat(path)
+    return [path, st.st_size, st.st_mtime_ns]
+
+
+class StageCache:
+    """
+    cache_dir/manifest.json に段ごとの {"key": 入力のハッシュ, "digest": 結果のハッシュ} を、
+    cache_dir/<段>.json に結果を置く。cache_dir が None なら何も残さない。
+    CSV を書いた段は "csv": {"digest": 書いた結果のハッシュ, "file": csv_signature} も持つ。
+    """
+
+    def __init__(self, cache_dir: Optional[str]):
+        self.cache_dir = cache_dir
+        self.manifest = {}
+        if cache_dir and os.path.exists(self._manifest_path()):
+            try:
+                with open(self._manifest_path(), "r", encoding="utf-8") as f:
+                    self.manifest = json.load(f)
+                if self.manifest.get("version") != PIPELINE_VERSION:
+                    self.manifest = {}
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable pipeline manifest in {cache_dir}: {e}")
+                self.manifest = {}
+        self.manifest["version"] = PIPELINE_VERSION
+        self.manifest.setdefault("stages", {})
+
+    def _manifest_path(self):
+        return os.path.join(self.cache_dir, "manifest.json")
+
+    def _path(self, name: str):
+        return os.path.join(self.cache_dir, f"{name}.json")
+
+    def entry(self, name: str) -> Optional[Dict[str, str]]:
+        if not self.cache_dir or not os.path.exists(self._path(name)):
+            return None
+        return self.manifest["stages"].get(name)
+
+    def load(self, name: str) -> Any:
+        with open(self._path(name), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def save(self, name: str, key: str, value: Any, inputs: Optional[Dict[str, str]] = None) -> str:
+        """value を保存して結果のハッシュを返す。inputs は {入力の段: ハッシュ} (差分更新の判定用)。"""
+        # json.dump (ファイルへ少しずつ書く) は遅いので、1度文字列にしてハッシュと書き込みに使う
+        text = json.dumps(value, ensure_ascii=False)
+        digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = self._path(name) + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp_path, self._path(name))
+            self.manifest["stages"][name] = {"key": key, "digest": digest, "inputs": inputs or {}}
+        return digest
+
+    def exported(self, name: str, path: str) -> bool:
+        """段 name の今の結果が path に書かれていて、その後 CSV が書き換えられていなければ真。"""
+        entry = self.manifest["stages"].get(name) or {}
+        csv_entry = entry.get("csv") or {}
+        return (csv_entry.get("digest") == entry.get("digest")
+                and csv_entry.get("file") == csv_signature(path))
+
+    def mark_exported(self, name: str, path: str):
+        """段 name の今の結果を path に書いたことを記録する。"""
+        entry = self.manifest["stages"].get(name)
+        if entry is not None:
+            entry["csv"] = {"digest": entry["digest"], "file": csv_signature(path)}
+
+    def flush(self):
+        if not self.cache_dir:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = self._manifest_path() + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self._manifest_path())
+
+
+def run_pipeline(sheet_values: Dict[str, List[List[str]]],
+                 out_dir: str = DATA_DIR,
+                 cache_dir: Optional[str] = FORM_PIPELINE_CACHE_DIR,
+                 force: bool = False,
+                 export_csv: bool = True,
+                 id_registry_file: Optional[str] = FORM_ID_REGISTRY_FILE) -> Dict[str, Any]:
+    """
+    fetch の結果 {"teacher": 行, "student": 行} から STAGES を順に実行し、CSV を out_dir に書く。
+    入力のハッシュが前回と同じ段は飛ばす (force=True なら全部やり直す)。その結果を書いた CSV が
+    残っていなければ (export_csv=False の実行で結果だけが新しくなった等)、キャッシュの結果から CSV だけ書き直す。
+    PERSON_STAGES の段は、フォームへの変化が回答の追加・書き換え・削除だけで他の入力が同じ
+    (ID は既存の人の分が変わらず増えただけ) なら、回答が変わった人の行だけを作り直して前回の結果に差し込む。
+    export_csv=False なら CSV は書かない (段の結果はキャッシュにだけ残る)。
+    id_registry_file は ID 台帳の JSON (None なら台帳を残さず、毎回 1 から振る)。
+    戻り値は {"ran": [実行した段], "patched": [差分で更新した段], "skipped": [飛ばした段],
+             "written": [書いた CSV のパス], "rows": {段: CSV の行 (1行目がヘッダー)},
+             "times": {実行した段: 秒}, "changed": {フォームの段: 回答が変わった人の名前 (None なら全員)}}。
+    ran には patched の段も含む。飛ばした段の rows はキャッシュから読む。
+    """
+    start = time.perf_counter()
+    cache = StageCache(cache_dir)
+    values = {"teacher_raw": sheet_values["teacher"], "student_raw": sheet_values["student"]}
+    digests = {name: _digest(rows) for name, rows in values.items()}
+
+    def get(name):
+        if name not in values:
+            values[name] = cache.load(name)
+        return values[name]
+
+    registry = IdRegistry(id_registry_file)
+    index = FormIndex(get, registry)
+    ran, patched, skipped, written, times = [], [], [], [], {}
+    changed = {}  # フォームの段 → 回答が変わった人の名前 (None なら全員を作り直す)
+    appended = {}  # 差分更新で行が末尾に増えただけの段 → 増えた行
+    extended = set()  # 前回の ID をすべて保ったまま作り直した *_ids の段
+    for name, inputs, build, file_name in STAGES:
+        input_digests = {i: digests[i] for i in inputs}
+        key = _digest([PIPELINE_VERSION, name] + list(input_digests.values()))
+        path = os.path.join(out_dir, file_name) if file_name and export_csv else None
+        entry = None if force else cache.entry(name)
+        if (entry is not None and entry["key"] == key
+                and (name not in ID_STAGES or registry.agrees(ID_STAGES[name], get(name)))):
+            digests[name] = entry["digest"]
+            skipped.append(name)
+            if name in DATE_HEADER_PREFIXES:
+                changed[name] = set()
+            if path and not cache.exported(name, path):
+                # 結果は前回のままだが CSV が無い・古い (export_csv=False の実行で結果だけ更新された等)
+                write_csv(get(name), path)
+                cache.mark_exported(name, path)
+                written.append(path)
+                logger.info(f"{file_name} rewritten from the cached stage result ({len(get(name)) - 1} rows)")
+            continue
+
+        stage_start = time.perf_counter()
+        form = PERSON_STAGES.get(name)
+        if (form is not None and entry is not None and changed.get(form) is not None
+                and all(entry.get("inputs", {}).get(i) == d or i in extended
+                        for i, d in input_digests.items() if i != form)):
+            # 回答が変わった人の分だけ作り、前回の行と差し替える
+            names = changed[form]
+            full_form = get(form)
+            subset = {"headers": full_form["headers"],
+                      "records": {n: info for n, info in full_form["records"].items() if n in names}}
+            fresh = build(index, *[subset if i == form else get(i) for i in inputs])
+            old_rows = cache.load(name)
+            values[name] = patch_person_rows(old_rows, fresh, full_form["records"], names)
+            patched.append(name)
+            # 新しい回答の行が末尾に付いただけで、CSV が前回の結果のままなら、CSV も末尾に書き足す
+            if path and cache.exported(name, path) and values[name][:len(old_rows)] == old_rows:
+                appended[name] = values[name][len(old_rows):]
+        else:
+            keeps_old = name in DATE_HEADER_PREFIXES or name in ID_STAGES
+            old_value = cache.load(name) if keeps_old and entry is not None else None
+            values[name] = build(index, *[get(i) for i in inputs])
+            if name in DATE_HEADER_PREFIXES:
+                changed[name] = changed_names(old_value, values[name]) if old_value is not None else None
+            if name in ID_STAGES and old_value is not None and all(
+                    values[name].get(k, v) == v for k, v in old_value.items()):
+                extended.add(name)
+        times[name] = time.perf_counter() - stage_start
+        digests[name] = cache.save(name, key, values[name], input_digests)
+        ran.append(name)
+        if path:
+            if name in appended:
+                write_csv(appended[name], path, append=True)
+            else:
+                write_csv(values[name], path)
+            cache.mark_exported(name, path)
+            written.append(path)
+            if name in patched:
+                logger.info(f"{file_name} updated for {len(changed[form])} changed responses "
+                            f"({len(values[name]) - 1} rows)")
+            else:
+                logger.info(f"{file_name} generated ({len(values[name]) - 1} rows)")
+    registry.save()
+    cache.flush()
+
+    logger.info(f"Form pipeline finished in {time.perf_counter() - start:.2f}s: "
+                f"ran {len(ran)} stages ({len(patched)} incrementally), "
+                f"skipped {len(skipped)} unchanged stages")
+    rows = {name: get(name) for name, _, _, file_name in STAGES if file_name}
+    return {"ran": ran, "patched": patched, "skipped": skipped, "written": written,
+            "rows": rows, "times": times, "changed": changed}
+
+
+def changed_names(old_form: Dict[str, Any], new_form: Dict[str, Any]) -> Optional[set]:
+    """
+    normalize_form の結果どうしを比べ、回答が追加・書き換えられた人の名前を返す
+    (消えた人の行は patch_person_rows が落とす)。ヘッダーが変わったなら None。
+    """
+    if old_form["headers"] != new_form["headers"]:
+        return None
+    old_records = old_form["records"]
+    return {name for name, info in new_form["records"].items() if old_records.get(name) != info}
+
+
+def patch_person_rows(old_rows: List[list], fresh_rows: List[list], order, names: set) -> List[list]:
+    """
+    1人1グループの CSV の行 (2列目が名前) のうち、names の人の行を fresh_rows に差し替える。
+    order (回答の並び) の順に並べるので、全員分を作り直した場合と同じ行になる。
+    """
+    by_name = defaultdict(list)
+    for row in old_rows[1:]:
+        if row[1] not in names:
+            by_name[row[1]].append(row)
+    for row in fresh_rows[1:]:
+        by_name[row[1]].append(row)
+    rows = [fresh_rows[0]]
+    for name in order:
+        rows.extend(by_name.get(name, ()))
+    return rows
+
+
+# ------------------------------------------------------------
+# CSV を経由せずにドメインオブジェクトを作る
+# ------------------------------------------------------------
+def build_inputs(rows: Dict[str, List[list]],
+                 subjects: Dict[str, Subject],
+                 campaigns: Dict[str, Campaign],
+                 constraint_weights: Dict[str, float],
+                 solver_params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    run_pipeline の rows から Teacher / Student / TimeSlot / RegularClass を作り、
+    main.load_inputs と同じ形の dict を返す。reader.py で CSV を読んだ場合と同じオブジェクトになる
+    (available_timeslots / availability_mask / requirements もつないだ状態)。
+    """
+    teachers = {}
+    for t_id, t_name, desired, minimum, subs_str in rows["teachers"][1:]:
+        subject_list = []
+        for sid in (subs_str.split("|") if subs_str else []):
+            if sid in subjects:
+                subject_list.append(subjects[sid])
+            else:
+                logger.warning(f"Subject {sid} not in dict.")
+        teachers[t_id] = Teacher(
+            teacher_id=t_id,
+            teacher_name=t_name,
+            desired_shift_count=int(desired),
+            min_classes=int(minimum),
+            teachable_subjects=subject_list
+        )
+
+    students = {}
+    for s_id, s_name, grade, gap_pref in rows["students"][1:]:
+        students[s_id] = Student(
+            student_id=s_id,
+            student_name=s_name,
+            grade=grade,
+            gap_preference=gap_pref,
+            requirements={}
+        )
+    for s_id, _, subj_id, req_count in rows["student_requirements"][1:]:
+        if s_id in students:
+            students[s_id].requirements[subj_id] = int(req_count)
+        else:
+            logger.warning(f"student_id {s_id} in requirements not found in students list.")
+
+    timeslots = {}
+    for row_idx, (ts_id, date_str, pidx, camp_id, plabel) in enumerate(rows["timeslots"][1:]):
+        timeslots[ts_id] = TimeSlot(
+            timeslot_id=ts_id,
+            date=date_str,
+            period_index=int(pidx),
+            campaign_id=camp_id,
+            period_label=plabel,
+            index=row_idx
+        )
+
+    for t_id, _, ts_id, _, _ in rows["teacher_availability"][1:]:
+        if ts_id in timeslots and t_id in teachers:
+            teachers[t_id].add_available_timeslot(timeslots[ts_id])
+    for s_id, _, ts_id, _, _ in rows["student_availability"][1:]:
+        if ts_id in timeslots and s_id in students:
+            students[s_id].add_available_timeslot(timeslots[ts_id])
+
+    regular_classes = {}
+    for rc_id, t_id, _, subj_id, _, ts_id, en_str in rows["regular_classes"][1:]:
+        if subj_id not in subjects:
+            logger.warning(f"Subject {subj_id} not found in subject dict.")
+            continue
+        regular_classes[rc_id] = RegularClass(
+            regular_class_id=rc_id,
+            teacher_id=t_id,
+            subject=subjects[subj_id],
+            timeslot_id=ts_id,
+            enrolled_student_ids=en_str.split("|") if en_str else []
+        )
+
+    logger.info(f"Built {len(teachers)} teachers, {len(students)} students, {len(timeslots)} timeslots "
+                f"and {len(regular_classes)} regular classes from the form responses")
+    return {
+        "teachers": teachers,
+        "students": students,
+        "timeslots": timeslots,
+        "campaigns": campaigns,
+        "regular_classes": regular_classes,
+        "subjects": subjects,
+        "constraint_weights": constraint_weights,
+        "solver_params": solver_params,
+    }
+
+
+def registry_path(out_dir: str) -> str:
+    """out_dir に書く CSV に対応する ID 台帳のパス (既定の DATA_DIR なら FORM_ID_REGISTRY_FILE)"""
+    return os.path.join(out_dir, os.path.basename(FORM_ID_REGISTRY_FILE))
+
+
+def open_client(service_account_file: Optional[str] = GOOGLE_SERVICE_ACCOUNT_FILE,
+                stub_dir: Optional[str] = None):
+    """stub_dir があれば StubClient、無ければサービスアカウントで gspread クライアントを作る。"""
+    if stub_dir:
+        return StubClient.from_dir(stub_dir)
+    if not service_account_file:
+        raise ValueError("A service account file is required (set GOOGLE_SERVICE_ACCOUNT_FILE)")
+    return authorize(service_account_file)
+
+
+def load_form_inputs(profiler: RunProfiler = None,
+                     export_csv: bool = FORM_EXPORT_CSV,
+                     stub_dir: Optional[str] = FORM_STUB_DIR,
+                     out_dir: str = FORM_AUDIT_DIR,
+                     cache_dir: Optional[str] = FORM_INPUT_CACHE_DIR,
+                     incremental: bool = FORM_INCREMENTAL_SYNC,
+                     id_registry_file: Optional[str] = FORM_ID_REGISTRY_FILE) -> Dict[str, Any]:
+    """
+    フォームを取り込んで main.load_inputs と同じ dict を返す (main.py の INPUT_SOURCE = "forms")。
+    フォームから作らない subjects / campaign / constraint_weights / solver_params は DATA_DIR の CSV を読む。
+    export_csv=True なら生成した CSV を監査用に out_dir に書く (ソルバーはそれを読まない)。
+    cache_dir は google_api_data.py の CLI とは別にし、ID 台帳は CLI と同じものを使う (同じ人は同じ ID)。
+    incremental=True なら前回からの差分だけを取り込む (retrieve_forms)。
+    """
+    profiler = profiler or NullProfiler()
+    with profiler.phase("fetch_forms"):
+        if stub_dir:
+            sources = form_sources("teacher", "student")
+        else:
+            sources = form_sources()
+        sheet_values = retrieve_forms(open_client(stub_dir=stub_dir), sources, cache_dir, incremental)
+    with profiler.phase("form_pipeline"):
+        result = run_pipeline(sheet_values, out_dir, cache_dir, export_csv=export_csv,
+                              id_registry_file=id_registry_file)
+    with profiler.phase("load_static_inputs"):
+        subjects = load_subjects(SUBJECTS_CSV)
+        campaigns = load_campaigns(CAMPAIGN_CSV)
+        constraint_weights = load_constraint_weights(CONSTRAINT_WEIGHTS_CSV)
+        solver_params = load_solver_params(SOLVER_PARAMS_CSV, SOLVER_PARAMS)
+    with profiler.phase("build_inputs_from_forms"):
+        return build_inputs(result["rows"], subjects, campaigns, constraint_weights, solver_params)
+
+
+# ------------------------------------------------------------
+# CLI
+# ------------------------------------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate the input CSVs from the Google Form responses.")
+    parser.add_argument("--service-account", default=GOOGLE_SERVICE_ACCOUNT_FILE,
+                        help="サービスアカウントの JSON (省略時は環境変数 GOOGLE_SERVICE_ACCOUNT_FILE)")
+    parser.add_argument("--teacher-sheet", default=None, help="教師フォームのスプレッドシートの URL かキー")
+    parser.add_argument("--student-sheet", default=None, help="生徒フォームのスプレッドシートの URL かキー")
+    parser.add_argument("--stub-dir", default=None,
+                        help="シートの代わりに <dir>/teacher.csv, <dir>/student.csv を読む (オフライン)")
+    parser.add_argument("--offline", action="store_true", help="取り込まずに前回取り込んだ回答を使う")
+    parser.add_argument("--out-dir", default=DATA_DIR)
+    parser.add_argument("--cache-dir", default=FORM_PIPELINE_CACHE_DIR)
+    parser.add_argument("--id-registry", default=None,
+                        help="ID 台帳の JSON (省略時は <out-dir>/id_registry.json)")
+    parser.add_argument("--force", action="store_true", help="キャッシュを無視して全段を作り直す")
+    parser.add_argument("--incremental", action=argparse.BooleanOptionalAction, default=FORM_INCREMENTAL_SYNC,
+                        help="前回取り込んだ回答との差分 (新しい行・タイムスタンプが変わった行) だけを取り込む")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=LOG_LEVEL,
+        format="%(asctime)s [%(levelname)s] %(name)s - %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S"
+    )
+
+    cache = StageCache(args.cache_dir)
+    if args.offline:
+        if cache.entry("teacher_raw") is None or cache.entry("student_raw") is None:
+            parser.error(f"--offline: no fetched responses in {args.cache_dir}")
+        sheet_values = {"teacher": cache.load("teacher_raw"), "student": cache.load("student_raw")}
+    else:
+        if args.stub_dir:
+            sources = form_sources(args.teacher_sheet or "teacher", args.student_sheet or "student")
+        else:
+            if not args.service_account:
+                parser.error("--service-account (or GOOGLE_SERVICE_ACCOUNT_FILE) is required")
+            sources = form_sources(args.teacher_sheet or TEACHER_FORM_SHEET,
+                                   args.student_sheet or STUDENT_FORM_SHEET)
+        sheet_values = retrieve_forms(open_client(args.service_account, args.stub_dir), sources,
+                                      args.cache_dir, args.incremental)
 
-print("Regular classes CSV generated successfully!")
+    run_pipeline(sheet_values, args.out_dir, args.cache_dir, args.force,
+                 id_registry_file=args.id_registry or registry_path(args.out_dir))
 
 
+if __name__ == "__main__":
+    main()
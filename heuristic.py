@@ -0,0 +1,382 @@
+# heuristic.py
+#
+# CP-SAT を使わない近似解法。プレビュー、CP-SAT では重すぎる大規模キャンペーン、
+# CP-SAT のヒント (solve_shifts の hint_assignment) に使う。
+#   1) 貪欲法: 候補の少ない生徒 (とレギュラー授業の継続) から順に、目的関数の増分が最大の
+#      (教師, コマ) を割り当てる。増分には2名ボーナス・同学年ボーナスが入るので、
+#      1名だけの教師コマに同じ学年の生徒を足す割当が自然に選ばれる
+#   2) min_classes の修復: 出勤したのに min_classes に届かない教師は追加で埋めるか、全部外す
+#   3) 局所探索: 割当の削除・付け替え・追加で目的関数が改善しなくなるまで (または時間切れまで) 続ける
+# 目的関数は solve_shifts と同じ項・同じ重みで数える (scheduleChangePenalty は除く)。
+
+import logging
+import random
+import time
+from collections import defaultdict
+from typing import Dict, List, Any, Set, Tuple, Iterable
+
+from models import Teacher, Student, TimeSlot, Campaign, RegularClass, Shift, Subject, mask_indices
+from solver_cp_sat import generate_candidates, shifts_from_assignment
+from profiling import RunProfiler, NullProfiler
+
+logger = logging.getLogger(__name__)
+
+Key = Tuple[str, str, str, str]  # (t_id, s_id, subj_id, ts_id)
+
+
+class ScheduleState:
+    """
+    割当 (t_id, s_id, subj_id, ts_id) の集合と、目的関数の増分計算に必要な集計を持つ。
+    delta_add / delta_remove は solve_shifts の目的関数の変化量を O(近傍のコマ数) で返す。
+    """
+    def __init__(self,
+                 teachers: Dict[str, Teacher],
+                 students: Dict[str, Student],
+                 timeslots: Dict[str, TimeSlot],
+                 regular_classes: Dict[str, RegularClass],
+                 campaign_id: str,
+                 constraint_weights: Dict[str, float]):
+        self.teachers = teachers
+        self.students = students
+        w = constraint_weights
+        self.w_two = w.get("maxTwoStudentsBonus", 0)
+        self.w_same_grade = w.get("sameGradeBonus", 0)
+        self.w_continuity = w.get("regularClassContinuityBonus", 0)
+        self.w_teacher_gap = w.get("teacherGapPenalty", 0)
+        self.w_student_gap = w.get("studentGapPenalty", 0)
+        self.w_single = w.get("singleStudentPenalty", 0)
+        self.w_shortage = w.get("shortagePenalty", 0)
+        self.w_desired = w.get("teacherDesiredPenalty", 0)
+
+        target = [ts for ts in timeslots.values() if ts.campaign_id == campaign_id]
+        self.ts_by_index = {ts.index: ts for ts in target}
+        self.campaign_mask = 0
+        for ts in target:
+            self.campaign_mask |= 1 << ts.index
+
+        self.teacher_conflict_mask = defaultdict(int)
+        self.continuity = set()
+        for rc in regular_classes.values():
+            if rc.timeslot_id in timeslots:
+                self.teacher_conflict_mask[rc.teacher_id] |= 1 << timeslots[rc.timeslot_id].index
+            for st_id in rc.enrolled_student_ids:
+                self.continuity.add((st_id, rc.teacher_id, rc.subject.subject_id))
+
+        # ギャップの判定に使う前後のコマ (solve_shifts と同じく 空き & キャンペーン内 を日付ごとに period 順)
+        self.student_gap_weight = {
+            s_id: self.w_student_gap * (2 if s_obj.gap_preference == "NoGapPreferred" else 1)
+            for s_id, s_obj in students.items()}
+        self.grade = {s_id: s_obj.grade for s_id, s_obj in students.items()}
+        self.teacher_neighbors = self._neighbors(teachers, self.w_teacher_gap)
+        self.student_neighbors = self._neighbors(students, self.w_student_gap)
+
+        self.assignment: Dict[Key, None] = {}          # 追加順を保つ集合
+        self.remaining = {(s_id, subj_id): req
+                          for s_id, s_obj in students.items()
+                          for subj_id, req in s_obj.requirements.items() if req > 0}
+        self.load = defaultdict(int)                     # 教師のコマ数 (sum_x_t)
+        self.teacher_ts = defaultdict(int)               # (t_id, ts_id) -> 生徒数
+        self.same_grade = defaultdict(int)               # (t_id, ts_id, subj_id, grade) -> 生徒数
+        self.student_busy = set()                        # (s_id, ts_id)
+
+    def _neighbors(self, people, weight):
+        neighbors = defaultdict(list)
+        if not weight:
+            return neighbors
+        for p_id, p_obj in people.items():
+            by_date = defaultdict(list)
+            for ts_idx in mask_indices(p_obj.availability_mask & self.campaign_mask):
+                ts = self.ts_by_index[ts_idx]
+                by_date[ts.date].append(ts)
+            for ts_list in by_date.values():
+                ts_list.sort(key=lambda ts: ts.period_index)
+                for a, b in zip(ts_list, ts_list[1:]):
+                    neighbors[(p_id, a.timeslot_id)].append(b.timeslot_id)
+                    neighbors[(p_id, b.timeslot_id)].append(a.timeslot_id)
+        return neighbors
+
+    # ---------- 判定 ----------
+    def can_add(self, key: Key) -> bool:
+        t_id, s_id, subj_id, ts_id = key
+        return (self.remaining.get((s_id, subj_id), 0) > 0
+                and self.teacher_ts.get((t_id, ts_id), 0) < 2
+                and (s_id, ts_id) not in self.student_busy
+                and key not in self.assignment)
+
+    def keeps_min_classes(self, t_id: str, change: int) -> bool:
+        """load[t_id] を change だけ変えても 0 か min_classes 以上に収まるか。"""
+        new_load = self.load[t_id] + change
+        return new_load == 0 or new_load >= self.teachers[t_id].min_classes
+
+    # ---------- 増分 ----------
+    def delta_add(self, key: Key) -> float:
+        """key を追加したときの目的関数の変化量 (can_add が真である前提)。"""
+        t_id, s_id, subj_id, ts_id = key
+        delta = self.w_shortage
+        desired = self.teachers[t_id].desired_shift_count
+        load = self.load[t_id]
+        delta += self.w_desired * (abs(load - desired) - abs(load + 1 - desired))
+
+        teacher_ts = self.teacher_ts
+        count = teacher_ts.get((t_id, ts_id), 0)
+        if count == 0:
+            delta -= self.w_single
+            # 前後のコマが埋まっていればギャップが1つ減り、空いていれば1つ増える
+            for n_ts in self.teacher_neighbors.get((t_id, ts_id), ()):
+                delta += self.w_teacher_gap if teacher_ts.get((t_id, n_ts), 0) else -self.w_teacher_gap
+        else:
+            delta += self.w_single + self.w_two
+        if self.w_same_grade and self.same_grade.get((t_id, ts_id, subj_id, self.grade[s_id]), 0) == 1:
+            delta += self.w_same_grade
+        if (s_id, t_id, subj_id) in self.continuity:
+            delta += self.w_continuity
+
+        neighbors = self.student_neighbors.get((s_id, ts_id))
+        if neighbors:
+            s_weight = self.student_gap_weight[s_id]
+            busy = self.student_busy
+            for n_ts in neighbors:
+                delta += s_weight if (s_id, n_ts) in busy else -s_weight
+        return delta
+
+    def delta_remove(self, key: Key) -> float:
+        """key を外したときの目的関数の変化量。"""
+        self.remove(key)
+        delta = -self.delta_add(key)
+        self.add(key)
+        return delta
+
+    # ---------- 更新 ----------
+    def add(self, key: Key):
+        t_id, s_id, subj_id, ts_id = key
+        self.assignment[key] = None
+        self.remaining[(s_id, subj_id)] -= 1
+        self.load[t_id] += 1
+        self.teacher_ts[(t_id, ts_id)] += 1
+        self.same_grade[(t_id, ts_id, subj_id, self.grade[s_id])] += 1
+        self.student_busy.add((s_id, ts_id))
+
+    def remove(self, key: Key):
+        t_id, s_id, subj_id, ts_id = key
+        del self.assignment[key]
+        self.remaining[(s_id, subj_id)] += 1
+        self.load[t_id] -= 1
+        self.teacher_ts[(t_id, ts_id)] -= 1
+        self.same_grade[(t_id, ts_id, subj_id, self.grade[s_id])] -= 1
+        self.student_busy.discard((s_id, ts_id))
+
+    # ---------- 目的関数 ----------
+    def objective(self) -> float:
+        """solve_shifts の目的関数 (scheduleChangePenalty を除く) の値。"""
+        total = -self.w_shortage * sum(self.remaining.values())
+        for t_id, t_obj in self.teachers.items():
+            total -= self.w_desired * abs(self.load[t_id] - t_obj.desired_shift_count)
+        for count in self.teacher_ts.values():
+            if count == 2:
+                total += self.w_two
+            elif count == 1:
+                total -= self.w_single
+        total += self.w_same_grade * sum(1 for k in self.same_grade.values() if k == 2)
+        total += self.w_continuity * sum(1 for (t_id, s_id, subj_id, _) in self.assignment
+                                         if (s_id, t_id, subj_id) in self.continuity)
+        for (t_id, ts_id), n_list in self.teacher_neighbors.items():
+            a = self.teacher_ts[(t_id, ts_id)] > 0
+            for n_ts in n_list:
+                if a != (self.teacher_ts[(t_id, n_ts)] > 0):
+                    total -= self.w_teacher_gap / 2  # 両側から1回ずつ数えるので半分
+        for (s_id, ts_id), n_list in self.student_neighbors.items():
+            a = (s_id, ts_id) in self.student_busy
+            for n_ts in n_list:
+                if a != ((s_id, n_ts) in self.student_busy):
+                    total -= self.student_gap_weight[s_id] / 2
+        return total
+
+    def shortage(self) -> Dict[Tuple[str, str], int]:
+        return dict(self.remaining)
+
+
+def evaluate_assignment(assignment: Iterable[Key],
+                        teachers: Dict[str, Teacher],
+                        students: Dict[str, Student],
+                        timeslots: Dict[str, TimeSlot],
+                        regular_classes: Dict[str, RegularClass],
+                        campaign_id: str,
+                        constraint_weights: Dict[str, float]) -> float:
+    """割当集合の目的関数値 (solve_shifts の ObjVal と同じ尺度、scheduleChangePenalty を除く)。"""
+    state = ScheduleState(teachers, students, timeslots, regular_classes, campaign_id, constraint_weights)
+    for key in assignment:
+        state.add(key)
+    return state.objective()
+
+
+def assignment_from_shifts(shifts: List[Shift]) -> Set[Key]:
+    """Shift のリストを (t_id, s_id, subj_id, ts_id) の集合に戻す。"""
+    return {(sh.teacher.teacher_id, st.student_id, sh.subject.subject_id, sh.timeslot.timeslot_id)
+            for sh in shifts for st in sh.assigned_students}
+
+
+def _best_option(state: ScheduleState, options, allow_new_teacher=True):
+    """options の中で追加可能かつ増分が最大のもの (key, delta) を返す。"""
+    best_key, best_delta = None, None
+    for key in options:
+        if not state.can_add(key):
+            continue
+        if not allow_new_teacher and not state.keeps_min_classes(key[0], +1):
+            continue
+        delta = state.delta_add(key)
+        if best_delta is None or delta > best_delta:
+            best_key, best_delta = key, delta
+    return best_key, best_delta
+
+
+def _construct(state: ScheduleState, options_by_req, banned_teachers: Set[str]):
+    """候補の少ない要求から順に、増分が最大の候補で要求数まで埋める。"""
+    def priority(req):
+        s_id, subj_id = req
+        has_regular = any((s_id, key[0], subj_id) in state.continuity for key in options_by_req[req])
+        return (not has_regular, len(options_by_req[req]) / state.remaining[req])
+
+    for req in sorted((r for r in state.remaining if state.remaining[r] > 0 and options_by_req.get(r)),
+                      key=priority):
+        options = [key for key in options_by_req[req] if key[0] not in banned_teachers]
+        while state.remaining[req] > 0:
+            key, _ = _best_option(state, options)
+            if key is None:
+                break
+            state.add(key)
+
+
+def _repair_min_classes(state: ScheduleState, options_by_teacher, options_by_req):
+    """出勤したのに min_classes に届かない教師を、追加で埋めるか全部外すかして直す。"""
+    banned = set()
+    while True:
+        short_teachers = [t_id for t_id, load in state.load.items()
+                          if 0 < load < state.teachers[t_id].min_classes]
+        if not short_teachers:
+            return
+        for t_id in short_teachers:
+            while state.load[t_id] < state.teachers[t_id].min_classes:
+                key, _ = _best_option(state, options_by_teacher.get(t_id, []))
+                if key is None:
+                    break
+                state.add(key)
+            if 0 < state.load[t_id] < state.teachers[t_id].min_classes:
+                for key in [k for k in state.assignment if k[0] == t_id]:
+                    state.remove(key)
+                banned.add(t_id)
+        # 外した分を他の教師で埋め直す
+        _construct(state, options_by_req, banned)
+
+
+def _local_search(state: ScheduleState, options_by_req, deadline: float, rng: random.Random) -> int:
+    """削除・付け替え・追加の first-improvement。改善した手の数を返す。"""
+    moves = 0
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        assigned = list(state.assignment)
+        rng.shuffle(assigned)
+        for key in assigned:
+            if time.perf_counter() >= deadline:
+                break
+            if key not in state.assignment:
+                continue
+            t_id, s_id, subj_id, ts_id = key
+            if not state.keeps_min_classes(t_id, -1):
+                continue
+            gain_remove = state.delta_remove(key)
+            state.remove(key)
+            new_key, gain_add = _best_option(state, options_by_req[(s_id, subj_id)], allow_new_teacher=False)
+            if new_key is not None and new_key != key and gain_add > 0 and gain_remove + gain_add > 1e-9:
+                state.add(new_key)        # 付け替え
+            elif gain_remove > 1e-9:
+                pass                      # 削除
+            else:
+                state.add(key)            # 元に戻す
+                continue
+            moves += 1
+            improved = True
+
+        reqs = [req for req, rem in state.remaining.items() if rem > 0 and options_by_req.get(req)]
+        rng.shuffle(reqs)
+        for req in reqs:
+            if time.perf_counter() >= deadline:
+                break
+            while state.remaining[req] > 0:
+                key, gain = _best_option(state, options_by_req[req], allow_new_teacher=False)
+                if key is None or gain <= 1e-9:
+                    break
+                state.add(key)
+                moves += 1
+                improved = True
+    return moves
+
+
+def solve_shifts_greedy(teachers: Dict[str, Teacher],
+                        students: Dict[str, Student],
+                        timeslots: Dict[str, TimeSlot],
+                        campaigns: Dict[str, Campaign],
+                        regular_classes: Dict[str, RegularClass],
+                        subjects: Dict[str, Subject],
+                        campaign_id: str,
+                        constraint_weights: Dict[str, float],
+                        solver_params: Dict[str, Any] = None,
+                        solve_stats: Dict[str, Any] = None,
+                        profiler: RunProfiler = None,
+                        time_limit: float = 1.0,
+                        seed: int = 0):
+    """
+    solve_shifts と同じ引数・同じ戻り値 (List[Shift], shortage dict) の近似解法。
+    solver_params は random_seed だけ見る (CP-SAT と同じパラメータファイルを渡せるように)。
+    time_limit: 局所探索の打ち切り時間 (秒)
+    solve_stats: status="HEURISTIC" / objective / wall_time / stop_reason / local_search_moves を書き込む
+    """
+    start = time.perf_counter()
+    profiler = profiler or NullProfiler()
+    if solver_params and solver_params.get("random_seed") is not None:
+        seed = int(solver_params["random_seed"])
+    rng = random.Random(seed)
+
+    state = ScheduleState(teachers, students, timeslots, regular_classes, campaign_id, constraint_weights)
+    if not state.ts_by_index:
+        logger.warning(f"No timeslots for campaign_id={campaign_id}")
+        return [], {}
+
+    with profiler.phase("greedy/candidates"):
+        teacher_subject_pairs = list(dict.fromkeys(
+            (t_id, sbj.subject_id) for t_id, t_obj in teachers.items() for sbj in t_obj.teachable_subjects))
+        students_by_subject = defaultdict(list)
+        for (s_id, subj_id) in state.remaining:
+            students_by_subject[subj_id].append(s_id)
+        teacher_masks = {t_id: t_obj.availability_mask & state.campaign_mask & ~state.teacher_conflict_mask[t_id]
+                         for t_id, t_obj in teachers.items()}
+        options_by_req = defaultdict(list)
+        options_by_teacher = defaultdict(list)
+        for key in generate_candidates(teacher_subject_pairs, students_by_subject,
+                                       teacher_masks, students, state.ts_by_index):
+            options_by_req[(key[1], key[2])].append(key)
+            options_by_teacher[key[0]].append(key)
+
+    with profiler.phase("greedy/construct"):
+        _construct(state, options_by_req, set())
+        _repair_min_classes(state, options_by_teacher, options_by_req)
+    greedy_objective = state.objective()
+
+    with profiler.phase("greedy/local_search"):
+        deadline = time.perf_counter() + time_limit
+        moves = _local_search(state, options_by_req, deadline, rng)
+    timed_out = time.perf_counter() >= deadline
+
+    objective = state.objective()
+    wall_time = time.perf_counter() - start
+    logger.info(f"Greedy solution: ObjVal={objective} (construction {greedy_objective}, "
+                f"{moves} local search moves, {wall_time:.2f}s)")
+    stop_reason = "time limit reached" if timed_out else "local optimum"
+    if solve_stats is not None:
+        solve_stats.update(status="HEURISTIC", objective=objective, wall_time=wall_time,
+                           stop_reason=stop_reason, local_search_moves=moves)
+    profiler.set("solver", {"status": "HEURISTIC", "objective": objective, "wall_time": wall_time,
+                            "stop_reason": stop_reason, "local_search_moves": moves})
+
+    shifts = shifts_from_assignment(state.assignment, teachers, students, timeslots, subjects)
+    return shifts, state.shortage()
@@ -0,0 +1,85 @@
+# id_registry.py
+#
+# フォームから作る ID (教師 T{n} / 生徒 S{n} / タイムスロット TS{n}) の台帳。
+# 名前 (タイムスロットは日付と時限) → ID を JSON に残し、取り込みのたびに読み込んで新しいものだけ番号を足す。
+# 回答が増えたり日付が増えたりしても既存の ID は変わらないので、段のキャッシュ・差分更新・
+# 前回スケジュールからのヒント (warm start) が次の取り込みでもそのまま使える。
+# 一度付けた ID は、その人がフォームから消えても台帳に残す (戻ってきたら同じ ID になる)。
+
+import json
+import logging
+import os
+from typing import Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+# 台帳の種類 → ID の接頭辞
+ID_PREFIXES = {"teacher": "T", "student": "S", "timeslot": "TS"}
+
+REGISTRY_VERSION = 1
+
+
+def timeslot_key(date: str, period_label: str) -> str:
+    """タイムスロットの台帳のキー ("2025-08-01|2限")"""
+    return f"{date}|{period_label}"
+
+
+class IdRegistry:
+    """
+    {種類: {キー: ID}} の台帳。path が None ならファイルに残さない (毎回 1 から振るのと同じ)。
+    壊れた台帳を黙って作り直すと全員の ID が振り直しになるので、読めなければ ValueError にする。
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.ids = {kind: {} for kind in ID_PREFIXES}
+        self.dirty = False
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                for kind in ID_PREFIXES:
+                    self.ids[kind] = dict(data.get(kind, {}))
+            except Exception as e:
+                raise ValueError(f"ID registry {path} is unreadable: {e}") from e
+        self._next = {kind: self._max_number(kind) + 1 for kind in ID_PREFIXES}
+
+    def _max_number(self, kind: str) -> int:
+        prefix = ID_PREFIXES[kind]
+        numbers = [int(i[len(prefix):]) for i in self.ids[kind].values()
+                   if i.startswith(prefix) and i[len(prefix):].isdigit()]
+        return max(numbers, default=0)
+
+    def assign(self, kind: str, keys: Iterable[str]) -> Dict[str, str]:
+        """keys (並び順) の ID を返す。台帳にないキーには、並び順に続きの番号を振って台帳に足す。"""
+        known = self.ids[kind]
+        result = {}
+        added = 0
+        for key in keys:
+            if key not in known:
+                known[key] = f"{ID_PREFIXES[kind]}{self._next[kind]}"
+                self._next[kind] += 1
+                added += 1
+            result[key] = known[key]
+        if added:
+            self.dirty = True
+            logger.info(f"ID registry: assigned {added} new {kind} IDs")
+        return result
+
+    def agrees(self, kind: str, ids: Dict[str, str]) -> bool:
+        """ids (前回の assign の結果) がすべて台帳と同じなら真。"""
+        known = self.ids[kind]
+        return all(known.get(key) == value for key, value in ids.items())
+
+    def save(self):
+        """新しい ID を振っていれば path に書く (一時ファイルに書いてから置き換える)。"""
+        if not self.path or not self.dirty:
+            return
+        dir_path = os.path.dirname(self.path)
+        if dir_path:
+            os.makedirs(dir_path, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": REGISTRY_VERSION, **self.ids}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
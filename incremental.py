@@ -0,0 +1,110 @@
+# incremental.py
+
+import json
+import logging
+import os
+from typing import Dict, Set, Tuple, Optional
+from models import Teacher, Student, TimeSlot, RegularClass
+
+logger = logging.getLogger(__name__)
+
+
+def snapshot_inputs(teachers: Dict[str, Teacher],
+                    students: Dict[str, Student],
+                    timeslots: Dict[str, TimeSlot],
+                    regular_classes: Dict[str, RegularClass],
+                    constraint_weights: Dict[str, float],
+                    campaign_id: str) -> dict:
+    """
+    前回実行時の入力と比較するためのスナップショット (JSON 化できる dict) を作る。
+    timeslot は index ではなく timeslot_id で持つ (CSV の行順が変わっても比較できるように)。
+    目的関数の重みと、解くキャンペーン (とそのコマ) も入れる。
+    """
+    rc_by_teacher = {}
+    for rc_id, rc in regular_classes.items():
+        rc_by_teacher.setdefault(rc.teacher_id, []).append(
+            [rc.subject.subject_id, rc.timeslot_id, sorted(rc.enrolled_student_ids)])
+
+    snap = {
+        "campaign": {
+            "campaign_id": campaign_id,
+            "timeslots": sorted(ts_id for ts_id, ts in timeslots.items() if ts.campaign_id == campaign_id),
+        },
+        "constraint_weights": dict(sorted(constraint_weights.items())),
+        "timeslots": {ts_id: [ts.date, ts.period_index, ts.campaign_id]
+                      for ts_id, ts in timeslots.items()},
+        "teachers": {},
+        "students": {},
+    }
+    for t_id, t in teachers.items():
+        snap["teachers"][t_id] = {
+            "desired_shift_count": t.desired_shift_count,
+            "min_classes": t.min_classes,
+            "subjects": sorted(sbj.subject_id for sbj in t.teachable_subjects),
+            "available": sorted(ts.timeslot_id for ts in t.available_timeslots),
+            "regular_classes": sorted(rc_by_teacher.get(t_id, [])),
+        }
+    for s_id, s in students.items():
+        snap["students"][s_id] = {
+            "grade": s.grade,
+            "gap_preference": s.gap_preference,
+            "requirements": dict(sorted(s.requirements.items())),
+            "available": sorted(ts.timeslot_id for ts in s.available_timeslots),
+        }
+    return snap
+
+
+def save_snapshot(snap: dict, json_path: str):
+    dir_path = os.path.dirname(json_path)
+    if dir_path:
+        os.makedirs(dir_path, exist_ok=True)
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(snap, f, ensure_ascii=False)
+    logger.info(f"Input snapshot saved to {json_path}")
+
+
+def load_snapshot(json_path: str) -> Optional[dict]:
+    if not os.path.exists(json_path):
+        return None
+    try:
+        with open(json_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        logger.error(f"Error reading input snapshot from {json_path}: {e}")
+        return None
+
+
+def diff_inputs(old: dict, new: dict) -> Optional[Tuple[Set[str], Set[str]]]:
+    """
+    前回と今回のスナップショットを比べ、変更のあった (teacher_ids, student_ids) を返す。
+    今回いなくなった教師・生徒も含める (前回の相手を affected_neighborhood で解き直せるように)。
+    timeslot・解くキャンペーン・目的関数の重みが変わった場合は、変更のない人の割当も最適でなくなり得るので
+    None (= 全体を解き直す)。
+    """
+    for key in ("campaign", "constraint_weights", "timeslots"):
+        if old.get(key) != new[key]:
+            return None
+    old_t = old.get("teachers", {})
+    old_s = old.get("students", {})
+    changed_teachers = {t_id for t_id, v in new["teachers"].items() if old_t.get(t_id) != v}
+    changed_students = {s_id for s_id, v in new["students"].items() if old_s.get(s_id) != v}
+    changed_teachers |= old_t.keys() - new["teachers"].keys()
+    changed_students |= old_s.keys() - new["students"].keys()
+    return changed_teachers, changed_students
+
+
+def affected_neighborhood(changed_teachers: Set[str],
+                          changed_students: Set[str],
+                          previous_assignment: Set[Tuple[str, str, str, str]]) -> Tuple[Set[str], Set[str]]:
+    """
+    変更のあった教師・生徒に加え、前回その相手だった生徒・教師も解き直しの対象に含める。
+    (変更された人の授業を組み替えるには、相手側のコマも動かせる必要があるため)
+    """
+    teachers = set(changed_teachers)
+    students = set(changed_students)
+    for (t_id, s_id, subj_id, ts_id) in previous_assignment:
+        if t_id in changed_teachers:
+            students.add(s_id)
+        if s_id in changed_students:
+            teachers.add(t_id)
+    return teachers, students
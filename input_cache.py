@@ -0,0 +1,85 @@
+# input_cache.py
+
+import hashlib
+import logging
+import os
+import pickle
+from typing import Any, Callable, List
+
+logger = logging.getLogger(__name__)
+
+# キャッシュ形式を変えたら上げる (古いキャッシュは読まずに作り直す)
+CACHE_FORMAT_VERSION = 2
+
+# キャッシュの中身を作るコード (CSV の読み込みとオブジェクトのつなぎ込みは reader.load_inputs_dir、
+# クラスは models.py)。中身のハッシュもキーに入れるので、読み込みやクラスを変えたときは
+# CACHE_FORMAT_VERSION を上げ忘れても古いキャッシュを読まない
+_HERE = os.path.dirname(os.path.abspath(__file__))
+CACHE_CODE_PATHS = [os.path.join(_HERE, "reader.py"), os.path.join(_HERE, "models.py")]
+
+
+def file_signature(paths: List[str], verify_hash: bool = False) -> list:
+    """
+    各ファイルの (path, size, mtime_ns[, sha1]) のリスト。存在しないファイルは None。
+    verify_hash=True なら中身のハッシュも含める (mtime が当てにならない環境向け)。
+    """
+    sig = []
+    for path in paths:
+        if not os.path.exists(path):
+            sig.append((path, None))
+            continue
+        st = os.stat(path)
+        entry = [path, st.st_size, st.st_mtime_ns]
+        if verify_hash:
+            with open(path, "rb") as f:
+                entry.append(hashlib.sha1(f.read()).hexdigest())
+        sig.append(tuple(entry))
+    return sig
+
+
+def code_digest(paths: List[str]) -> str:
+    """paths の中身をまとめた sha1 (存在しないファイルは飛ばす)"""
+    h = hashlib.sha1()
+    for path in paths:
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                h.update(f.read())
+    return h.hexdigest()
+
+
+def load_cached(cache_path: str,
+                source_paths: List[str],
+                build: Callable[[], Any],
+                extra_key: Any = None,
+                verify_hash: bool = False) -> Any:
+    """
+    source_paths のシグネチャ (+ extra_key と CACHE_CODE_PATHS のハッシュ) がキャッシュと一致すれば
+    キャッシュを1回の読み込みで返す。
+    一致しない・読めない場合は build() を呼んで結果を保存し、それを返す。
+    """
+    key = (CACHE_FORMAT_VERSION, code_digest(CACHE_CODE_PATHS),
+           file_signature(source_paths, verify_hash), extra_key)
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, "rb") as f:
+                cached_key, data = pickle.load(f)
+            if cached_key == key:
+                logger.info(f"Loaded inputs from cache {cache_path}")
+                return data
+            logger.info("Input files changed since the cache was written. Re-parsing CSVs.")
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable cache {cache_path}: {e}")
+
+    data = build()
+    dir_path = os.path.dirname(cache_path)
+    if dir_path:
+        os.makedirs(dir_path, exist_ok=True)
+    try:
+        tmp_path = cache_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump((key, data), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+        logger.info(f"Input cache written to {cache_path}")
+    except Exception as e:
+        logger.warning(f"Could not write input cache {cache_path}: {e}")
+    return data
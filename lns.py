@@ -0,0 +1,276 @@
+# lns.py
+#
+# Large Neighborhood Search: 1つの CP-SAT モデルでは収束しない大きなキャンペーン向け。
+# 現在の解 (incumbent) を持ち、近傍 (1日 / 1教師 / 学年帯 / 1科目) の x だけを自由にして
+# 残りを incumbent に固定した solve_shifts を繰り返し解く。目的関数は solve_shifts と同じ。
+# 教師も生徒も共有しない近傍どうしは互いに影響しないので、プロセス並列に解いてまとめて取り込む。
+
+import logging
+import random
+import re
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Any, Set, Tuple, Callable
+
+from models import Teacher, Student, TimeSlot, Campaign, RegularClass, Shift, Subject
+from solver_cp_sat import solve_shifts, generate_candidates, shifts_from_assignment, split_workers
+from heuristic import ScheduleState, solve_shifts_greedy, assignment_from_shifts
+from profiling import RunProfiler, NullProfiler
+
+logger = logging.getLogger(__name__)
+
+NEIGHBORHOOD_KINDS = ("date", "teacher", "grade", "subject")
+
+# ワーカープロセス内で共有する入力 (_init_worker で設定)
+_shared_inputs: Dict[str, Any] = {}
+
+
+def grade_band(grade: str) -> str:
+    """学年から学年帯を返す ("Middle2" -> "Middle")。"""
+    return re.sub(r"\d+$", "", grade or "")
+
+
+def neighborhood_filter(kind: str, value: str,
+                        students: Dict[str, Student],
+                        timeslots: Dict[str, TimeSlot]) -> Callable[[Tuple[str, str, str, str]], bool]:
+    """近傍 (kind, value) に入る x のキー (t_id, s_id, subj_id, ts_id) なら真を返す関数。"""
+    if kind == "date":
+        return lambda key: timeslots[key[3]].date == value
+    if kind == "teacher":
+        return lambda key: key[0] == value
+    if kind == "grade":
+        return lambda key: grade_band(students[key[1]].grade) == value
+    if kind == "subject":
+        return lambda key: key[2] == value
+    raise ValueError(f"Unknown neighborhood kind: {kind}")
+
+
+def _neighborhood_keys(key, students, timeslots, kinds):
+    t_id, s_id, subj_id, ts_id = key
+    values = {"date": timeslots[ts_id].date, "teacher": t_id,
+              "grade": grade_band(students[s_id].grade), "subject": subj_id}
+    return [(kind, values[kind]) for kind in kinds]
+
+
+def _init_worker(inputs: Dict[str, Any]):
+    global _shared_inputs
+    _shared_inputs = inputs
+
+
+def _solve_neighborhood(inputs: Dict[str, Any], kind: str, value: str,
+                        incumbent: Set[Tuple[str, str, str, str]], solver_params: Dict[str, Any]):
+    """近傍 (kind, value) を解き直し、近傍内の新しい割当を返す (解けなければ None)。"""
+    free = neighborhood_filter(kind, value, inputs["students"], inputs["timeslots"])
+    stats = {}
+    shifts, _ = solve_shifts(
+        teachers=inputs["teachers"],
+        students=inputs["students"],
+        timeslots=inputs["timeslots"],
+        campaigns=inputs["campaigns"],
+        regular_classes=inputs["regular_classes"],
+        subjects=inputs["subjects"],
+        campaign_id=inputs["campaign_id"],
+        constraint_weights=inputs["constraint_weights"],
+        solver_params=solver_params,
+        solve_stats=stats,
+        encoding=inputs["encoding"],
+        candidate_backend=inputs["candidate_backend"],
+        hint_assignment=incumbent,
+        free=free
+    )
+    if stats.get("status") not in ("OPTIMAL", "FEASIBLE"):
+        return kind, value, None
+    return kind, value, {key for key in assignment_from_shifts(shifts) if free(key)}
+
+
+def _solve_neighborhood_in_worker(kind, value, incumbent, solver_params):
+    return _solve_neighborhood(_shared_inputs, kind, value, incumbent, solver_params)
+
+
+def solve_shifts_lns(teachers: Dict[str, Teacher],
+                     students: Dict[str, Student],
+                     timeslots: Dict[str, TimeSlot],
+                     campaigns: Dict[str, Campaign],
+                     regular_classes: Dict[str, RegularClass],
+                     subjects: Dict[str, Subject],
+                     campaign_id: str,
+                     constraint_weights: Dict[str, float],
+                     solver_params: Dict[str, Any] = None,
+                     solve_stats: Dict[str, Any] = None,
+                     profiler: RunProfiler = None,
+                     initial_assignment: Set[Tuple[str, str, str, str]] = None,
+                     time_limit: float = 60.0,
+                     sub_time_limit: float = 5.0,
+                     kinds=NEIGHBORHOOD_KINDS,
+                     max_workers: int = 1,
+                     seed: int = 0,
+                     encoding: str = "reified",
+                     candidate_backend: str = "bitmask",
+                     on_improvement: Callable[[List[Shift], Dict, float], None] = None):
+    """
+    solve_shifts の LNS 版。戻り値の形は solve_shifts と同じ (shifts, shortage)。
+      1) 初期解: initial_assignment (無ければ heuristic.solve_shifts_greedy)
+      2) 近傍を1周ずつランダムな順に、教師・生徒を共有しないものを max_workers 個まで束ねて並列に解く
+      3) 解き直した近傍の割当を incumbent に差し替え、目的関数が良くなったものだけ残す
+      4) time_limit に達するか、1周して改善がなければ終了
+    sub_time_limit: 近傍1つあたりの CP-SAT の打ち切り時間 (solver_params の max_time_in_seconds を上書き)
+    max_workers   : 同時に解く近傍の数 (プロセス数)。CP-SAT のワーカーは split_workers でプロセスごとに割る
+    encoding / candidate_backend: 近傍の solve_shifts にそのまま渡す
+    solve_stats   : status="LNS" / objective / wall_time / stop_reason / iterations / history を書き込む。
+                    history は改善のたびの {"time", "objective", "neighborhood"}
+    on_improvement: 改善するたびに (shifts, shortage, objective) で呼ばれる
+    """
+    start = time.perf_counter()
+    profiler = profiler or NullProfiler()
+    rng = random.Random(seed)
+
+    state = ScheduleState(teachers, students, timeslots, regular_classes, campaign_id, constraint_weights)
+    if not state.ts_by_index:
+        logger.warning(f"No timeslots for campaign_id={campaign_id}")
+        return [], {}
+
+    # 近傍ごとの足跡 (x 候補に現れる教師・生徒)。足跡が重ならない近傍は同時に解いてよい
+    with profiler.phase("lns/neighborhoods"):
+        teacher_subject_pairs = list(dict.fromkeys(
+            (t_id, sbj.subject_id) for t_id, t_obj in teachers.items() for sbj in t_obj.teachable_subjects))
+        students_by_subject = defaultdict(list)
+        for (s_id, subj_id) in state.remaining:
+            students_by_subject[subj_id].append(s_id)
+        teacher_masks = {t_id: t_obj.availability_mask & state.campaign_mask & ~state.teacher_conflict_mask[t_id]
+                         for t_id, t_obj in teachers.items()}
+        candidates = set()
+        footprint_teachers = defaultdict(set)
+        footprint_students = defaultdict(set)
+        for key in generate_candidates(teacher_subject_pairs, students_by_subject,
+                                       teacher_masks, students, state.ts_by_index):
+            candidates.add(key)
+            for nb in _neighborhood_keys(key, students, timeslots, kinds):
+                footprint_teachers[nb].add(key[0])
+                footprint_students[nb].add(key[1])
+        neighborhoods = sorted(footprint_teachers)
+
+    with profiler.phase("lns/initial"):
+        if initial_assignment is None:
+            greedy_shifts, _ = solve_shifts_greedy(teachers, students, timeslots, campaigns, regular_classes,
+                                                   subjects, campaign_id, constraint_weights,
+                                                   solver_params=solver_params)
+            initial_assignment = assignment_from_shifts(greedy_shifts)
+        # 前回スケジュールなどを渡された場合、今回の入力で成り立たない割当は捨てる
+        dropped = 0
+        for key in sorted(initial_assignment):
+            if key in candidates and state.can_add(key):
+                state.add(key)
+            else:
+                dropped += 1
+        for t_id in [t_id for t_id, load in state.load.items() if 0 < load < teachers[t_id].min_classes]:
+            for key in [k for k in state.assignment if k[0] == t_id]:
+                state.remove(key)
+                dropped += 1
+        if dropped:
+            logger.info(f"LNS: dropped {dropped} initial assignments that are not valid for the current inputs")
+    objective = state.objective()
+    history = [{"time": time.perf_counter() - start, "objective": objective, "neighborhood": "initial"}]
+    logger.info(f"LNS: initial objective {objective}")
+    logger.info(f"LNS: {len(neighborhoods)} neighborhoods ({', '.join(kinds)}), "
+                f"{max_workers} workers, {sub_time_limit}s per neighborhood")
+
+    # 近傍の x はほとんど incumbent に固定されていて x のヒントだけで最初の解が出るので、
+    # complete_hint の前解きはしない (近傍ごとに払うと sub_time_limit の多くを使ってしまう)
+    sub_params = split_workers(solver_params, max_workers or 1)
+    sub_params["max_time_in_seconds"] = sub_time_limit
+    sub_params["hint_completion_time"] = 0
+    inputs = {"teachers": teachers, "students": students, "timeslots": timeslots, "campaigns": campaigns,
+              "regular_classes": regular_classes, "subjects": subjects, "campaign_id": campaign_id,
+              "constraint_weights": constraint_weights, "encoding": encoding,
+              "candidate_backend": candidate_backend}
+    pool = None
+    if max_workers and max_workers > 1:
+        pool = ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(inputs,))
+
+    iterations = 0
+    stop_reason = "no improving neighborhood"
+    try:
+        while True:
+            queue = list(neighborhoods)
+            rng.shuffle(queue)
+            improved_in_round = False
+            while queue:
+                if time.perf_counter() - start >= time_limit:
+                    break
+                # 教師・生徒を共有しない近傍を束ねる
+                batch, used_t, used_s = [], set(), set()
+                for nb in list(queue):
+                    if len(batch) >= max(1, max_workers or 1):
+                        break
+                    if footprint_teachers[nb] & used_t or footprint_students[nb] & used_s:
+                        continue
+                    batch.append(nb)
+                    used_t |= footprint_teachers[nb]
+                    used_s |= footprint_students[nb]
+                    queue.remove(nb)
+
+                incumbent = set(state.assignment)
+                with profiler.phase("lns/solve"):
+                    if pool is not None:
+                        futures = [pool.submit(_solve_neighborhood_in_worker, kind, value, incumbent, sub_params)
+                                   for kind, value in batch]
+                        results = [f.result() for f in futures]
+                    else:
+                        results = [_solve_neighborhood(inputs, kind, value, incumbent, sub_params)
+                                   for kind, value in batch]
+                iterations += len(batch)
+
+                for kind, value, new_part in results:
+                    if new_part is None:
+                        continue
+                    free = neighborhood_filter(kind, value, students, timeslots)
+                    old_part = [key for key in state.assignment if free(key)]
+                    if set(old_part) == new_part:
+                        continue
+                    for key in old_part:
+                        state.remove(key)
+                    for key in new_part:
+                        state.add(key)
+                    new_objective = state.objective()
+                    if new_objective > objective + 1e-9:
+                        elapsed = time.perf_counter() - start
+                        logger.info(f"LNS: objective {objective} -> {new_objective} at {elapsed:.1f}s "
+                                    f"({kind} {value})")
+                        objective = new_objective
+                        history.append({"time": elapsed, "objective": objective,
+                                        "neighborhood": f"{kind}:{value}"})
+                        improved_in_round = True
+                        if on_improvement is not None:
+                            shifts = shifts_from_assignment(state.assignment, teachers, students,
+                                                            timeslots, subjects)
+                            try:
+                                on_improvement(shifts, state.shortage(), objective)
+                            except Exception as e:
+                                logger.error(f"Error in on_improvement callback: {e}")
+                    else:
+                        # 良くならなければ元に戻す
+                        for key in new_part:
+                            state.remove(key)
+                        for key in old_part:
+                            state.add(key)
+            if time.perf_counter() - start >= time_limit:
+                stop_reason = "time limit reached"
+                break
+            if not improved_in_round:
+                break
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    wall_time = time.perf_counter() - start
+    logger.info(f"LNS finished: ObjVal={objective} after {iterations} neighborhood solves "
+                f"({stop_reason}, {wall_time:.1f}s)")
+    if solve_stats is not None:
+        solve_stats.update(status="LNS", objective=objective, wall_time=wall_time, stop_reason=stop_reason,
+                           iterations=iterations, history=history)
+    profiler.set("lns", {"objective": objective, "wall_time": wall_time, "stop_reason": stop_reason,
+                         "iterations": iterations, "history": history})
+
+    shifts = shifts_from_assignment(state.assignment, teachers, students, timeslots, subjects)
+    return shifts, state.shortage()
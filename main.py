@@ -4,34 +4,51 @@ import logging
 import sys
 import csv
 import os
+from typing import Dict, Any
 
 from config import (
     LOG_LEVEL, 
-    SUBJECTS_CSV,           # NEW
-    TEACHERS_CSV,
-    STUDENTS_CSV,
-    STUDENT_REQUIREMENTS_CSV,
-    TIMESLOTS_CSV,
-    TEACHER_AVAILABILITY_CSV,
-    STUDENT_AVAILABILITY_CSV,
-    REGULAR_CLASSES_CSV,
-    CONSTRAINT_WEIGHTS_CSV,
-    CAMPAIGN_CSV,
+    DATA_DIR,
+    SOLVER_PARAMS,
+    WARM_START,
+    PREVIOUS_SCHEDULE_CSV,
+    INCREMENTAL,
+    LAST_RUN_INPUTS_JSON,
+    DECOMPOSE_BY,
+    DECOMPOSE_WORKERS,
+    PRESOLVE_PRUNING,
+    RUN_REPORT_JSON,
+    INPUT_CACHE,
+    INPUT_CACHE_PATH,
+    INPUT_CACHE_VERIFY_HASH,
+    STREAM_SOLUTIONS,
+    STREAM_MIN_INTERVAL,
+    ENCODING,
+    CANDIDATE_BACKEND,
+    SOLVER_ENGINE,
+    GREEDY_HINTS,
+    GREEDY_TIME_LIMIT,
+    LNS_TIME_LIMIT,
+    LNS_SUB_TIME_LIMIT,
+    LNS_NEIGHBORHOODS,
+    LNS_WORKERS,
+    INPUT_SOURCE,
     OUTPUT_DIR
 )
 
-from reader import (
-    load_subjects,         # NEW
-    load_teachers, 
-    load_students,
-    load_student_requirements,
-    load_timeslots, 
-    load_campaigns,
-    load_availability, 
-    load_constraint_weights, 
-    load_regular_classes
-)
+from reader import INPUT_FILES, load_inputs_dir, load_previous_schedule
 from solver_cp_sat import solve_shifts
+from heuristic import solve_shifts_greedy, assignment_from_shifts
+from lns import solve_shifts_lns
+from profiling import RunProfiler
+from input_cache import load_cached
+from google_api_data import load_form_inputs
+from decompose import solve_shifts_decomposed
+from incremental import snapshot_inputs, save_snapshot, load_snapshot, diff_inputs, affected_neighborhood
+
+
+# キャッシュの鍵にする入力ファイル (どれかが変われば CSV から読み直す)
+INPUT_CSV_PATHS = [os.path.join(DATA_DIR, file_name) for file_name in INPUT_FILES.values()]
 
 
 def setup_logging():
@@ -181,64 +198,221 @@ def export_shortage_csv(shortage_result, students, subjects, output_path):
     logging.info(f"Shortage info exported to {output_path}")
 
 
+def export_snapshot_atomic(shifts, shortage_result, students, subjects, output_dir):
+    """
+    探索途中の解を3つのCSVに書き出す。
+    一旦 *.tmp に書いてから os.replace するので、読む側が書きかけのファイルを見ることはない。
+    """
+    targets = [
+        ("teacher_schedules.csv", lambda path: export_shifts_by_teacher(shifts, path)),
+        ("student_schedules.csv", lambda path: export_shifts_by_student(shifts, path)),
+        ("shortage.csv", lambda path: export_shortage_csv(shortage_result, students, subjects, path)),
+    ]
+    for file_name, export in targets:
+        final_path = os.path.join(output_dir, file_name)
+        tmp_path = final_path + ".tmp"
+        export(tmp_path)
+        os.replace(tmp_path, final_path)
+
+
 def main():
     setup_logging()
+    profiler = RunProfiler()
+    try:
+        run(profiler)
+    finally:
+        profiler.counters.setdefault("status", "incomplete")
+        profiler.write_json(RUN_REPORT_JSON)
 
-    logging.info("Loading data...")
 
-    # 1) Subjects (必須: ソルバーがSubjectクラスを使用)
-    subjects = load_subjects(SUBJECTS_CSV)
-
-    # 2) Teachers (subjectを使うので subjectsを渡す)
-    teachers = load_teachers(TEACHERS_CSV, subjects)
+def load_inputs(profiler: RunProfiler) -> Dict[str, Any]:
+    """
+    config のパスから入力一式を読み込み、solve_shifts に渡す dict (campaign_id 以外) を返す。
+    batch.py からも使う。
+    INPUT_CACHE が有効なら、CSV が前回から変わっていない限り pickle のキャッシュから読む。
+    INPUT_SOURCE = "forms" ならフォームの回答から直接作る (google_api_data.load_form_inputs)。
+    """
+    if INPUT_SOURCE == "forms":
+        return load_form_inputs(profiler)
+    if not INPUT_CACHE:
+        return load_inputs_from_csv(profiler)
+    with profiler.phase("load_inputs_cached"):
+        return load_cached(
+            INPUT_CACHE_PATH,
+            INPUT_CSV_PATHS,
+            lambda: load_inputs_from_csv(profiler),
+            extra_key=repr(sorted(SOLVER_PARAMS.items())),
+            verify_hash=INPUT_CACHE_VERIFY_HASH
+        )
+
+
+def load_inputs_from_csv(profiler: RunProfiler) -> Dict[str, Any]:
+    """CSV を1つずつ読み込む (キャッシュなし)。"""
+    logging.info("Loading data...")
+    # solver_params は config.SOLVER_PARAMS を solver_params.csv で上書き
+    return load_inputs_dir(DATA_DIR, SOLVER_PARAMS, profiler)
 
-    # 3) Students
-    students = load_students(STUDENTS_CSV)
-    
-    reqs_dict = load_student_requirements(STUDENT_REQUIREMENTS_CSV)
-    # これを students[s_id].requirements に代入
-    for s_id, rmap in reqs_dict.items():
-        if s_id in students:
-            students[s_id].requirements = rmap
-        else:
-            # CSV上に存在しない student_id ならログ
-            logging.warning(f"student_id {s_id} in requirements not found in students list.")
 
-    # 4) Timeslots
-    timeslots = load_timeslots(TIMESLOTS_CSV)
+def run(profiler: RunProfiler):
+    inputs = load_inputs(profiler)
+    teachers = inputs["teachers"]
+    students = inputs["students"]
+    timeslots = inputs["timeslots"]
+    campaigns = inputs["campaigns"]
+    regular_classes = inputs["regular_classes"]
+    subjects = inputs["subjects"]
+    constraint_weights = inputs["constraint_weights"]
+    solver_params = inputs["solver_params"]
 
-    # 5) Campaign
-    campaigns = load_campaigns(CAMPAIGN_CSV)
+    # 前回スケジュール (warm start・差分モード用)
+    with profiler.phase("load_previous_schedule"):
+        previous_assignment = load_previous_schedule(PREVIOUS_SCHEDULE_CSV) if (WARM_START or INCREMENTAL) else set()
 
-    # 6) Availability (Teacher / Student)
-    load_availability(TEACHER_AVAILABILITY_CSV, teachers=teachers, timeslots=timeslots)
-    load_availability(STUDENT_AVAILABILITY_CSV, students=students, timeslots=timeslots)
+    profiler.count("teachers", len(teachers))
+    profiler.count("students", len(students))
+    profiler.count("timeslots", len(timeslots))
 
-    # 7) Constraint Weights
-    constraint_weights = load_constraint_weights(CONSTRAINT_WEIGHTS_CSV)
+    campaign_id = "CAM1"
 
-    # 8) Regular classes (subjectを使う)
-    regular_classes = load_regular_classes(REGULAR_CLASSES_CSV, subjects)
+    # 差分モード: 前回入力との差分から解き直す範囲を決める
+    input_snapshot = snapshot_inputs(teachers, students, timeslots, regular_classes,
+                                     constraint_weights, campaign_id)
+    affected = None
+    if INCREMENTAL:
+        last_snapshot = load_snapshot(LAST_RUN_INPUTS_JSON)
+        diff = diff_inputs(last_snapshot, input_snapshot) if last_snapshot else None
+        if diff is None or not previous_assignment:
+            logging.info("Incremental mode: no usable previous run. Solving the full model.")
+        else:
+            changed_teachers, changed_students = diff
+            logging.info(f"Incremental mode: changed teachers={sorted(changed_teachers)}, "
+                         f"students={sorted(changed_students)}")
+            affected = affected_neighborhood(changed_teachers, changed_students, previous_assignment)
 
     # Solve
-    campaign_id = "CAM1"
     if campaign_id not in campaigns:
         logging.error(f"Campaign {campaign_id} not found.")
         sys.exit(1)
 
-    result_shifts, shortage_dict = solve_shifts(
-        teachers=teachers,
-        students=students,
-        timeslots=timeslots,
-        campaigns=campaigns,
-        regular_classes=regular_classes,
-        subjects=subjects,       # ソルバーにSubject辞書を渡す
-        campaign_id=campaign_id,
-        constraint_weights=constraint_weights
-    )
-
+    # 改善解が見つかるたびに OUTPUT_DIR を書き換える (長時間の探索でも途中経過が見える)
+    on_solution = None
+    if STREAM_SOLUTIONS:
+        def on_solution(shifts, shortage_result, objective):
+            export_snapshot_atomic(shifts, shortage_result, students, subjects, OUTPUT_DIR)
+
+    solve_stats = {}
+    if SOLVER_ENGINE == "greedy":
+        # CP-SAT を使わない近似解 (プレビュー / 大規模キャンペーン用)
+        with profiler.phase("solve_shifts_greedy"):
+            result_shifts, shortage_dict = solve_shifts_greedy(
+                teachers=teachers,
+                students=students,
+                timeslots=timeslots,
+                campaigns=campaigns,
+                regular_classes=regular_classes,
+                subjects=subjects,
+                campaign_id=campaign_id,
+                constraint_weights=constraint_weights,
+                solver_params=solver_params,
+                solve_stats=solve_stats,
+                profiler=profiler,
+                time_limit=GREEDY_TIME_LIMIT
+            )
+        logging.info(f"Greedy stopped: {solve_stats.get('stop_reason')} "
+                     f"(objective={solve_stats.get('objective')}, wall_time={solve_stats.get('wall_time', 0):.2f}s)")
+    elif SOLVER_ENGINE == "lns":
+        # 近傍ごとに解き直す LNS (前回スケジュールがあれば初期解に使う)
+        with profiler.phase("solve_shifts_lns"):
+            result_shifts, shortage_dict = solve_shifts_lns(
+                teachers=teachers,
+                students=students,
+                timeslots=timeslots,
+                campaigns=campaigns,
+                regular_classes=regular_classes,
+                subjects=subjects,
+                campaign_id=campaign_id,
+                constraint_weights=constraint_weights,
+                solver_params=solver_params,
+                solve_stats=solve_stats,
+                profiler=profiler,
+                initial_assignment=previous_assignment or None,
+                time_limit=LNS_TIME_LIMIT,
+                sub_time_limit=LNS_SUB_TIME_LIMIT,
+                kinds=LNS_NEIGHBORHOODS,
+                max_workers=LNS_WORKERS,
+                encoding=ENCODING,
+                candidate_backend=CANDIDATE_BACKEND,
+                on_improvement=on_solution
+            )
+        logging.info(f"LNS stopped: {solve_stats.get('stop_reason')} "
+                     f"(objective={solve_stats.get('objective')}, wall_time={solve_stats.get('wall_time', 0):.2f}s)")
+    elif DECOMPOSE_BY:
+        # 日付 (or 週) ブロックに分けて並列に解く
+        with profiler.phase("solve_shifts_decomposed"):
+            result_shifts, shortage_dict = solve_shifts_decomposed(
+                teachers=teachers,
+                students=students,
+                timeslots=timeslots,
+                campaigns=campaigns,
+                regular_classes=regular_classes,
+                subjects=subjects,
+                campaign_id=campaign_id,
+                constraint_weights=constraint_weights,
+                solver_params=solver_params,
+                block_by=DECOMPOSE_BY,
+                max_workers=DECOMPOSE_WORKERS,
+                prune=PRESOLVE_PRUNING,
+                encoding=ENCODING,
+                candidate_backend=CANDIDATE_BACKEND
+            )
+    else:
+        # greedy の解を CP-SAT のヒントに使う
+        hint_assignment = None
+        if GREEDY_HINTS:
+            with profiler.phase("greedy_hints"):
+                greedy_shifts, _ = solve_shifts_greedy(
+                    teachers=teachers,
+                    students=students,
+                    timeslots=timeslots,
+                    campaigns=campaigns,
+                    regular_classes=regular_classes,
+                    subjects=subjects,
+                    campaign_id=campaign_id,
+                    constraint_weights=constraint_weights,
+                    solver_params=solver_params,
+                    time_limit=GREEDY_TIME_LIMIT
+                )
+            hint_assignment = assignment_from_shifts(greedy_shifts)
+
+        result_shifts, shortage_dict = solve_shifts(
+            teachers=teachers,
+            students=students,
+            timeslots=timeslots,
+            campaigns=campaigns,
+            regular_classes=regular_classes,
+            subjects=subjects,       # ソルバーにSubject辞書を渡す
+            campaign_id=campaign_id,
+            constraint_weights=constraint_weights,
+            solver_params=solver_params,
+            solve_stats=solve_stats,
+            previous_assignment=previous_assignment,
+            affected=affected,
+            profiler=profiler,
+            on_solution=on_solution,
+            stream_interval=STREAM_MIN_INTERVAL,
+            prune=PRESOLVE_PRUNING,
+            encoding=ENCODING,
+            candidate_backend=CANDIDATE_BACKEND,
+            hint_assignment=hint_assignment
+        )
+        logging.info(f"Solver stopped: {solve_stats.get('stop_reason')} "
+                     f"(status={solve_stats.get('status')}, wall_time={solve_stats.get('wall_time', 0):.2f}s)")
+
+    profiler.count("shifts", len(result_shifts))
+    profiler.count("shortage_total", sum(shortage_dict.values()))
     if not result_shifts and not shortage_dict:
         logging.warning("No shifts assigned or no feasible solution.")
+        profiler.count("status", "no_solution")
         return
 
     # 出力ファイル
@@ -247,13 +421,20 @@ def main():
     shortage_csv_path = os.path.join(OUTPUT_DIR, "shortage.csv")
 
     # 教師ごとCSV
-    export_shifts_by_teacher(result_shifts, teacher_csv_path)
+    with profiler.phase("export_shifts_by_teacher"):
+        export_shifts_by_teacher(result_shifts, teacher_csv_path)
 
     # 生徒ごとCSV
-    export_shifts_by_student(result_shifts, student_csv_path)
+    with profiler.phase("export_shifts_by_student"):
+        export_shifts_by_student(result_shifts, student_csv_path)
 
     # 3) 不足コマCSV (表形式)
-    export_shortage_csv(shortage_dict, students, subjects, shortage_csv_path)
+    with profiler.phase("export_shortage_csv"):
+        export_shortage_csv(shortage_dict, students, subjects, shortage_csv_path)
+
+    # 次回の差分モード用に今回の入力を保存
+    save_snapshot(input_snapshot, LAST_RUN_INPUTS_JSON)
+    profiler.count("status", "ok")
 
 if __name__ == "__main__":
     main()
@@ -1,14 +1,31 @@
 # models.py
+#
+# 大きな名簿でもメモリを食わないよう、各クラスは __slots__ で属性を固定している
+# (インスタンスごとの __dict__ を持たない)。
+
+from typing import List, Dict, Optional, Iterator
+
+
+def mask_indices(mask: int) -> Iterator[int]:
+    """ビットマスクで立っているビット位置 (= TimeSlot.index) を昇順に返す。"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
 
-from typing import List, Dict, Optional
 
 class Subject:
+    __slots__ = ("subject_id", "subject_name", "category")
+
     def __init__(self, subject_id: str, subject_name: str, category: Optional[str] = None):
         self.subject_id = subject_id
         self.subject_name = subject_name
         self.category = category
 
 class Teacher:
+    __slots__ = ("teacher_id", "teacher_name", "desired_shift_count", "min_classes",
+                 "teachable_subjects", "available_timeslots", "availability_mask")
+
     def __init__(self,
                  teacher_id: str,
                  teacher_name: str,
@@ -21,8 +38,20 @@ class Teacher:
         self.min_classes = min_classes
         self.teachable_subjects = teachable_subjects  # List[Subject]
         self.available_timeslots = []  # List[TimeSlot]
+        self.availability_mask = 0     # TimeSlot.index のビット集合
+
+    def add_available_timeslot(self, ts: "TimeSlot"):
+        if not self.is_available(ts):
+            self.available_timeslots.append(ts)
+            self.availability_mask |= 1 << ts.index
+
+    def is_available(self, ts: "TimeSlot") -> bool:
+        return (self.availability_mask >> ts.index) & 1 == 1
 
 class Student:
+    __slots__ = ("student_id", "student_name", "grade", "gap_preference", "requirements",
+                 "available_timeslots", "availability_mask")
+
     def __init__(self,
                  student_id: str,
                  student_name: str,
@@ -35,21 +64,40 @@ class Student:
         self.gap_preference = gap_preference
         self.requirements = requirements
         self.available_timeslots = []  # List[TimeSlot]
+        self.availability_mask = 0     # TimeSlot.index のビット集合
+
+    def add_available_timeslot(self, ts: "TimeSlot"):
+        if not self.is_available(ts):
+            self.available_timeslots.append(ts)
+            self.availability_mask |= 1 << ts.index
+
+    def is_available(self, ts: "TimeSlot") -> bool:
+        return (self.availability_mask >> ts.index) & 1 == 1
 
 class TimeSlot:
+    """
+    index は読み込んだ全 timeslot を通した通し番号 (0始まり)。
+    Teacher/Student の availability_mask のビット位置として使う。
+    """
+    __slots__ = ("timeslot_id", "date", "period_index", "campaign_id", "period_label", "index")
+
     def __init__(self,
                  timeslot_id: str,
                  date: str,
                  period_index: int,
                  campaign_id: str,
-                 period_label: Optional[str] = None):
+                 period_label: Optional[str] = None,
+                 index: Optional[int] = None):
         self.timeslot_id = timeslot_id
         self.date = date
         self.period_index = period_index
         self.campaign_id = campaign_id
         self.period_label = period_label
+        self.index = index
 
 class Campaign:
+    __slots__ = ("campaign_id", "name", "start_date", "end_date", "description")
+
     def __init__(self,
                  campaign_id: str,
                  name: str,
@@ -66,6 +114,8 @@ class RegularClass:
     """
     subject を Subject クラスに変更。
     """
+    __slots__ = ("regular_class_id", "teacher_id", "subject", "timeslot_id", "enrolled_student_ids")
+
     def __init__(self,
                  regular_class_id: str,
                  teacher_id: str,
@@ -79,6 +129,8 @@ class RegularClass:
         self.enrolled_student_ids = enrolled_student_ids
 
 class Shift:
+    __slots__ = ("shift_id", "timeslot", "teacher", "subject", "assigned_students")
+
     def __init__(self,
                  shift_id: str,
                  timeslot: TimeSlot,
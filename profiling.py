@@ -0,0 +1,104 @@
+# profiling.py
+
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, List
+
+logger = logging.getLogger(__name__)
+
+
+class RunProfiler:
+    """
+    1回の実行の計測値 (フェーズごとの wall / CPU 時間、カウンタ、ソルバー結果) を集める。
+      with profiler.phase("load_teachers"): ...   ブロックを計測
+      profiler.lap("1-1 x", model)                 前回の lap からの区間を計測 (solve_shifts の各セクション用)
+      profiler.count("x_vars", n)                  カウンタ
+      profiler.set("solver", {...})                任意の値
+    model を渡すと、その区間で増えた変数数・制約数も記録する。
+    """
+    def __init__(self):
+        self.phases: List[Dict[str, Any]] = []
+        self.counters: Dict[str, Any] = {}
+        self.values: Dict[str, Any] = {}
+        self._start_wall = time.perf_counter()
+        self._start_cpu = time.process_time()
+        self._lap_wall = None
+        self._lap_cpu = None
+        self._lap_vars = 0
+        self._lap_cons = 0
+
+    def _record(self, name, wall, cpu, model=None, prefix=""):
+        entry = {"name": prefix + name, "wall": wall, "cpu": cpu}
+        if model is not None:
+            proto = model.Proto()
+            n_vars, n_cons = len(proto.variables), len(proto.constraints)
+            entry["variables"] = n_vars - self._lap_vars
+            entry["constraints"] = n_cons - self._lap_cons
+            self._lap_vars, self._lap_cons = n_vars, n_cons
+        self.phases.append(entry)
+
+    @contextmanager
+    def phase(self, name: str):
+        wall0, cpu0 = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self._record(name, time.perf_counter() - wall0, time.process_time() - cpu0)
+
+    def start_laps(self):
+        """lap の起点をリセットする (モデル構築の開始時に呼ぶ)。"""
+        self._lap_wall, self._lap_cpu = time.perf_counter(), time.process_time()
+        self._lap_vars = self._lap_cons = 0
+
+    def lap(self, name: str, model=None):
+        now_wall, now_cpu = time.perf_counter(), time.process_time()
+        if self._lap_wall is None:
+            self._lap_wall, self._lap_cpu = now_wall, now_cpu
+        self._record(name, now_wall - self._lap_wall, now_cpu - self._lap_cpu, model, prefix="solve_shifts/")
+        self._lap_wall, self._lap_cpu = time.perf_counter(), time.process_time()
+
+    def count(self, name: str, value):
+        self.counters[name] = value
+
+    def set(self, key: str, value):
+        self.values[key] = value
+
+    def report(self) -> Dict[str, Any]:
+        report = {
+            "total_wall": time.perf_counter() - self._start_wall,
+            "total_cpu": time.process_time() - self._start_cpu,
+            "phases": self.phases,
+            "counters": self.counters,
+        }
+        report.update(self.values)
+        return report
+
+    def write_json(self, json_path: str):
+        dir_path = os.path.dirname(json_path)
+        if dir_path:
+            os.makedirs(dir_path, exist_ok=True)
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=2)
+        logger.info(f"Run report written to {json_path}")
+
+
+class NullProfiler(RunProfiler):
+    """profiler を渡されなかったときに使う何もしない版。"""
+    @contextmanager
+    def phase(self, name: str):
+        yield
+
+    def start_laps(self):
+        pass
+
+    def lap(self, name: str, model=None):
+        pass
+
+    def count(self, name: str, value):
+        pass
+
+    def set(self, key: str, value):
+        pass
@@ -1,88 +1,142 @@
 # reader.py
+#
+# CSV はどれも iter_csv で1行ずつ読む: ヘッダーは最初に1度だけ読んで列の位置を決め、
+# 行は dict にせず必要な列だけをタプルで取り出し、int / float は列ごとの変換関数で変換する。
+# 列が足りない・数値にならない行は「ファイル:行番号」付きの CsvFormatError にする
+# (読めない行を黙って飛ばしたり、空のデータで続けたりしない)。
 
 import csv
 import logging
-from typing import Dict
+import os
+from operator import itemgetter
+from typing import Dict, Any, Set, Tuple, List, Callable, Iterator, Iterable, Optional
 from models import Teacher, Student, TimeSlot, Campaign, RegularClass, Subject
+from profiling import RunProfiler, NullProfiler
 
 logger = logging.getLogger(__name__)
 
+
+class CsvFormatError(ValueError):
+    """入力 CSV の形式の誤り。path と line (1始まり、ヘッダーが1行目) を持つ。"""
+
+    def __init__(self, path: str, line: int, message: str):
+        super().__init__(f"{path}:{line}: {message}")
+        self.path = path
+        self.line = line
+
+
+def read_header(csv_path: str) -> List[str]:
+    """csv_path のヘッダー行 (空のファイルなら [])"""
+    with open(csv_path, "r", encoding="utf-8-sig", newline="") as f:
+        return next(csv.reader(f), [])
+
+
+def iter_csv(csv_path: str,
+             columns: Iterable[str],
+             optional: Iterable[str] = (),
+             converters: Optional[Dict[str, Callable[[str], Any]]] = None,
+             numbered: bool = False) -> Iterator:
+    """
+    csv_path の各行から columns, optional の順に値を取り出して返すジェネレータ。
+      columns    : 必須の列。ヘッダーに無ければ CsvFormatError
+      optional   : ヘッダーに無い (または行が短い) ときは None を返す列
+      converters : {列名: 変換関数}。変換できなければ CsvFormatError
+      numbered   : True なら (行番号, 値) を返す (読んだ側で行番号付きのエラーを出すとき)
+    空行は飛ばす。
+    """
+    columns, optional = list(columns), list(optional)
+    converters = converters or {}
+    with open(csv_path, "r", encoding="utf-8-sig", newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            raise CsvFormatError(csv_path, 1, "missing header row")
+        position = {name: i for i, name in enumerate(header)}
+        missing = [name for name in columns if name not in position]
+        if missing:
+            raise CsvFormatError(csv_path, 1, f"missing column(s) {', '.join(missing)}")
+
+        # 無い optional の列は、行の末尾に足した None を指す
+        width = len(header)
+        positions = [position[name] for name in columns] + [position.get(name, width) for name in optional]
+        padded_width = max(positions, default=-1) + 1
+        required_width = max((position[name] for name in columns), default=-1) + 1
+        getter = itemgetter(*positions) if len(positions) > 1 else (lambda row: (row[positions[0]],))
+        names = columns + optional
+        convert = [(i, converters[name], name) for i, name in enumerate(names) if name in converters]
+
+        for row in reader:
+            if not row:
+                continue
+            if len(row) < padded_width:
+                if len(row) < required_width:
+                    raise CsvFormatError(csv_path, reader.line_num,
+                                         f"expected {width} fields, got {len(row)}")
+                row += [None] * (padded_width - len(row))
+            if not convert:
+                yield (reader.line_num, getter(row)) if numbered else getter(row)
+                continue
+            values = list(getter(row))
+            for i, fn, name in convert:
+                try:
+                    values[i] = fn(values[i])
+                except (ValueError, TypeError):
+                    raise CsvFormatError(csv_path, reader.line_num,
+                                         f"invalid {name} {values[i]!r}") from None
+            yield (reader.line_num, values) if numbered else values
+
+
+def _count_or_zero(value: str) -> int:
+    """required_<科目> の列: 空なら 0"""
+    return int(value) if value else 0
+
+
 def load_subjects(csv_path: str) -> Dict[str, Subject]:
     subjects = {}
-    try:
-        with open(csv_path, "r", encoding="utf-8-sig") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                sid = row["subject_id"]
-                sname = row["subject_name"]
-                cat = row.get("category", "")
-                subj_obj = Subject(subject_id=sid, subject_name=sname, category=cat)
-                subjects[sid] = subj_obj
-        logger.info(f"Loaded {len(subjects)} subjects from {csv_path}")
-    except Exception as e:
-        logger.error(f"Error reading subjects from {csv_path}: {e}")
+    for sid, sname, cat in iter_csv(csv_path, ["subject_id", "subject_name"], optional=["category"]):
+        subjects[sid] = Subject(subject_id=sid, subject_name=sname, category=cat or "")
+    logger.info(f"Loaded {len(subjects)} subjects from {csv_path}")
     return subjects
 
 def load_teachers(csv_path: str, subjects_dict: Dict[str, Subject]) -> Dict[str, Teacher]:
     teachers = {}
-    try:
-        with open(csv_path, "r", encoding="utf-8-sig") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                t_id = row["teacher_id"]
-                t_name = row["teacher_name"]
-                desired = int(row["desired_shift_count"])
-                minimum = int(row["min_classes"])
-
-                subs_str = row["teachable_subjects"]
-                subject_list = []
-                if subs_str:
-                    for sid in subs_str.split("|"):
-                        if sid in subjects_dict:
-                            subject_list.append(subjects_dict[sid])
-                        else:
-                            logger.warning(f"Subject {sid} not in dict.")
-                teacher = Teacher(
-                    teacher_id=t_id,
-                    teacher_name=t_name,
-                    desired_shift_count=desired,
-                    min_classes=minimum,
-                    teachable_subjects=subject_list
-                )
-                teachers[t_id] = teacher
-        logger.info(f"Loaded {len(teachers)} teachers from {csv_path}")
-    except Exception as e:
-        logger.error(f"Error reading teachers from {csv_path}: {e}")
+    rows = iter_csv(csv_path,
+                    ["teacher_id", "teacher_name", "desired_shift_count", "min_classes", "teachable_subjects"],
+                    converters={"desired_shift_count": int, "min_classes": int})
+    for t_id, t_name, desired, minimum, subs_str in rows:
+        subject_list = []
+        if subs_str:
+            for sid in subs_str.split("|"):
+                if sid in subjects_dict:
+                    subject_list.append(subjects_dict[sid])
+                else:
+                    logger.warning(f"Subject {sid} not in dict.")
+        teachers[t_id] = Teacher(
+            teacher_id=t_id,
+            teacher_name=t_name,
+            desired_shift_count=desired,
+            min_classes=minimum,
+            teachable_subjects=subject_list
+        )
+    logger.info(f"Loaded {len(teachers)} teachers from {csv_path}")
     return teachers
 
 def load_students(csv_path: str) -> Dict[str, Student]:
     students = {}
-    try:
-        with open(csv_path, "r", encoding="utf-8-sig") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                s_id = row["student_id"]
-                s_name = row["student_name"]
-                grade = row["grade"]
-                gap_pref = row["gap_preference"]
-
-                requirements = {}
-                for k, v in row.items():
-                    if k.startswith("required_"):
-                        subj_id = k.replace("required_", "")
-                        requirements[subj_id] = int(v) if v.isdigit() else 0
-
-                stu = Student(
-                    student_id=s_id,
-                    student_name=s_name,
-                    grade=grade,
-                    gap_preference=gap_pref,
-                    requirements=requirements
-                )
-                students[s_id] = stu
-        logger.info(f"Loaded {len(students)} students from {csv_path}")
-    except Exception as e:
-        logger.error(f"Error reading students from {csv_path}: {e}")
+    # required_<subject_id> の列 (あれば) はヘッダーから1度だけ探す
+    required_columns = [name for name in read_header(csv_path) if name.startswith("required_")]
+    subject_ids = [name[len("required_"):] for name in required_columns]
+    rows = iter_csv(csv_path, ["student_id", "student_name", "grade", "gap_preference"] + required_columns,
+                    converters={name: _count_or_zero for name in required_columns})
+    for s_id, s_name, grade, gap_pref, *counts in rows:
+        students[s_id] = Student(
+            student_id=s_id,
+            student_name=s_name,
+            grade=grade,
+            gap_preference=gap_pref,
+            requirements=dict(zip(subject_ids, counts))
+        )
+    logger.info(f"Loaded {len(students)} students from {csv_path}")
     return students
 
 def load_student_requirements(csv_path: str) -> Dict[str, Dict[str, int]]:
@@ -93,109 +147,133 @@ def load_student_requirements(csv_path: str) -> Dict[str, Dict[str, int]]:
     戻り値: { s_id: { subj_id: required_count, ... }, ... }
     """
     requirements = {}
-    try:
-        with open(csv_path, "r", encoding="utf-8-sig") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                s_id = row["student_id"]
-                # student_name は人間向け表示/ログ用（必須でない）
-                s_name = row.get("student_name", "")
-                subj_id = row["subject_id"]
-                req_count = int(row["required_count"])
-
-                logger.debug(f"Reading requirement: {s_id}({s_name}) -> {subj_id}:{req_count}")
-
-                if s_id not in requirements:
-                    requirements[s_id] = {}
-                requirements[s_id][subj_id] = req_count
-
-        logger.info(f"Loaded student requirements from {csv_path}")
-    except Exception as e:
-        logger.error(f"Error reading student_requirements from {csv_path}: {e}")
+    # student_name は人間向け表示/ログ用（必須でない）
+    rows = iter_csv(csv_path, ["student_id", "subject_id", "required_count"], optional=["student_name"],
+                    converters={"required_count": int})
+    for s_id, subj_id, req_count, s_name in rows:
+        logger.debug(f"Reading requirement: {s_id}({s_name}) -> {subj_id}:{req_count}")
+        if s_id not in requirements:
+            requirements[s_id] = {}
+        requirements[s_id][subj_id] = req_count
 
+    logger.info(f"Loaded student requirements from {csv_path}")
     return requirements
 
 def load_timeslots(csv_path: str) -> Dict[str, TimeSlot]:
     timeslots = {}
-    try:
-        with open(csv_path, "r", encoding="utf-8-sig") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                ts_id = row["timeslot_id"]
-                date_str = row["date"]
-                pidx = int(row["period_index"])
-                camp_id = row["campaign_id"]
-                plabel = row.get("period_label", None)
-                ts = TimeSlot(
-                    timeslot_id=ts_id,
-                    date=date_str,
-                    period_index=pidx,
-                    campaign_id=camp_id,
-                    period_label=plabel
-                )
-                timeslots[ts_id] = ts
-        logger.info(f"Loaded {len(timeslots)} timeslots from {csv_path}")
-    except Exception as e:
-        logger.error(f"Error reading timeslots from {csv_path}: {e}")
+    rows = iter_csv(csv_path, ["timeslot_id", "date", "period_index", "campaign_id"], optional=["period_label"],
+                    converters={"period_index": int})
+    for row_idx, (ts_id, date_str, pidx, camp_id, plabel) in enumerate(rows):
+        timeslots[ts_id] = TimeSlot(
+            timeslot_id=ts_id,
+            date=date_str,
+            period_index=pidx,
+            campaign_id=camp_id,
+            period_label=plabel,
+            index=row_idx
+        )
+    logger.info(f"Loaded {len(timeslots)} timeslots from {csv_path}")
     return timeslots
 
 def load_campaigns(csv_path: str) -> Dict[str, Campaign]:
     campaigns = {}
-    try:
-        with open(csv_path, "r", encoding="utf-8-sig") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                cid = row["campaign_id"]
-                c = Campaign(
-                    campaign_id=cid,
-                    name=row["name"],
-                    start_date=row["start_date"],
-                    end_date=row["end_date"],
-                    description=row["description"]
-                )
-                campaigns[cid] = c
-        logger.info(f"Loaded {len(campaigns)} campaigns from {csv_path}")
-    except Exception as e:
-        logger.error(f"Error reading campaigns from {csv_path}: {e}")
+    rows = iter_csv(csv_path, ["campaign_id", "name", "start_date", "end_date", "description"])
+    for cid, name, start_date, end_date, description in rows:
+        campaigns[cid] = Campaign(
+            campaign_id=cid,
+            name=name,
+            start_date=start_date,
+            end_date=end_date,
+            description=description
+        )
+    logger.info(f"Loaded {len(campaigns)} campaigns from {csv_path}")
     return campaigns
 
 def load_availability(csv_path: str,
                       teachers: Dict[str, Teacher] = None,
                       students: Dict[str, Student] = None,
                       timeslots: Dict[str, TimeSlot] = None):
-    try:
-        with open(csv_path, "r", encoding="utf-8-sig") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                ts_id = row["timeslot_id"]
-                if ts_id not in timeslots:
-                    continue
-
-                if "teacher_id" in row and row["teacher_id"]:
-                    t_id = row["teacher_id"]
-                    if t_id in teachers:
-                        teachers[t_id].available_timeslots.append(timeslots[ts_id])
-                elif "student_id" in row and row["student_id"]:
-                    s_id = row["student_id"]
-                    if s_id in students:
-                        students[s_id].available_timeslots.append(timeslots[ts_id])
-    except Exception as e:
-        logger.error(f"Error reading availability from {csv_path}: {e}")
+    """
+    teacher_availability.csv / student_availability.csv を読み、teachers / students に
+    available_timeslots をつなぐ。teacher_id が入っていれば教師、無ければ student_id の生徒の行。
+    """
+    header = read_header(csv_path)
+    if "teacher_id" not in header and "student_id" not in header:
+        raise CsvFormatError(csv_path, 1, "missing column teacher_id or student_id")
+    teachers = teachers or {}
+    students = students or {}
+    timeslots = timeslots or {}
+    count = 0
+    for ts_id, t_id, s_id in iter_csv(csv_path, ["timeslot_id"], optional=["teacher_id", "student_id"]):
+        ts = timeslots.get(ts_id)
+        if ts is None:
+            continue
+        if t_id:
+            owner = teachers.get(t_id)
+        elif s_id:
+            owner = students.get(s_id)
+        else:
+            continue
+        if owner is not None:
+            owner.add_available_timeslot(ts)
+            count += 1
+    logger.info(f"Loaded {count} availability rows from {csv_path}")
 
 def load_constraint_weights(csv_path: str) -> Dict[str, float]:
     weights = {}
-    try:
-        with open(csv_path, "r", encoding="utf-8-sig") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                k = row["key"]
-                v = float(row["value"])
-                weights[k] = v
-        logger.info(f"Loaded constraint weights: {weights}")
-    except Exception as e:
-        logger.error(f"Error reading constraint_weights from {csv_path}: {e}")
+    for k, v in iter_csv(csv_path, ["key", "value"], converters={"value": float}):
+        weights[k] = v
+    logger.info(f"Loaded constraint weights: {weights}")
     return weights
 
+def load_solver_params(csv_path: str, defaults: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    solver_params.csv:
+      key,value
+    defaults をコピーし、CSV にあるキーだけ defaults の型に合わせて上書きする。
+    ファイルが無ければ defaults のまま返す。
+    """
+    params = dict(defaults)
+    if not os.path.exists(csv_path):
+        logger.info(f"{csv_path} not found. Using default solver params: {params}")
+        return params
+    for line, (k, v) in iter_csv(csv_path, ["key", "value"], numbered=True):
+        k, v = k.strip(), v.strip()
+        if k not in defaults:
+            logger.warning(f"Unknown solver param {k} ignored.")
+            continue
+        default = defaults[k]
+        try:
+            if isinstance(default, bool):
+                params[k] = v.lower() in ("1", "true", "yes")
+            elif isinstance(default, int):
+                params[k] = int(float(v))
+            else:
+                params[k] = float(v)
+        except ValueError:
+            raise CsvFormatError(csv_path, line, f"invalid value {v!r} for {k}") from None
+    logger.info(f"Loaded solver params: {params}")
+    return params
+
+def load_previous_schedule(csv_path: str) -> Set[Tuple[str, str, str, str]]:
+    """
+    main.export_shifts_by_teacher が出力した teacher_schedules.csv を読み込み、
+    前回の割当 (t_id, s_id, subj_id, ts_id) の集合を返す。
+    ファイルが無ければ空集合。
+    """
+    assignments = set()
+    if not os.path.exists(csv_path):
+        logger.info(f"{csv_path} not found. Solving without warm start.")
+        return assignments
+    rows = iter_csv(csv_path, ["teacher_id", "timeslot_id", "subject_id", "assigned_student_ids"])
+    for t_id, ts_id, subj_id, s_ids in rows:
+        if not s_ids:
+            continue
+        for s_id in s_ids.split("|"):
+            assignments.add((t_id, s_id, subj_id, ts_id))
+    logger.info(f"Loaded {len(assignments)} previous assignments from {csv_path}")
+    return assignments
+
 def load_regular_classes(csv_path: str,
                          subjects_dict: Dict[str, Subject]) -> Dict[str, RegularClass]:
     """
@@ -204,35 +282,96 @@ def load_regular_classes(csv_path: str,
     subject_id -> Subject
     """
     regs = {}
-    try:
-        with open(csv_path, "r", encoding="utf-8-sig") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                rc_id = row["regular_class_id"]
-                t_id = row["teacher_id"]
-                subj_id = row["subject_id"]
-                ts_id = row["timeslot_id"]
-                en_str = row["enrolled_student_ids"]
-                if en_str:
-                    eids = en_str.split("|")
-                else:
-                    eids = []
+    rows = iter_csv(csv_path, ["regular_class_id", "teacher_id", "subject_id", "timeslot_id",
+                               "enrolled_student_ids"])
+    for rc_id, t_id, subj_id, ts_id, en_str in rows:
+        if en_str:
+            eids = en_str.split("|")
+        else:
+            eids = []
 
-                if subj_id in subjects_dict:
-                    subj_obj = subjects_dict[subj_id]
-                else:
-                    logger.warning(f"Subject {subj_id} not found in subject dict.")
-                    continue
-
-                rc = RegularClass(
-                    regular_class_id=rc_id,
-                    teacher_id=t_id,
-                    subject=subj_obj,  # Subject オブジェクト
-                    timeslot_id=ts_id,
-                    enrolled_student_ids=eids
-                )
-                regs[rc_id] = rc
-        logger.info(f"Loaded {len(regs)} regular classes from {csv_path}")
-    except Exception as e:
-        logger.error(f"Error reading regular_classes from {csv_path}: {e}")
+        if subj_id in subjects_dict:
+            subj_obj = subjects_dict[subj_id]
+        else:
+            logger.warning(f"Subject {subj_id} not found in subject dict.")
+            continue
+
+        regs[rc_id] = RegularClass(
+            regular_class_id=rc_id,
+            teacher_id=t_id,
+            subject=subj_obj,  # Subject オブジェクト
+            timeslot_id=ts_id,
+            enrolled_student_ids=eids
+        )
+    logger.info(f"Loaded {len(regs)} regular classes from {csv_path}")
     return regs
+
+# data_dir 内の入力ファイル名 (config の *_CSV と同じ)
+INPUT_FILES = {
+    "subjects": "subjects.csv",
+    "teachers": "teachers.csv",
+    "students": "students.csv",
+    "student_requirements": "student_requirements.csv",
+    "timeslots": "timeslots.csv",
+    "teacher_availability": "teacher_availability.csv",
+    "student_availability": "student_availability.csv",
+    "regular_classes": "regular_classes.csv",
+    "constraint_weights": "constraint_weights.csv",
+    "campaigns": "campaign.csv",
+    "solver_params": "solver_params.csv",
+}
+
+
+def load_inputs_dir(data_dir: str,
+                    solver_param_defaults: Optional[Dict[str, Any]] = None,
+                    profiler: Optional[RunProfiler] = None) -> Dict[str, Any]:
+    """
+    data_dir (data/ や api_data/ と同じ構成) の CSV を読み、solve_shifts に渡す dict (campaign_id 以外) を返す。
+    requirements と空きコマ (available_timeslots / availability_mask) はつないだ状態にする。
+    solver_param_defaults を渡すと solver_params.csv で上書きした "solver_params" も入れる。
+    main.load_inputs / ベンチマーク / テストはすべてこれで読む。
+    """
+    profiler = profiler or NullProfiler()
+
+    def path(name):
+        return os.path.join(data_dir, INPUT_FILES[name])
+
+    with profiler.phase("load_subjects"):
+        subjects = load_subjects(path("subjects"))
+    with profiler.phase("load_teachers"):
+        teachers = load_teachers(path("teachers"), subjects)
+    with profiler.phase("load_students"):
+        students = load_students(path("students"))
+    with profiler.phase("load_student_requirements"):
+        reqs_dict = load_student_requirements(path("student_requirements"))
+    for s_id, rmap in reqs_dict.items():
+        if s_id in students:
+            students[s_id].requirements = rmap
+        else:
+            logger.warning(f"student_id {s_id} in requirements not found in students list.")
+    with profiler.phase("load_timeslots"):
+        timeslots = load_timeslots(path("timeslots"))
+    with profiler.phase("load_campaigns"):
+        campaigns = load_campaigns(path("campaigns"))
+    with profiler.phase("load_teacher_availability"):
+        load_availability(path("teacher_availability"), teachers=teachers, timeslots=timeslots)
+    with profiler.phase("load_student_availability"):
+        load_availability(path("student_availability"), students=students, timeslots=timeslots)
+    with profiler.phase("load_constraint_weights"):
+        constraint_weights = load_constraint_weights(path("constraint_weights"))
+    with profiler.phase("load_regular_classes"):
+        regular_classes = load_regular_classes(path("regular_classes"), subjects)
+
+    inputs = {
+        "teachers": teachers,
+        "students": students,
+        "timeslots": timeslots,
+        "campaigns": campaigns,
+        "regular_classes": regular_classes,
+        "subjects": subjects,
+        "constraint_weights": constraint_weights,
+    }
+    if solver_param_defaults is not None:
+        with profiler.phase("load_solver_params"):
+            inputs["solver_params"] = load_solver_params(path("solver_params"), solver_param_defaults)
+    return inputs
@@ -0,0 +1,454 @@
+# sheets_ingest.py
+#
+# Google スプレッドシート (フォームの回答) の取り込み。
+#   - 設定したシートをスレッドプールで同時に取りに行く
+#   - 同じスプレッドシート内のシートは values_batch_get 1回にまとめて読む
+#     (シート全体ではなく range を指定すれば、必要な列だけを読む)
+#   - クォータ超過 (429) や一時的なエラー (5xx) は指数バックオフで再試行する
+#   - sync_sheets は前回の取り込みとの差分だけを取りに行く (タイムスタンプの列と行ごとのハッシュで判定)
+#   - StubClient は gspread と同じ呼び出し (open_by_key / sheet1 / worksheet / values_batch_get /
+#     get_all_values) を持つので、ネットワークなしで取り込みを試せる
+# gspread / google-auth は authorize を呼んだときだけ import する。
+
+import csv
+import hashlib
+import logging
+import os
+import random
+import re
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SCOPES = [
+    'https://www.googleapis.com/auth/spreadsheets',
+    'https://www.googleapis.com/auth/drive'
+]
+
+# 再試行する HTTP ステータス (クォータ超過と一時的なサーバーエラー)
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# フォームの回答シートでタイムスタンプが入る列 (回答が編集されると更新される)
+TIMESTAMP_COLUMN = "A"
+
+
+class SheetSource:
+    """
+    取り込むシート1つ。
+      name       : 取り込み結果の dict のキー ("teacher", "student" など)
+      url_or_key : スプレッドシートの URL かキー
+      worksheet  : シート名 (None なら先頭のシート)
+      range      : A1 形式の範囲 ("A1:BZ" など、None ならシート全体)
+    """
+    __slots__ = ("name", "key", "worksheet", "range")
+
+    def __init__(self, name: str, url_or_key: str, worksheet: Optional[str] = None,
+                 range: Optional[str] = None):
+        self.name = name
+        self.key = spreadsheet_key(url_or_key)
+        self.worksheet = worksheet
+        self.range = range
+
+    def __repr__(self):
+        return f"SheetSource({self.name!r}, {self.key!r}, {self.worksheet!r}, {self.range!r})"
+
+
+def spreadsheet_key(url_or_key: str) -> str:
+    """https://docs.google.com/spreadsheets/d/<key>/edit からキーを取り出す (キーならそのまま)。"""
+    m = re.search(r"/spreadsheets/d/([^/]+)", url_or_key)
+    return m.group(1) if m else url_or_key
+
+
+def authorize(service_account_file: str):
+    """サービスアカウントの JSON で gspread クライアントを作る。"""
+    import gspread
+    from google.oauth2.service_account import Credentials
+    creds = Credentials.from_service_account_file(service_account_file, scopes=SCOPES)
+    return gspread.authorize(creds)
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    """gspread.exceptions.APIError などから HTTP ステータスを取り出す (無ければ None)。"""
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None)
+
+
+def with_retry(func, *args, max_retries: int = 5, base_delay: float = 1.0, max_delay: float = 32.0,
+               sleep=time.sleep, **kwargs):
+    """
+    func(*args, **kwargs) を呼び、RETRY_STATUS のエラーなら 1, 2, 4, ... 秒 (+ゆらぎ) 待って再試行する。
+    それ以外のエラーや max_retries 回を超えた場合はそのまま送出する。
+    """
+    attempt = 0
+    while True:
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            status = _status_code(e)
+            if status not in RETRY_STATUS or attempt >= max_retries:
+                raise
+            delay = min(max_delay, base_delay * (2 ** attempt)) * (1 + random.random() * 0.1)
+            attempt += 1
+            logger.warning(f"Sheets API returned {status}; retry {attempt}/{max_retries} in {delay:.1f}s")
+            sleep(delay)
+
+
+def _a1_range(title: str, cell_range: Optional[str]) -> str:
+    quoted = "'" + title.replace("'", "''") + "'"
+    return f"{quoted}!{cell_range}" if cell_range else quoted
+
+
+def _pad(rows: List[List[str]]) -> List[List[str]]:
+    """API は行末の空セルを返さないので、get_all_values と同じく全行を最長の行の長さに揃える。"""
+    width = max((len(r) for r in rows), default=0)
+    return [list(r) + [""] * (width - len(r)) for r in rows]
+
+
+def _worksheet_title(spreadsheet, src: SheetSource, retry: Dict[str, Any]) -> str:
+    """src のシート名。gspread の worksheet() / sheet1 はメタデータを取りに行く API 呼び出しなので再試行する。"""
+    if src.worksheet:
+        ws = with_retry(spreadsheet.worksheet, src.worksheet, **retry)
+    else:
+        ws = with_retry(lambda: spreadsheet.sheet1, **retry)
+    return ws.title
+
+
+def _fetch_spreadsheet(client, key: str, sources: List[SheetSource], retry: Dict[str, Any]):
+    """1つのスプレッドシートにある sources を values_batch_get 1回で読む。"""
+    spreadsheet = with_retry(client.open_by_key, key, **retry)
+    ranges = [_a1_range(_worksheet_title(spreadsheet, src, retry), src.range) for src in sources]
+    response = with_retry(spreadsheet.values_batch_get, ranges, **retry)
+    value_ranges = response.get("valueRanges", [])
+    return {src.name: _pad(vr.get("values", [])) for src, vr in zip(sources, value_ranges)}
+
+
+def fetch_sheets(client, sources: List[SheetSource], max_workers: int = 8,
+                 max_retries: int = 5, base_delay: float = 1.0) -> Dict[str, List[List[str]]]:
+    """
+    sources を並列に取り込み、{name: 行のリスト (1行目がヘッダー)} を返す。
+    同じスプレッドシートのシートはまとめて1リクエスト、スプレッドシートごとに1スレッド。
+    """
+    by_key = defaultdict(list)
+    for src in sources:
+        by_key[src.key].append(src)
+    retry = {"max_retries": max_retries, "base_delay": base_delay}
+
+    start = time.perf_counter()
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(by_key)))) as pool:
+        futures = {pool.submit(_fetch_spreadsheet, client, key, srcs, retry): key
+                   for key, srcs in by_key.items()}
+        for future, key in futures.items():
+            try:
+                results.update(future.result())
+            except Exception as e:
+                logger.error(f"Error fetching spreadsheet {key}: {e}")
+                raise
+    logger.info(f"Fetched {len(results)} sheets from {len(by_key)} spreadsheets "
+                f"in {time.perf_counter() - start:.2f}s")
+    return results
+
+
+# ------------------------------------------------------------
+# 差分取り込み
+# ------------------------------------------------------------
+def row_hash(row: List[str]) -> str:
+    """行の中身のハッシュ (行末の空セルは無視する)。"""
+    row = list(row)
+    while row and row[-1] == "":
+        row.pop()
+    return hashlib.sha1("\x1f".join(row).encode("utf-8")).hexdigest()
+
+
+def _spans(indices: List[int]) -> List[Tuple[int, int]]:
+    """昇順の行番号を連続した区間 [(先頭, 末尾), ...] にまとめる。"""
+    spans = []
+    for i in indices:
+        if spans and spans[-1][1] == i - 1:
+            spans[-1] = (spans[-1][0], i)
+        else:
+            spans.append((i, i))
+    return spans
+
+
+def _sync_spreadsheet(client, key: str, sources: List[SheetSource],
+                      previous: Dict[str, List[List[str]]], state: Dict[str, Dict[str, Any]],
+                      timestamp_column: str, retry: Dict[str, Any]):
+    """
+    1つのスプレッドシートにある sources を差分で取り込む。API 呼び出しは
+      1) 各シートの 1行目とタイムスタンプの列だけ (values_batch_get 1回)
+      2) 新しい行・タイムスタンプが変わった行 (全件取り直すシートはシート全体) (あれば values_batch_get 1回)
+    """
+    spreadsheet = with_retry(client.open_by_key, key, **retry)
+    titles = {}
+    probe_ranges = []
+    for src in sources:
+        title = _worksheet_title(spreadsheet, src, retry)
+        titles[src.name] = title
+        probe_ranges += [_a1_range(title, "1:1"),
+                         _a1_range(title, f"{timestamp_column}2:{timestamp_column}")]
+    probe = with_retry(spreadsheet.values_batch_get, probe_ranges, **retry).get("valueRanges", [])
+
+    plans = {}
+    fetch_ranges = []
+    for n, src in enumerate(sources):
+        header_values = probe[2 * n].get("values", [])
+        header = header_values[0] if header_values else []
+        timestamps = [r[0] if r else "" for r in probe[2 * n + 1].get("values", [])]
+        prev_rows = previous.get(src.name)
+        prev_state = state.get(src.name)
+        full = (src.range is not None or prev_rows is None or prev_state is None
+                or prev_state.get("key") != key or prev_state.get("worksheet") != titles[src.name]
+                or len(prev_rows) - 1 != len(prev_state["timestamps"])
+                or row_hash(prev_rows[0]) != row_hash(header)
+                or len(timestamps) < len(prev_state["timestamps"]))
+        if full:
+            rows_to_fetch = None
+            fetch_ranges.append((src.name, None, _a1_range(titles[src.name], src.range)))
+        else:
+            prev_ts = prev_state["timestamps"]
+            rows_to_fetch = [i for i, ts in enumerate(timestamps) if i >= len(prev_ts) or ts != prev_ts[i]]
+            # シートの行番号 = データの添字 + 2 (1行目はヘッダー)
+            for first, last in _spans(rows_to_fetch):
+                fetch_ranges.append((src.name, first, _a1_range(titles[src.name], f"{first + 2}:{last + 2}")))
+        plans[src.name] = (timestamps, rows_to_fetch)
+
+    fetched = {}
+    if fetch_ranges:
+        response = with_retry(spreadsheet.values_batch_get, [r for _, _, r in fetch_ranges], **retry)
+        for (name, first, _), vr in zip(fetch_ranges, response.get("valueRanges", [])):
+            fetched.setdefault(name, []).append((first, vr.get("values", [])))
+
+    results = {}
+    new_state = {}
+    for src in sources:
+        timestamps, rows_to_fetch = plans[src.name]
+        prev_hashes = state.get(src.name, {}).get("hashes", [])
+        if rows_to_fetch is None:
+            _, values = fetched[src.name][0]
+            rows = _pad(values)
+            hashes = [row_hash(r) for r in rows[1:]]
+            changed = [i for i, h in enumerate(hashes) if i >= len(prev_hashes) or h != prev_hashes[i]]
+            mode, fetched_rows = "full", len(rows) - 1
+        else:
+            rows = list(previous[src.name])
+            hashes = list(prev_hashes)
+            changed = []
+            for first, values in fetched.get(src.name, []):
+                for offset, row in enumerate(values):
+                    i = first + offset
+                    h = row_hash(row)
+                    if i < len(hashes) and hashes[i] == h:
+                        continue
+                    if i + 1 < len(rows):
+                        rows[i + 1] = row
+                        hashes[i] = h
+                    else:
+                        rows.append(row)
+                        hashes.append(h)
+                    changed.append(i)
+            rows = _pad(rows)
+            mode, fetched_rows = "incremental", len(rows_to_fetch)
+        # 取り込んだ行のタイムスタンプを持っておく (次回はここから変わった行だけを取る)
+        timestamps = [r[_col_index(timestamp_column)] if r else "" for r in rows[1:]]
+        results[src.name] = rows
+        new_state[src.name] = {"key": key, "worksheet": titles[src.name], "timestamps": timestamps,
+                               "hashes": hashes,
+                               "last_sync": {"mode": mode, "fetched_rows": fetched_rows, "changed_rows": changed}}
+    return results, new_state
+
+
+def sync_sheets(client, sources: List[SheetSource],
+                previous: Dict[str, List[List[str]]],
+                state: Dict[str, Dict[str, Any]],
+                timestamp_column: str = TIMESTAMP_COLUMN,
+                max_workers: int = 8, max_retries: int = 5,
+                base_delay: float = 1.0) -> Tuple[Dict[str, List[List[str]]], Dict[str, Dict[str, Any]]]:
+    """
+    fetch_sheets の差分版。previous は前回の {name: 行のリスト}、state は前回の sync_sheets が返した状態。
+    タイムスタンプの列だけを読んで、新しい行とタイムスタンプが変わった行だけを取りに行き、previous に差し込む。
+    戻り値は (今回の {name: 行のリスト}, 新しい状態)。状態は name ごとに
+      {"key", "worksheet", "timestamps": [行ごと], "hashes": [行ごと],
+       "last_sync": {"mode": "full" / "incremental", "fetched_rows": 取った行数, "changed_rows": [中身が変わった行の添字]}}
+    (添字はヘッダーを除いた 0 始まり)。次の場合はシート全体を取り直す:
+      前回の状態が無い / ヘッダーが変わった / 行が減った (回答の削除) / range を指定したシート
+    タイムスタンプを変えずにセルを手で直した行は検出できないので、その場合は fetch_sheets で取り直す。
+    """
+    by_key = defaultdict(list)
+    for src in sources:
+        by_key[src.key].append(src)
+    retry = {"max_retries": max_retries, "base_delay": base_delay}
+
+    start = time.perf_counter()
+    results, new_state = {}, {}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(by_key)))) as pool:
+        futures = {pool.submit(_sync_spreadsheet, client, key, srcs, previous, state,
+                               timestamp_column, retry): key
+                   for key, srcs in by_key.items()}
+        for future, key in futures.items():
+            try:
+                rows, st = future.result()
+            except Exception as e:
+                logger.error(f"Error syncing spreadsheet {key}: {e}")
+                raise
+            results.update(rows)
+            new_state.update(st)
+    for name, st in new_state.items():
+        info = st["last_sync"]
+        logger.info(f"Synced sheet {name} ({info['mode']}): fetched {info['fetched_rows']} rows, "
+                    f"{len(info['changed_rows'])} changed, {len(st['hashes'])} total")
+    logger.info(f"Synced {len(results)} sheets from {len(by_key)} spreadsheets "
+                f"in {time.perf_counter() - start:.2f}s")
+    return results, new_state
+
+
+# ------------------------------------------------------------
+# オフライン用のスタブ
+# ------------------------------------------------------------
+class StubAPIError(Exception):
+    """gspread.exceptions.APIError の代わり (code に HTTP ステータスを持つ)。"""
+    def __init__(self, code: int, message: str = ""):
+        super().__init__(f"{code} {message}".strip())
+        self.code = code
+
+
+def _col_index(letters: str) -> int:
+    n = 0
+    for ch in letters.upper():
+        n = n * 26 + (ord(ch) - ord("A") + 1)
+    return n - 1
+
+
+def _slice_a1(rows: List[List[str]], cell_range: Optional[str]) -> List[List[str]]:
+    """"A1:C", "2:5", "B3:D10" などの範囲で rows を切り出す (API と同じく行末の空セルは落とす)。"""
+    if cell_range:
+        m = re.fullmatch(r"([A-Za-z]*)(\d*):([A-Za-z]*)(\d*)", cell_range)
+        if not m:
+            raise StubAPIError(400, f"Unable to parse range: {cell_range}")
+        c0, r0, c1, r1 = m.groups()
+        col_start = _col_index(c0) if c0 else 0
+        col_end = _col_index(c1) + 1 if c1 else None
+        row_start = int(r0) - 1 if r0 else 0
+        row_end = int(r1) if r1 else None
+        rows = [r[col_start:col_end] for r in rows[row_start:row_end]]
+    trimmed = []
+    for r in rows:
+        r = list(r)
+        while r and r[-1] == "":
+            r.pop()
+        trimmed.append(r)
+    while trimmed and not trimmed[-1]:
+        trimmed.pop()
+    return trimmed
+
+
+class StubWorksheet:
+    def __init__(self, title: str, rows: List[List[str]]):
+        self.title = title
+        self.rows = rows
+
+    @property
+    def row_count(self):
+        return len(self.rows)
+
+    def get_all_values(self):
+        return _pad(self.rows)
+
+    def get_values(self, cell_range: Optional[str] = None):
+        return _pad(_slice_a1(self.rows, cell_range))
+
+    def batch_get(self, ranges: List[str]):
+        return [_slice_a1(self.rows, r) for r in ranges]
+
+
+class StubSpreadsheet:
+    def __init__(self, client: "StubClient", key: str, worksheets: Dict[str, List[List[str]]]):
+        self._client = client
+        self.id = key
+        self._worksheets = [StubWorksheet(title, rows) for title, rows in worksheets.items()]
+
+    # gspread と同じく sheet1 / worksheet はメタデータの API 呼び出しとして数える (失敗もする)
+    @property
+    def sheet1(self):
+        self._client._call("fetch_sheet_metadata")
+        return self._worksheets[0]
+
+    def worksheet(self, title: str):
+        self._client._call("fetch_sheet_metadata")
+        return self._find(title)
+
+    def _find(self, title: str):
+        for ws in self._worksheets:
+            if ws.title == title:
+                return ws
+        raise StubAPIError(404, f"Worksheet {title} not found")
+
+    def values_batch_get(self, ranges: List[str]):
+        self._client._call("values_batch_get")
+        value_ranges = []
+        for r in ranges:
+            title, _, cell_range = r.rpartition("!") if "!" in r else (r, "", "")
+            title = title.strip("'").replace("''", "'")
+            values = _slice_a1(self._find(title).rows, cell_range or None)
+            self._client.calls["cells"] += sum(len(v) for v in values)
+            value_ranges.append({"range": r, "values": values})
+        return {"spreadsheetId": self.id, "valueRanges": value_ranges}
+
+
+class StubClient:
+    """
+    gspread.Client の代わり。spreadsheets は {key: {シート名: 行のリスト}}。
+      fail_times : 最初の n 回の API 呼び出しを fail_status で失敗させる (再試行の確認用)
+      latency    : API 呼び出し1回あたりの待ち時間 (秒、並列化の確認用)
+    calls は API ごとの呼び出し回数と、values_batch_get が返したセル数 ("cells")。
+    シートの中身は spreadsheets の行のリストをそのまま使うので、行を足したり書き換えたりすれば
+    フォームに回答が届いた状態を再現できる。
+    """
+    def __init__(self, spreadsheets: Dict[str, Dict[str, List[List[str]]]],
+                 fail_times: int = 0, fail_status: int = 429, latency: float = 0.0):
+        self._spreadsheets = spreadsheets
+        self._fail_times = fail_times
+        self._fail_status = fail_status
+        self._latency = latency
+        self.calls = defaultdict(int)
+
+    @classmethod
+    def from_dir(cls, dir_path: str, **kwargs) -> "StubClient":
+        """dir_path/<key>/<シート名>.csv (または dir_path/<key>.csv を1枚目のシート) から作る。"""
+        spreadsheets = {}
+        for entry in sorted(os.listdir(dir_path)):
+            path = os.path.join(dir_path, entry)
+            if os.path.isdir(path):
+                sheets = {}
+                for fname in sorted(os.listdir(path)):
+                    if fname.endswith(".csv"):
+                        sheets[fname[:-4]] = _read_csv_rows(os.path.join(path, fname))
+                spreadsheets[entry] = sheets
+            elif entry.endswith(".csv"):
+                spreadsheets[entry[:-4]] = {"Sheet1": _read_csv_rows(path)}
+        return cls(spreadsheets, **kwargs)
+
+    def _call(self, name: str):
+        self.calls[name] += 1
+        if self._latency:
+            time.sleep(self._latency)
+        if self._fail_times > 0:
+            self._fail_times -= 1
+            raise StubAPIError(self._fail_status, "stub failure")
+
+    def open_by_key(self, key: str):
+        self._call("open_by_key")
+        if key not in self._spreadsheets:
+            raise StubAPIError(404, f"Spreadsheet {key} not found")
+        return StubSpreadsheet(self, key, self._spreadsheets[key])
+
+
+def _read_csv_rows(path: str) -> List[List[str]]:
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        return [row for row in csv.reader(f)]
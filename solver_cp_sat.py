@@ -1,13 +1,373 @@
 # solver_cp_sat.py
 
 import logging
-from typing import Dict, List
+import os
+import threading
+import time
+from typing import Dict, List, Any, Set, Tuple, Callable, Iterator
 from collections import defaultdict
 from ortools.sat.python import cp_model
-from models import Teacher, Student, TimeSlot, Campaign, RegularClass, Shift, Subject
+from profiling import RunProfiler, NullProfiler
+from models import Teacher, Student, TimeSlot, Campaign, RegularClass, Shift, Subject, mask_indices
 
 logger = logging.getLogger(__name__)
 
+
+class XIndex:
+    """
+    x[(t_id, s_id, subj_id, ts_id)] を各キーで引けるようにした索引。
+    x を1回走査するだけで作成し、各制約セクションで使い回す。
+    """
+    def __init__(self):
+        self.by_teacher = defaultdict(list)          # t_id -> [var]
+        self.by_student = defaultdict(list)          # s_id -> [var]
+        self.by_timeslot = defaultdict(list)         # ts_id -> [var]
+        self.by_teacher_ts = defaultdict(list)       # (t_id, ts_id) -> [var]
+        self.by_student_ts = defaultdict(list)       # (s_id, ts_id) -> [var]
+        self.by_student_subject = defaultdict(list)  # (s_id, subj_id) -> [var]
+
+
+def build_x_index(x) -> XIndex:
+    idx = XIndex()
+    for (t_id, s_id, subj_id, ts_id), var in x.items():
+        idx.by_teacher[t_id].append(var)
+        idx.by_student[s_id].append(var)
+        idx.by_timeslot[ts_id].append(var)
+        idx.by_teacher_ts[(t_id, ts_id)].append(var)
+        idx.by_student_ts[(s_id, ts_id)].append(var)
+        idx.by_student_subject[(s_id, subj_id)].append(var)
+    return idx
+
+
+def apply_solver_params(solver: cp_model.CpSolver, solver_params: Dict[str, Any]):
+    """
+    config.SOLVER_PARAMS / solver_params.csv の値を CpSolver.parameters に反映する。
+    0 (or False) の項目は CP-SAT のデフォルトのまま。
+    """
+    if not solver_params:
+        return
+    max_time = solver_params.get("max_time_in_seconds", 0)
+    if max_time > 0:
+        solver.parameters.max_time_in_seconds = float(max_time)
+    workers = solver_params.get("num_search_workers", 0)
+    if workers > 0:
+        solver.parameters.num_workers = int(workers)
+    rel_gap = solver_params.get("relative_gap_limit", 0.0)
+    if rel_gap > 0:
+        solver.parameters.relative_gap_limit = float(rel_gap)
+    abs_gap = solver_params.get("absolute_gap_limit", 0.0)
+    if abs_gap > 0:
+        solver.parameters.absolute_gap_limit = float(abs_gap)
+    seed = solver_params.get("random_seed", 0)
+    if seed:
+        solver.parameters.random_seed = int(seed)
+    if solver_params.get("log_search_progress", False):
+        solver.parameters.log_search_progress = True
+        solver.parameters.log_to_stdout = False
+        solver.log_callback = logger.info
+
+
+def split_workers(solver_params: Dict[str, Any], n_processes: int) -> Dict[str, Any]:
+    """
+    n_processes 個の solve_shifts を同時に走らせるときの solver_params (コピー) を返す。
+    num_search_workers (0 なら CPU 数) を プロセス数で割り、CPU の取り合いにならないようにする。
+    """
+    params = dict(solver_params or {})
+    total = params.get("num_search_workers", 0) or os.cpu_count() or 1
+    params["num_search_workers"] = max(1, total // max(1, n_processes))
+    return params
+
+
+# hint_completion_time は max_time_in_seconds のこの割合までに抑える
+HINT_COMPLETION_MAX_FRACTION = 0.1
+
+
+def hint_completion_budget(solver_params: Dict[str, Any]) -> float:
+    """
+    complete_hint に使う秒数。solver_params の hint_completion_time (無い・0 なら使わない) を、
+    max_time_in_seconds がある場合はその HINT_COMPLETION_MAX_FRACTION 倍までに抑える。
+    """
+    solver_params = solver_params or {}
+    limit = float(solver_params.get("hint_completion_time", 0) or 0)
+    max_time = solver_params.get("max_time_in_seconds", 0)
+    if max_time > 0:
+        limit = min(limit, max_time * HINT_COMPLETION_MAX_FRACTION)
+    return max(limit, 0.0)
+
+
+def complete_hint(model: cp_model.CpModel,
+                  x: Dict[Tuple[str, str, str, str], Any],
+                  assignment: Set[Tuple[str, str, str, str]],
+                  time_limit: float) -> bool:
+    """
+    x を assignment に固定したモデルのコピーを time_limit 秒まで解き、補助変数 (shortage / is_two / gap など)
+    まで含めた全変数のヒントを model に入れる。x だけのヒントだと CP-SAT (特にワーカー1つ) が残りを埋められず、
+    ヒントが実行可能でも最初の解が出ないことがあるため。
+    固定したモデルが解けなければ (ヒントが今回の制約に合わない) 何もせず False を返す。
+    """
+    fixed = model.Clone()
+    for key, var in x.items():
+        fixed.Add(fixed.GetBoolVarFromProtoIndex(var.Index()) == (1 if key in assignment else 0))
+    solver = cp_model.CpSolver()
+    solver.parameters.max_time_in_seconds = time_limit
+    solver.parameters.num_workers = 1
+    status = solver.Solve(fixed)
+    if status not in [cp_model.OPTIMAL, cp_model.FEASIBLE]:
+        return False
+    # 変数ごとに AddHint すると大きなモデルで遅いので proto に直接入れる
+    model.ClearHints()
+    solution = list(solver.ResponseProto().solution)
+    hint = model.Proto().solution_hint
+    hint.vars.extend(range(len(solution)))
+    hint.values.extend(solution)
+    return True
+
+
+def describe_stop_reason(solver: cp_model.CpSolver, status, solver_params: Dict[str, Any]) -> str:
+    """探索がどの条件で止まったかを人間向けの文字列で返す。"""
+    solver_params = solver_params or {}
+    if status == cp_model.INFEASIBLE:
+        return "infeasible"
+    if status == cp_model.MODEL_INVALID:
+        return "model invalid"
+    if status == cp_model.OPTIMAL:
+        # ギャップ上限で打ち切った場合も CP-SAT は OPTIMAL を返す
+        gap_set = (solver_params.get("relative_gap_limit", 0) > 0
+                   or solver_params.get("absolute_gap_limit", 0) > 0)
+        if gap_set and solver.BestObjectiveBound() != solver.ObjectiveValue():
+            return "gap limit reached"
+        return "optimal"
+    max_time = solver_params.get("max_time_in_seconds", 0)
+    if max_time > 0 and solver.WallTime() >= max_time * 0.99:
+        return "time limit reached"
+    return f"stopped ({solver.StatusName(status)})"
+
+
+def find_unreachable_teachers(teachers: Dict[str, Teacher],
+                              students: Dict[str, Student],
+                              students_by_subject: Dict[str, List[str]],
+                              campaign_mask: int,
+                              teacher_conflict_mask: Dict[str, int]) -> Set[str]:
+    """
+    どう割り当てても min_classes に届かない教師を返す。
+    こうした教師は出勤フラグが必ず 0 になり、x もすべて 0 なので作らなくてよい。
+    上限は「担当できる生徒が1人でも来られるコマ数 × 2名」で見積もる。
+    """
+    unreachable = set()
+    eliminated = 0
+    for t_id, t_obj in teachers.items():
+        if t_obj.min_classes <= 0:
+            continue
+        t_mask = t_obj.availability_mask & campaign_mask & ~teacher_conflict_mask[t_id]
+        reachable_mask = 0
+        n_candidates = 0
+        for sbj_obj in t_obj.teachable_subjects:
+            for s_id in students_by_subject.get(sbj_obj.subject_id, []):
+                common = t_mask & students[s_id].availability_mask
+                reachable_mask |= common
+                n_candidates += bin(common).count("1")
+        if 2 * bin(reachable_mask).count("1") < t_obj.min_classes:
+            unreachable.add(t_id)
+            eliminated += n_candidates
+    if unreachable:
+        logger.info(f"Presolve: {len(unreachable)} teachers can never reach min_classes, "
+                    f"{eliminated} x vars eliminated: {sorted(unreachable)}")
+    return unreachable
+
+
+def find_interchangeable_teachers(teachers: Dict[str, Teacher],
+                                  campaign_mask: int,
+                                  teacher_conflict_mask: Dict[str, int],
+                                  regular_classes: Dict[str, RegularClass]) -> List[List[str]]:
+    """
+    担当科目・空きコマ・desired_shift_count・min_classes がすべて同じで、
+    レギュラー授業を持たない教師のグループ (2名以上) を返す。
+    グループ内の教師はスケジュールを丸ごと入れ替えても目的関数が変わらない。
+    """
+    has_regular = {rc.teacher_id for rc in regular_classes.values()}
+    groups = defaultdict(list)
+    for t_id, t_obj in teachers.items():
+        if t_id in has_regular:
+            continue
+        key = (frozenset(sbj.subject_id for sbj in t_obj.teachable_subjects),
+               t_obj.availability_mask & campaign_mask,
+               teacher_conflict_mask[t_id],
+               t_obj.desired_shift_count,
+               t_obj.min_classes)
+        groups[key].append(t_id)
+    return [sorted(g) for g in groups.values() if len(g) > 1]
+
+
+def generate_candidates(teacher_subject_pairs: List[Tuple[str, str]],
+                        students_by_subject: Dict[str, List[str]],
+                        teacher_masks: Dict[str, int],
+                        students: Dict[str, Student],
+                        ts_by_index: Dict[int, TimeSlot]) -> Iterator[Tuple[str, str, str, str]]:
+    """
+    x の候補 (t_id, s_id, subj_id, ts_id) を列挙する。教師と生徒の空きマスクの AND を取るだけ。
+    順序は 教師 → 教師の担当科目 → 生徒 → timeslot.index。
+    """
+    for (t_id, subj_id) in teacher_subject_pairs:
+        t_mask = teacher_masks[t_id]
+        if not t_mask:
+            continue
+        for s_id in students_by_subject.get(subj_id, []):
+            for ts_idx in mask_indices(t_mask & students[s_id].availability_mask):
+                yield (t_id, s_id, subj_id, ts_by_index[ts_idx].timeslot_id)
+
+
+# generate_candidates_numpy で1度に作る (組, 生徒, コマ) の bool 配列の要素数の上限
+CANDIDATE_CHUNK_CELLS = 1 << 24
+
+
+def _mask_matrix(masks: List[int], columns):
+    """
+    ビットマスクのリストを (len(masks), len(columns)) の bool 行列にする。columns は残すビット位置。
+    生徒の空きには他のキャンペーンのコマ (columns より上のビット) も入っているので、先に columns だけに絞る。
+    """
+    import numpy as np
+    keep = 0
+    for c in columns:
+        keep |= 1 << c
+    n_bytes = max((max(columns) // 8) + 1, 1)
+    raw = b"".join((m & keep).to_bytes(n_bytes, "little") for m in masks)
+    bits = np.unpackbits(np.frombuffer(raw, dtype=np.uint8).reshape(len(masks), n_bytes),
+                         axis=1, bitorder="little")
+    return bits[:, columns].astype(bool)
+
+
+def generate_candidates_numpy(teacher_subject_pairs: List[Tuple[str, str]],
+                              students_by_subject: Dict[str, List[str]],
+                              teacher_masks: Dict[str, int],
+                              students: Dict[str, Student],
+                              ts_by_index: Dict[int, TimeSlot]) -> List[Tuple[str, str, str, str]]:
+    """
+    generate_candidates と同じ候補を同じ順序で NumPy を使って求める。
+    教師・生徒の空きをそれぞれ1度だけ bool 行列にし、科目ごとに
+    (その科目の教師の行, 1, コマ) & (1, その科目の生徒の行, コマ) をブロードキャストして np.nonzero で取り出す。
+    途中は整数の添字だけで持ち、最後に (教師, 科目) の並び順で安定ソートして ID の配列へ一括で変換する。
+    """
+    import numpy as np
+
+    if not teacher_subject_pairs or not ts_by_index:
+        return []
+    ts_indices = sorted(ts_by_index)
+    n_ts = len(ts_indices)
+    ts_ids = np.array([ts_by_index[i].timeslot_id for i in ts_indices], dtype=object)
+    s_ids = list(students)
+    s_pos = {s_id: i for i, s_id in enumerate(s_ids)}
+    student_avail = _mask_matrix([students[s_id].availability_mask for s_id in s_ids], ts_indices)
+    t_ids = list(teacher_masks)
+    t_pos = {t_id: i for i, t_id in enumerate(t_ids)}
+    teacher_avail = _mask_matrix([teacher_masks[t_id] for t_id in t_ids], ts_indices)
+
+    # 科目ごとの (教師, 科目) の組の番号 (空きのない教師は除く)
+    pairs_by_subject = defaultdict(list)
+    for pair_no, (t_id, subj_id) in enumerate(teacher_subject_pairs):
+        if teacher_masks[t_id] and students_by_subject.get(subj_id):
+            pairs_by_subject[subj_id].append(pair_no)
+
+    pair_cols, s_cols, ts_cols = [], [], []
+    for subj_id, pair_nos in pairs_by_subject.items():
+        pair_nos = np.array(pair_nos, dtype=np.int64)
+        t_rows = teacher_avail[[t_pos[teacher_subject_pairs[p][0]] for p in pair_nos]]
+        sj = np.array([s_pos[s_id] for s_id in students_by_subject[subj_id]], dtype=np.int64)
+        s_avail = student_avail[sj]
+        # (組, 生徒, コマ) の bool 配列が大きくなりすぎないよう、組を CANDIDATE_CHUNK_CELLS ずつに分ける
+        step = max(1, CANDIDATE_CHUNK_CELLS // max(1, len(sj) * n_ts))
+        for lo in range(0, len(pair_nos), step):
+            p, r, c = np.nonzero(t_rows[lo:lo + step, None, :] & s_avail[None, :, :])
+            pair_cols.append(pair_nos[lo + p])
+            s_cols.append(sj[r])
+            ts_cols.append(c)
+
+    if not pair_cols:
+        return []
+    pair_codes = np.concatenate(pair_cols)
+    # np.nonzero は (組, 生徒, コマ) の順に並ぶので、組の番号で安定ソートすれば generate_candidates と同じ順序
+    order = np.argsort(pair_codes, kind="stable")
+    pair_codes = pair_codes[order]
+    pair_t = np.array([t_id for t_id, _ in teacher_subject_pairs], dtype=object)
+    pair_subj = np.array([subj_id for _, subj_id in teacher_subject_pairs], dtype=object)
+    return list(zip(pair_t[pair_codes].tolist(),
+                    np.array(s_ids, dtype=object)[np.concatenate(s_cols)[order]].tolist(),
+                    pair_subj[pair_codes].tolist(),
+                    ts_ids[np.concatenate(ts_cols)[order]].tolist()))
+
+
+class StreamingSolutionCallback(cp_model.CpSolverSolutionCallback):
+    """
+    CP-SAT が改善解を見つけるたびに Shift を組み立て、on_solution に渡す。
+    前回の書き出しから min_interval 秒たっていない解は保留にし (response_proto の写しを持つだけ)、
+    間隔が空いたところでタイマーのスレッドから書き出す。探索が終わったら flush で残りを書き出す。
+    途中で止められても、ディスク上の解が最良解から min_interval 秒以上遅れることはない。
+    """
+    def __init__(self, x, shortage, teachers, students, timeslots, subjects,
+                 on_solution: Callable[[List[Shift], Dict, float], None],
+                 min_interval: float = 5.0):
+        super().__init__()
+        self._x = x
+        self._shortage = shortage
+        self._teachers = teachers
+        self._students = students
+        self._timeslots = timeslots
+        self._subjects = subjects
+        self._on_solution = on_solution
+        self._min_interval = min_interval
+        self._last_export = None
+        self._pending = None      # まだ書き出していない最新の解 (response_proto, 何番目の解か)
+        self._timer = None
+        self._state_lock = threading.Lock()   # _pending / _timer / _last_export
+        self._export_lock = threading.Lock()  # on_solution を同時に呼ばない
+        self.num_solutions = 0
+        self.num_exported = 0
+
+    def on_solution_callback(self):
+        self.num_solutions += 1
+        with self._state_lock:
+            self._pending = (self.response_proto, self.num_solutions)
+            if self._last_export is not None:
+                wait = self._min_interval - (time.perf_counter() - self._last_export)
+                if wait > 0:
+                    if self._timer is None:
+                        self._timer = threading.Timer(wait, self._export_pending)
+                        self._timer.daemon = True
+                        self._timer.start()
+                    return
+        self._export_pending()
+
+    def flush(self):
+        """保留中の解があれば書き出す (solve_shifts が探索の後に呼ぶ)。"""
+        with self._state_lock:
+            if self._timer is not None:
+                self._timer.cancel()
+        self._export_pending()
+
+    def _export_pending(self):
+        with self._export_lock:
+            with self._state_lock:
+                pending, self._pending = self._pending, None
+                self._timer = None
+                if pending is None:
+                    return
+                self._last_export = time.perf_counter()
+            response, number = pending
+            values = response.solution
+            assigned = [key for key, var in self._x.items() if values[var.Index()]]
+            shifts = shifts_from_assignment(assigned, self._teachers, self._students,
+                                            self._timeslots, self._subjects)
+            shortage_result = {key: values[var.Index()] for key, var in self._shortage.items()}
+            objective = response.objective_value
+            logger.info(f"Improving solution #{number}: ObjVal={objective} at {response.wall_time:.1f}s")
+            try:
+                self._on_solution(shifts, shortage_result, objective)
+            except Exception as e:
+                # 途中経過の出力に失敗しても探索は止めない
+                logger.error(f"Error in on_solution callback: {e}")
+                return
+            self.num_exported += 1
+
+
 def solve_shifts(teachers: Dict[str, Teacher],
                  students: Dict[str, Student],
                  timeslots: Dict[str, TimeSlot],
@@ -15,15 +375,51 @@ def solve_shifts(teachers: Dict[str, Teacher],
                  regular_classes: Dict[str, RegularClass],
                  subjects: Dict[str, Subject],
                  campaign_id: str,
-                 constraint_weights: Dict[str, float]):
+                 constraint_weights: Dict[str, float],
+                 solver_params: Dict[str, Any] = None,
+                 solve_stats: Dict[str, Any] = None,
+                 previous_assignment: Set[Tuple[str, str, str, str]] = None,
+                 affected: Tuple[Set[str], Set[str]] = None,
+                 prune: bool = True,
+                 encoding: str = "reified",
+                 profiler: RunProfiler = None,
+                 on_solution: Callable[[List[Shift], Dict, float], None] = None,
+                 stream_interval: float = 5.0,
+                 candidate_backend: str = "bitmask",
+                 hint_assignment: Set[Tuple[str, str, str, str]] = None,
+                 free: Callable[[Tuple[str, str, str, str]], bool] = None):
     """
     ソルバー本体。可読性を意識し、セクションごとにコメントを付与。
       1) 変数定義
       2) ハード制約 (Constraints)
       3) ソフト制約 (Objective function)
       4) Solve & Build result
+
+    solver_params: apply_solver_params に渡す探索パラメータ (None なら CP-SAT のデフォルト)。
+                   hint_completion_time > 0 ならヒントを complete_hint で補助変数まで埋める
+                   (hint_completion_budget 秒まで。かかった時間は max_time_in_seconds から引く)
+    solve_stats  : dict を渡すと build_time / num_variables / num_constraints と
+                   status / objective / best_bound / wall_time / stop_reason を書き込む
+    previous_assignment: 前回の割当 (t_id, s_id, subj_id, ts_id) の集合。x のヒントに使う。
+                         constraint_weights の scheduleChangePenalty > 0 なら前回からの変更も罰する。
+    affected     : 差分モード用の (teacher_ids, student_ids)。どちらにも含まれない組は
+                   previous_assignment の割当に固定し、affected 側だけを最適化し直す。
+    prune        : True なら min_classes に届かない教師の x を作らず、
+                   入れ替え可能な教師どうしの対称性を除く (最適値は変わらない)
+    encoding     : 指標変数 (is_two / is_one / assigned / gap) の表し方。
+                   "reified" は ==/!= の OnlyEnforceIf ペア、"linear" は線形式と AddMaxEquality
+    profiler     : profiling.RunProfiler。渡すと各セクションの時間・変数数・制約数とソルバー結果を記録する
+    on_solution  : 探索中に改善解が見つかるたびに (shifts, shortage, objective) で呼ばれる。
+                   呼び出しは stream_interval 秒に1回まで (I/O で探索を止めないため)
+    candidate_backend: x 候補の列挙方法。"bitmask" (Python のビット演算) か "numpy" (行列のブロードキャスト)
+    hint_assignment: x のヒントに使う割当 (heuristic.solve_shifts_greedy の解など)。
+                     指定すると previous_assignment の代わりにヒントになる (変更ペナルティは previous_assignment のまま)
+    free         : LNS 用。free(key) が偽の x は hint_assignment の値に固定し、真の x だけを解き直す
     """
 
+    build_start = time.perf_counter()
+    profiler = profiler or NullProfiler()
+    profiler.start_laps()
     model = cp_model.CpModel()
 
     # --------------------------------------
@@ -34,15 +430,26 @@ def solve_shifts(teachers: Dict[str, Teacher],
         logger.warning(f"No timeslots for campaign_id={campaign_id}")
         return [], {}
 
+    profiler.lap("0 target timeslots", model)
+
     # --------------------------------------
     # 1) 変数定義
     # --------------------------------------
     # 1-1) x[t_id, s_id, subj_id, ts_id] = 授業割当 (Binary)
-    teacher_time_conflict = defaultdict(bool)
+    # 空き時間は TimeSlot.index のビットマスクで持っているので、
+    # 教師と生徒の共通空きコマはビットANDで求める。
+    ts_by_index = {ts.index: ts for ts in target_timeslots}
+    campaign_mask = 0
+    for ts in target_timeslots:
+        campaign_mask |= 1 << ts.index
+
+    # レギュラー授業と衝突するコマは教師の空きから除外する
+    teacher_conflict_mask = defaultdict(int)
     regular_class_continuity_info = set()
     for rc_id, rc_obj in regular_classes.items():
         sbj_id = rc_obj.subject.subject_id
-        teacher_time_conflict[(rc_obj.teacher_id, rc_obj.timeslot_id)] = True
+        if rc_obj.timeslot_id in timeslots:
+            teacher_conflict_mask[rc_obj.teacher_id] |= 1 << timeslots[rc_obj.timeslot_id].index
         for st_id in rc_obj.enrolled_student_ids:
             regular_class_continuity_info.add((st_id, rc_obj.teacher_id, sbj_id))
 
@@ -52,27 +459,63 @@ def solve_shifts(teachers: Dict[str, Teacher],
         for sbj_obj in t_obj.teachable_subjects:
             teacher_subject_pairs.append((t_id, sbj_obj.subject_id))
 
-    # student_subject_pairs
-    student_subject_pairs = []
+    # 科目ごとの受講生徒 (requirement > 0)
+    students_by_subject = defaultdict(list)
     for s_id, s_obj in students.items():
         for sbj_id, req_num in s_obj.requirements.items():
             if req_num > 0:
-                student_subject_pairs.append((s_id, sbj_id))
+                students_by_subject[sbj_id].append(s_id)
+
+    # 差分モード: affected に含まれない教師×生徒の組は前回の割当で固定する
+    # (前回あった割当だけ x を作って 1 に固定し、それ以外の x は作らない)
+    if affected is not None:
+        affected_teachers, affected_students = affected
+        frozen_assignment = previous_assignment or set()
+    # LNS: free(key) が偽の組は現在の解 (hint_assignment) で同じように固定する
+    if free is not None:
+        frozen_assignment = hint_assignment or set()
+
+    # 1-0) 前処理: 結果を変えずに x 候補を減らす
+    unreachable_teachers = set()
+    if prune:
+        unreachable_teachers = find_unreachable_teachers(
+            teachers, students, students_by_subject, campaign_mask, teacher_conflict_mask)
+
+    # 教師ごとの実際に使える空きコマ (キャンペーン内、レギュラー授業と衝突しない)
+    teacher_masks = {}
+    for t_id, t_obj in teachers.items():
+        if t_id in unreachable_teachers:
+            teacher_masks[t_id] = 0
+        else:
+            teacher_masks[t_id] = t_obj.availability_mask & campaign_mask & ~teacher_conflict_mask[t_id]
+
+    if candidate_backend == "numpy":
+        candidates = generate_candidates_numpy(teacher_subject_pairs, students_by_subject,
+                                               teacher_masks, students, ts_by_index)
+    else:
+        candidates = generate_candidates(teacher_subject_pairs, students_by_subject,
+                                         teacher_masks, students, ts_by_index)
 
     x = {}
-    for ts in target_timeslots:
-        ts_id = ts.timeslot_id
-        for (t_id, subj_id) in teacher_subject_pairs:
-            # レギュラー授業と衝突？
-            if teacher_time_conflict[(t_id, ts_id)]:
-                continue
-            if ts not in teachers[t_id].available_timeslots:
-                continue
-            for (s_id, stud_subj) in student_subject_pairs:
-                if stud_subj == subj_id:
-                    if ts in students[s_id].available_timeslots:
-                        var_name = f"x_{t_id}_{s_id}_{subj_id}_{ts_id}"
-                        x[(t_id, s_id, subj_id, ts_id)] = model.NewBoolVar(var_name)
+    for key in candidates:
+        t_id, s_id, subj_id, ts_id = key
+        frozen = ((affected is not None and t_id not in affected_teachers and s_id not in affected_students)
+                  or (free is not None and not free(key)))
+        if frozen and key not in frozen_assignment:
+            continue
+        var_name = f"x_{t_id}_{s_id}_{subj_id}_{ts_id}"
+        x[key] = model.NewBoolVar(var_name)
+        if frozen:
+            model.Add(x[key] == 1)
+
+    if affected is not None:
+        logger.info(f"Incremental mode: {len(affected_teachers)} teachers / "
+                    f"{len(affected_students)} students re-optimized, {len(x)} x vars.")
+
+    # x の索引 (以降の制約で x.keys() を毎回走査しないため)
+    x_index = build_x_index(x)
+
+    profiler.lap("1-1 x", model)
 
     # 1-2) 教師出勤フラグ present[t_id]
     teacher_present = {}
@@ -103,6 +546,8 @@ def solve_shifts(teachers: Dict[str, Teacher],
         over[t_id] = model.NewIntVar(0, bigM, f"over_{t_id}")
         under[t_id] = model.NewIntVar(0, bigM, f"under_{t_id}")
 
+    profiler.lap("1-2..1-6 aux vars", model)
+
     # --------------------------------------
     # 2) ハード制約 (Constraints)
     # --------------------------------------
@@ -110,10 +555,7 @@ def solve_shifts(teachers: Dict[str, Teacher],
     # 2-1) 教師出勤フラグとの連動
     # sum_x_t[t_id] = sum of x[t_id, *]
     for t_id in teachers.keys():
-        relevant_vars = []
-        for (tt, ss, sbj, ts_id) in x.keys():
-            if tt == t_id:
-                relevant_vars.append(x[(tt, ss, sbj, ts_id)])
+        relevant_vars = x_index.by_teacher.get(t_id, [])
         model.Add(sum_x_t[t_id] == sum(relevant_vars))
         # 出勤 => sum_x_t[t_id] >=1
         model.Add(sum_x_t[t_id] >= 1).OnlyEnforceIf(teacher_present[t_id])
@@ -122,40 +564,50 @@ def solve_shifts(teachers: Dict[str, Teacher],
         model.Add(sum_x_t[t_id] >= teachers[t_id].min_classes).OnlyEnforceIf(teacher_present[t_id])
         
         # sum_x_t[t_id] - desired_shift_count = over[t_id] - under[t_id]
-        desired = t_obj.desired_shift_count
+        desired = teachers[t_id].desired_shift_count
         model.Add(sum_x_t[t_id] - desired == over[t_id] - under[t_id])
 
+    profiler.lap("2-1 teacher presence", model)
+
+    # 2-1b) 対称性の除去: 入れ替えても目的関数が変わらない教師どうしは
+    # コマ数の多い順に並べた解だけを許す
+    # (差分モードや変更ペナルティがあると教師ごとに前回の割当が違うので入れ替え可能ではない)
+    # (ヒントを渡された場合も、並べ替えるとヒントが制約違反になるので除かない)
+    keeps_previous = affected is not None or hint_assignment is not None or (
+        previous_assignment and constraint_weights.get("scheduleChangePenalty", 0) > 0)
+    if prune and not keeps_previous:
+        symmetric_groups = find_interchangeable_teachers(
+            teachers, campaign_mask, teacher_conflict_mask, regular_classes)
+        for group in symmetric_groups:
+            for a, b in zip(group, group[1:]):
+                model.Add(sum_x_t[a] >= sum_x_t[b])
+        if symmetric_groups:
+            logger.info(f"Presolve: {len(symmetric_groups)} groups of interchangeable teachers "
+                        f"({sum(len(g) for g in symmetric_groups)} teachers) ordered by load.")
+
+    profiler.lap("2-1b symmetry", model)
+
     # 2-2) 同一Timeslotで生徒重複NG
-    for ts in target_timeslots:
-        ts_id = ts.timeslot_id
-        for s_id in students.keys():
-            relevant_vars = []
-            for (t_, s_, sbj_, tslot) in x.keys():
-                if s_ == s_id and tslot == ts_id:
-                    relevant_vars.append(x[(t_, s_, sbj_, tslot)])
+    # (変数が1つ以下の組は自明に満たされるので省略)
+    for (s_id, ts_id), relevant_vars in x_index.by_student_ts.items():
+        if len(relevant_vars) > 1:
             model.Add(sum(relevant_vars) <= 1)
 
     # 2-3) 同一Timeslotで教師は最大2名
-    for ts in target_timeslots:
-        ts_id = ts.timeslot_id
-        for t_id in teachers.keys():
-            relevant_vars = []
-            for (tt, ss, sbj, tslot) in x.keys():
-                if tt == t_id and tslot == ts_id:
-                    relevant_vars.append(x[(tt, ss, sbj, tslot)])
+    for (t_id, ts_id), relevant_vars in x_index.by_teacher_ts.items():
+        if len(relevant_vars) > 2:
             model.Add(sum(relevant_vars) <= 2)
 
     # 2-4) 生徒の不足コマ => sum_x + shortage = req_num
     for s_id, s_obj in students.items():
         for sbj_id, req_num in s_obj.requirements.items():
             if req_num > 0:
-                relevant_vars = []
-                for (tt, ss, sbj, ts_id) in x.keys():
-                    if ss == s_id and sbj == sbj_id:
-                        relevant_vars.append(x[(tt, ss, sbj, ts_id)])
+                relevant_vars = x_index.by_student_subject.get((s_id, sbj_id), [])
                 short_var = shortage[(s_id, sbj_id)]
                 model.Add(sum(relevant_vars) + short_var == req_num)
 
+    profiler.lap("2-2..2-4 hard constraints", model)
+
     # --------------------------------------
     # 3) ソフト制約 (Objective function)
     # --------------------------------------
@@ -169,6 +621,7 @@ def solve_shifts(teachers: Dict[str, Teacher],
     singleStudentPenalty = constraint_weights.get("singleStudentPenalty", 0)
     shortagePenalty = constraint_weights.get("shortagePenalty", 0)
     teacherDesiredPenalty = constraint_weights.get("teacherDesiredPenalty", 0)
+    scheduleChangePenalty = constraint_weights.get("scheduleChangePenalty", 0)
     
     # 3-1) 生徒不足コマペナルティ
     for (s_id, sbj_id), short_var in shortage.items():
@@ -179,22 +632,35 @@ def solve_shifts(teachers: Dict[str, Teacher],
     for t_id, t_obj in teachers.items():
         obj_terms.append((over[t_id] + under[t_id]) * (-teacherDesiredPenalty))
 
+    profiler.lap("3-1 shortage / desired", model)
+
     # 3-2) 同一Teacher-Timeslotで 2対1 vs 1対1
     # cvar[t_id,ts_id] => # of assigned students(0..2)
+    # x が存在しない (t_id, ts_id) は常に0人なので変数を作らない
     teacher_ts_count = {}
-    for ts in target_timeslots:
-        ts_id = ts.timeslot_id
-        for t_id in teachers.keys():
-            cvar = model.NewIntVar(0, 2, f"count_{t_id}_{ts_id}")
-            teacher_ts_count[(t_id, ts_id)] = cvar
+    for (t_id, ts_id), relevant_vars in x_index.by_teacher_ts.items():
+        cvar = model.NewIntVar(0, 2, f"count_{t_id}_{ts_id}")
+        teacher_ts_count[(t_id, ts_id)] = cvar
 
     for (t_id, ts_id), cvar in teacher_ts_count.items():
-        relevant_vars = []
-        for (tt, ss, sbj, tslot) in x.keys():
-            if tt == t_id and tslot == ts_id:
-                relevant_vars.append(x[(tt, ss, sbj, tslot)])
+        relevant_vars = x_index.by_teacher_ts[(t_id, ts_id)]
         model.Add(cvar == sum(relevant_vars))
 
+        if encoding == "linear":
+            # cvar は 0..2 なので is_two == (cvar == 2) は 2*is_two <= cvar <= 2*is_two + 1、
+            # is_one == (cvar == 1) は is_one == cvar - 2*is_two で線形に書ける
+            if maxTwoStudentsBonus > 0 or singleStudentPenalty > 0:
+                b_two = model.NewBoolVar(f"is_two_{t_id}_{ts_id}")
+                model.Add(2 * b_two <= cvar)
+                model.Add(cvar <= 2 * b_two + 1)
+                if maxTwoStudentsBonus > 0:
+                    obj_terms.append(b_two * maxTwoStudentsBonus)
+                if singleStudentPenalty > 0:
+                    b_one = model.NewBoolVar(f"is_one_{t_id}_{ts_id}")
+                    model.Add(b_one == cvar - 2 * b_two)
+                    obj_terms.append(b_one * (-singleStudentPenalty))
+            continue
+
         # 2名 → ボーナス
         if maxTwoStudentsBonus > 0:
             b_two = model.NewBoolVar(f"is_two_{t_id}_{ts_id}")
@@ -209,38 +675,27 @@ def solve_shifts(teachers: Dict[str, Teacher],
             model.Add(cvar != 1).OnlyEnforceIf(b_one.Not())
             obj_terms.append(b_one * (-singleStudentPenalty))
 
+    profiler.lap("3-2 two vs one", model)
+
     # 3-3) 同学年 + 同一科目 2名 同時
+    # (teacher, timeslot, subject, grade) ごとに x をまとめ、候補が2つ以上の組だけ見る。
+    # 教師は同一コマ最大2名なので、組内の合計 k は 0..2 で、同学年ペアが成立するのは k == 2 のときだけ。
+    # pair_var == (k == 2) を k - 1 <= pair_var, 2 * pair_var <= k で表す。
     if sameGradeSameSubjectBonus > 0:
-        for ts in target_timeslots:
-            ts_id = ts.timeslot_id
-            for t_id in teachers.keys():
-                # subjectごとに調べる
-                # ある timeslot, teacher, subject で2人の学生が割り当てられているかどうか
-                # nested loops over students
-                s_ids = list(students.keys())
-                for i in range(len(s_ids)):
-                    for j in range(i+1, len(s_ids)):
-                        s1 = s_ids[i]
-                        s2 = s_ids[j]
-                        # 同学年？
-                        if students[s1].grade != students[s2].grade:
-                            continue
-                        # subjectごと
-                        # simpler approach: look up if x[t_id,s1,subj,ts_id], x[t_id,s2,subj,ts_id] exist
-                        # do a pass over all possible subj in x
-                        # or we gather subjs for (t_id,ts_id)
-                        subjs_for_that_ts = set([sbj for (tt, ss, sbj, tslot) in x.keys()
-                                                 if tt==t_id and tslot==ts_id])
-                        for subj_id in subjs_for_that_ts:
-                            if (t_id, s1, subj_id, ts_id) in x and (t_id, s2, subj_id, ts_id) in x:
-                                pair_var = model.NewBoolVar(f"sameGradeSubj_{t_id}_{ts_id}_{subj_id}_{s1}_{s2}")
-                                x_s1 = x[(t_id, s1, subj_id, ts_id)]
-                                x_s2 = x[(t_id, s2, subj_id, ts_id)]
-                                sum_pair = model.NewIntVar(0, 2, f"sumPair_{t_id}_{subj_id}_{s1}_{s2}_{ts_id}")
-                                model.Add(sum_pair == x_s1 + x_s2)
-                                model.Add(sum_pair == 2).OnlyEnforceIf(pair_var)
-                                model.Add(sum_pair != 2).OnlyEnforceIf(pair_var.Not())
-                                obj_terms.append(pair_var * sameGradeSameSubjectBonus)
+        same_grade_groups = defaultdict(list)
+        for (t_id, s_id, subj_id, ts_id), var in x.items():
+            same_grade_groups[(t_id, ts_id, subj_id, students[s_id].grade)].append(var)
+
+        for (t_id, ts_id, subj_id, grade), group_vars in same_grade_groups.items():
+            if len(group_vars) < 2:
+                continue
+            pair_var = model.NewBoolVar(f"sameGradeSubj_{t_id}_{ts_id}_{subj_id}_{grade}")
+            group_sum = sum(group_vars)
+            model.Add(group_sum - 1 <= pair_var)
+            model.Add(2 * pair_var <= group_sum)
+            obj_terms.append(pair_var * sameGradeSameSubjectBonus)
+
+    profiler.lap("3-3 same grade", model)
 
     # 3-4) レギュラー continuity ボーナス
     if regularClassContinuityBonus > 0:
@@ -248,14 +703,16 @@ def solve_shifts(teachers: Dict[str, Teacher],
             if (s_id, t_id, subj_id) in regular_class_continuity_info:
                 obj_terms.append(var * regularClassContinuityBonus)
 
+    profiler.lap("3-4 continuity", model)
+
     # 3-5) ギャップペナルティ
     # ---------- teacher gap -----------
     # teacher_timeslots_by_date
     teacher_timeslots_by_date = defaultdict(list)
-    for ts in target_timeslots:
-        for t_id, t_obj in teachers.items():
-            if ts in t_obj.available_timeslots:
-                teacher_timeslots_by_date[(t_id, ts.date)].append(ts)
+    for t_id, t_obj in teachers.items():
+        for ts_idx in mask_indices(t_obj.availability_mask & campaign_mask):
+            ts = ts_by_index[ts_idx]
+            teacher_timeslots_by_date[(t_id, ts.date)].append(ts)
 
     # teacher_assigned
     teacher_assigned = {}
@@ -268,11 +725,10 @@ def solve_shifts(teachers: Dict[str, Teacher],
 
     # assigned=1 if any x[t, s, subj, ts]==1
     for (t_id, ts_id), assigned_var in teacher_assigned.items():
-        relevant_x = []
-        for (tt, ss, sbj, tslot) in x.keys():
-            if tt == t_id and tslot == ts_id:
-                relevant_x.append(x[(tt, ss, sbj, tslot)])
-        if relevant_x:
+        relevant_x = x_index.by_teacher_ts.get((t_id, ts_id), [])
+        if relevant_x and encoding == "linear":
+            model.AddMaxEquality(assigned_var, relevant_x)
+        elif relevant_x:
             model.Add(sum(relevant_x) >= 1).OnlyEnforceIf(assigned_var)
             model.Add(sum(relevant_x) == 0).OnlyEnforceIf(assigned_var.Not())
         else:
@@ -287,16 +743,23 @@ def solve_shifts(teachers: Dict[str, Teacher],
                 a_var = teacher_assigned[(t_id, tsA.timeslot_id)]
                 b_var = teacher_assigned[(t_id, tsB.timeslot_id)]
                 gap_var = model.NewBoolVar(f"t_gap_{t_id}_{tsA.timeslot_id}_{tsB.timeslot_id}")
-                model.Add(a_var != b_var).OnlyEnforceIf(gap_var)
-                model.Add(a_var == b_var).OnlyEnforceIf(gap_var.Not())
+                if encoding == "linear":
+                    # ペナルティなので gap_var >= |a - b| だけで最適解では gap_var == (a != b)
+                    model.Add(gap_var >= a_var - b_var)
+                    model.Add(gap_var >= b_var - a_var)
+                else:
+                    model.Add(a_var != b_var).OnlyEnforceIf(gap_var)
+                    model.Add(a_var == b_var).OnlyEnforceIf(gap_var.Not())
                 obj_terms.append(gap_var * (-teacherGapPenalty))
 
+    profiler.lap("3-5 teacher gap", model)
+
     # ---------- student gap -----------
     student_timeslots_by_date = defaultdict(list)
-    for ts in target_timeslots:
-        for s_id, s_obj in students.items():
-            if ts in s_obj.available_timeslots:
-                student_timeslots_by_date[(s_id, ts.date)].append(ts)
+    for s_id, s_obj in students.items():
+        for ts_idx in mask_indices(s_obj.availability_mask & campaign_mask):
+            ts = ts_by_index[ts_idx]
+            student_timeslots_by_date[(s_id, ts.date)].append(ts)
 
     # student_assigned
     student_assigned = {}
@@ -309,11 +772,10 @@ def solve_shifts(teachers: Dict[str, Teacher],
 
     # assigned=1 if sum_x >=1
     for (s_id, ts_id), assigned_var in student_assigned.items():
-        relevant_x = []
-        for (tt, ss, sbj, tslot) in x.keys():
-            if ss == s_id and tslot == ts_id:
-                relevant_x.append(x[(tt, ss, sbj, tslot)])
-        if relevant_x:
+        relevant_x = x_index.by_student_ts.get((s_id, ts_id), [])
+        if relevant_x and encoding == "linear":
+            model.AddMaxEquality(assigned_var, relevant_x)
+        elif relevant_x:
             model.Add(sum(relevant_x) >= 1).OnlyEnforceIf(assigned_var)
             model.Add(sum(relevant_x) == 0).OnlyEnforceIf(assigned_var.Not())
         else:
@@ -329,20 +791,96 @@ def solve_shifts(teachers: Dict[str, Teacher],
                 a_var = student_assigned[(s_id, tsA.timeslot_id)]
                 b_var = student_assigned[(s_id, tsB.timeslot_id)]
                 gap_var = model.NewBoolVar(f"s_gap_{s_id}_{tsA.timeslot_id}_{tsB.timeslot_id}")
-                model.Add(a_var != b_var).OnlyEnforceIf(gap_var)
-                model.Add(a_var == b_var).OnlyEnforceIf(gap_var.Not())
+                if encoding == "linear":
+                    # ペナルティなので gap_var >= |a - b| だけで最適解では gap_var == (a != b)
+                    model.Add(gap_var >= a_var - b_var)
+                    model.Add(gap_var >= b_var - a_var)
+                else:
+                    model.Add(a_var != b_var).OnlyEnforceIf(gap_var)
+                    model.Add(a_var == b_var).OnlyEnforceIf(gap_var.Not())
                 obj_terms.append(gap_var * (-studentGapPenalty * penalty_factor))
 
+    profiler.lap("3-5 student gap", model)
+
+    # 3-6) 前回スケジュールからの変更ペナルティ
+    # 前回あった割当を外す / 前回なかった割当を足すたびにマイナス
+    if previous_assignment and scheduleChangePenalty > 0:
+        for key, var in x.items():
+            if key in previous_assignment:
+                obj_terms.append((1 - var) * (-scheduleChangePenalty))
+            else:
+                obj_terms.append(var * (-scheduleChangePenalty))
+
+    profiler.lap("3-6 change penalty", model)
+
 # objective
     model.Maximize(sum(obj_terms))
 
+    # 前回スケジュール (または hint_assignment) を解のヒントに (warm start)
+    # ヒントの割当のうち、今回 x が作られなかったもの (空きが消えた等) は捨てる
+    # 補助変数まで埋める前解き (complete_hint) の時間は本番の max_time_in_seconds から差し引く
+    hint_source = hint_assignment if hint_assignment is not None else previous_assignment
+    if hint_source:
+        hinted = sum(1 for key in x if key in hint_source)
+        hint_budget = hint_completion_budget(solver_params)
+        completed = False
+        if hint_budget > 0:
+            hint_start = time.perf_counter()
+            with profiler.phase("solve_shifts/complete_hint"):
+                completed = complete_hint(model, x, hint_source, hint_budget)
+            max_time = solver_params.get("max_time_in_seconds", 0)
+            if max_time > 0:
+                solver_params = dict(solver_params)
+                solver_params["max_time_in_seconds"] = max(max_time - (time.perf_counter() - hint_start), 0.1)
+        if completed:
+            logger.info(f"Warm start: {hinted}/{len(hint_source)} assignments hinted (all variables).")
+        else:
+            for key, var in x.items():
+                model.AddHint(var, 1 if key in hint_source else 0)
+            logger.info(f"Warm start: {hinted}/{len(hint_source)} assignments hinted.")
+
+    profiler.lap("objective / hints", model)
+
     # solve
+    if solve_stats is not None:
+        proto = model.Proto()
+        solve_stats["build_time"] = time.perf_counter() - build_start
+        solve_stats["num_variables"] = len(proto.variables)
+        solve_stats["num_constraints"] = len(proto.constraints)
+
     solver = cp_model.CpSolver()
-    status = solver.Solve(model)
+    apply_solver_params(solver, solver_params)
+    callback = None
+    if on_solution is not None:
+        callback = StreamingSolutionCallback(x, shortage, teachers, students, timeslots, subjects,
+                                             on_solution, stream_interval)
+    with profiler.phase("solve_shifts/solve"):
+        status = solver.Solve(model, callback)
+    if callback is not None:
+        callback.flush()
+        profiler.count("streamed_solutions", callback.num_exported)
+    profiler.set("solver", {
+        "status": solver.StatusName(status),
+        "objective": solver.ObjectiveValue() if status in [cp_model.OPTIMAL, cp_model.FEASIBLE] else None,
+        "best_bound": solver.BestObjectiveBound(),
+        "wall_time": solver.WallTime(),
+        "user_time": solver.UserTime(),
+        "stop_reason": describe_stop_reason(solver, status, solver_params),
+        "num_branches": solver.NumBranches(),
+        "num_conflicts": solver.NumConflicts(),
+    })
+    if solve_stats is not None:
+        solve_stats["status"] = solver.StatusName(status)
+        solve_stats["wall_time"] = solver.WallTime()
+        solve_stats["stop_reason"] = describe_stop_reason(solver, status, solver_params)
+        if status in [cp_model.OPTIMAL, cp_model.FEASIBLE]:
+            solve_stats["objective"] = solver.ObjectiveValue()
+            solve_stats["best_bound"] = solver.BestObjectiveBound()
     if status in [cp_model.OPTIMAL, cp_model.FEASIBLE]:
         logger.info(f"Solution found. ObjVal={solver.ObjectiveValue()}")
         # build shift
-        shifts = build_shift_objects(solver, x, teachers, students, timeslots, subjects)
+        with profiler.phase("solve_shifts/build_shift_objects"):
+            shifts = build_shift_objects(solver, x, teachers, students, timeslots, subjects)
         # gather shortage
         shortage_result = {}
         for (s_id, sbj_id), short_var in shortage.items():
@@ -359,11 +897,19 @@ def build_shift_objects(solver: cp_model.CpSolver,
                         timeslots: Dict[str, TimeSlot],
                         subjects: Dict[str, Subject]) -> List[Shift]:
     # x=1 のみShift作成
-    from collections import defaultdict
+    assigned = [key for key, var in x_vars.items() if solver.Value(var) == 1]
+    return shifts_from_assignment(assigned, teachers, students, timeslots, subjects)
+
+
+def shifts_from_assignment(assignment,
+                           teachers: Dict[str, Teacher],
+                           students: Dict[str, Student],
+                           timeslots: Dict[str, TimeSlot],
+                           subjects: Dict[str, Subject]) -> List[Shift]:
+    """(t_id, s_id, subj_id, ts_id) の並びを (教師, 科目, コマ) ごとの Shift にまとめる。"""
     assignment_dict = defaultdict(list)
-    for (t_id, s_id, sbj_id, ts_id), var in x_vars.items():
-        if solver.Value(var) == 1:
-            assignment_dict[(t_id, sbj_id, ts_id)].append(s_id)
+    for (t_id, s_id, sbj_id, ts_id) in assignment:
+        assignment_dict[(t_id, sbj_id, ts_id)].append(s_id)
 
     shifts = []
     shift_counter = 1
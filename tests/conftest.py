@@ -0,0 +1,84 @@
+# tests/conftest.py
+#
+# リポジトリ直下のモジュール (solver_cp_sat / reader / ...) を import できるようにする。
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def make_dataset(teachers, students, n_slots, weights, campaign_id="CAM1"):
+    """
+    小さな入力を組み立てる。
+      teachers: {t_id: (科目のリスト, 空きコマの添字のリスト, min_classes)}
+      students: {s_id: (学年, {科目: コマ数}, 空きコマの添字のリスト)}
+    コマは TS0..TS{n_slots-1} (すべて 2025-08-01、period_index = 添字 + 1)。
+    """
+    from models import Teacher, Student, TimeSlot, Campaign, Subject
+
+    timeslots = {f"TS{i}": TimeSlot(f"TS{i}", "2025-08-01", i + 1, campaign_id, f"{i + 1}限", index=i)
+                 for i in range(n_slots)}
+    subject_ids = {sbj for subs, _, _ in teachers.values() for sbj in subs}
+    subject_ids |= {sbj for _, reqs, _ in students.values() for sbj in reqs}
+    subjects = {sbj: Subject(sbj, sbj) for sbj in sorted(subject_ids)}
+    teacher_objs = {}
+    for t_id, (subs, slots, min_classes) in teachers.items():
+        t = Teacher(t_id, t_id, desired_shift_count=0, min_classes=min_classes,
+                    teachable_subjects=[subjects[s] for s in subs])
+        for i in slots:
+            t.add_available_timeslot(timeslots[f"TS{i}"])
+        teacher_objs[t_id] = t
+    student_objs = {}
+    for s_id, (grade, reqs, slots) in students.items():
+        s = Student(s_id, s_id, grade, "GapAllowed", dict(reqs))
+        for i in slots:
+            s.add_available_timeslot(timeslots[f"TS{i}"])
+        student_objs[s_id] = s
+    return {
+        "teachers": teacher_objs,
+        "students": student_objs,
+        "timeslots": timeslots,
+        "campaigns": {campaign_id: Campaign(campaign_id, campaign_id, "2025-08-01", "2025-08-01", "")},
+        "regular_classes": {},
+        "subjects": subjects,
+        "constraint_weights": dict(weights),
+    }
+
+
+def make_form_sheets(n_teachers=3, n_students=6, dates=("8/1（金）", "8/2（土）")):
+    """
+    google_api_data.py が読むフォームの回答 {"teacher": 行, "student": 行} を小さく作る。
+    i 番目の人の回答は i から決まるので、何度作っても同じ。
+    """
+    from google_api_data import TEACHABLE_SUBJECTS, REQUIREMENT_SUBJECTS, REGULAR_CLASS_SUBJECTS
+
+    teachable = list(TEACHABLE_SUBJECTS)
+    requirement_headers = list(REQUIREMENT_SUBJECTS)
+    teacher_rows = [["タイムスタンプ", "名前", "指導可能科目", "最低限出勤コマ数"]
+                    + [f"シフト希望 [{d}]" for d in dates]
+                    + [h for k in range(1, 7) for h in (f"担当生徒名{k}", f"授業{k}", f"授業日{k}", f"授業時間{k}")]]
+    for i in range(1, n_teachers + 1):
+        row = [f"2025/07/01 10:{i:02d}:00", f"教師{i}", ", ".join(teachable[i % 4:i % 4 + 2]), "1"]
+        row += ["2限, 3限" if (i + d) % 2 else "3限, 4限" for d in range(len(dates))]
+        row += [f"生徒{i}", list(REGULAR_CLASS_SUBJECTS)[i % 4], "金曜日", "2限"] + ["", "", "", ""] * 5
+        teacher_rows.append(row)
+    student_rows = [["タイムスタンプ", "名前", "所属を選んでください",
+                     "学年(elementary)", "学年(middle)", "学年(high)", "空きコマに関する質問"]
+                    + requirement_headers + [f"希望授業枠 [{d.split('（')[0]}]" for d in dates]]
+    for i in range(1, n_students + 1):
+        student_rows.append([f"2025/07/01 11:{i:02d}:00", f"生徒{i}", "小学生", f"{i % 6 + 1}年", "", "",
+                             "気にしない"]
+                            + [f"{i % 3 + 1}コマ" if h.startswith("小学生：") and k % 2 == i % 2 else ""
+                               for k, h in enumerate(requirement_headers)]
+                            + ["2限, 3限, 4限" for _ in dates])
+    return {"teacher": teacher_rows, "student": student_rows}
+
+
+def add_form_response(sheets, form, name, timestamp="2025/07/02 09:00:00"):
+    """form ("teacher" / "student") の最後の回答を名前とタイムスタンプだけ変えて末尾に足す。"""
+    row = list(sheets[form][-1])
+    row[0], row[1] = timestamp, name
+    sheets[form].append(row)
@@ -0,0 +1,59 @@
+# tests/test_candidates.py
+#
+# x 候補の列挙: "numpy" と "bitmask" が複数キャンペーンの入力でも同じ候補を同じ順序で返すこと。
+# 生徒の空きには他のキャンペーンのコマも入るので、numpy 側がそのビットで溢れないことも確かめる。
+
+import pytest
+
+from models import Campaign
+from solver_cp_sat import generate_candidates, generate_candidates_numpy, solve_shifts
+from conftest import make_dataset
+
+
+def _two_campaigns():
+    # TS0..TS3 が CAM1、TS4..TS11 が CAM2 (CAM1 を解くと生徒の空きに columns より上のビットが残る)
+    dataset = make_dataset(
+        teachers={"T1": (["MS_Math", "MS_Eng"], [0, 1, 4, 9], 0),
+                  "T2": (["MS_Eng"], [1, 2, 3, 10, 11], 0)},
+        students={"S1": ("Middle1", {"MS_Math": 1, "MS_Eng": 1}, [0, 1, 2, 9, 11]),
+                  "S2": ("Middle2", {"MS_Eng": 2}, [1, 3, 4, 10]),
+                  "S3": ("Middle1", {"MS_Math": 1}, [0, 3, 11])},
+        n_slots=12,
+        weights={"maxTwoStudentsBonus": 10, "shortagePenalty": 30})
+    for i in range(4, 12):
+        dataset["timeslots"][f"TS{i}"].campaign_id = "CAM2"
+    dataset["campaigns"]["CAM2"] = Campaign("CAM2", "CAM2", "2025-08-01", "2025-08-01", "")
+    return dataset
+
+
+@pytest.mark.parametrize("campaign_id", ["CAM1", "CAM2"])
+def test_backends_agree_on_multi_campaign_data(campaign_id):
+    dataset = _two_campaigns()
+    ts_by_index = {ts.index: ts for ts in dataset["timeslots"].values() if ts.campaign_id == campaign_id}
+    campaign_mask = 0
+    for i in ts_by_index:
+        campaign_mask |= 1 << i
+    pairs = [(t_id, subj.subject_id) for t_id, t in dataset["teachers"].items() for subj in t.teachable_subjects]
+    by_subject = {}
+    for s_id, s in dataset["students"].items():
+        for subj_id in s.requirements:
+            by_subject.setdefault(subj_id, []).append(s_id)
+    masks = {t_id: t.availability_mask & campaign_mask for t_id, t in dataset["teachers"].items()}
+    args = (pairs, by_subject, masks, dataset["students"], ts_by_index)
+
+    expected = list(generate_candidates(*args))
+    assert expected
+    assert generate_candidates_numpy(*args) == expected
+
+
+@pytest.mark.parametrize("campaign_id", ["CAM1", "CAM2"])
+def test_backends_give_same_solution(campaign_id):
+    results = []
+    for backend in ("bitmask", "numpy"):
+        stats = {}
+        shifts, shortage = solve_shifts(**_two_campaigns(), campaign_id=campaign_id,
+                                        solver_params={"num_search_workers": 1},
+                                        solve_stats=stats, candidate_backend=backend)
+        assert stats["status"] == "OPTIMAL"
+        results.append((stats["objective"], stats["num_variables"], shortage))
+    assert results[0] == results[1]
@@ -0,0 +1,30 @@
+# tests/test_decompose.py
+#
+# 日付ブロックへの分割 (decompose.solve_shifts_decomposed) のテスト。
+
+from decompose import split_proportionally, solve_shifts_decomposed
+from conftest import make_dataset
+
+
+def test_split_proportionally_keeps_the_total():
+    assert split_proportionally(20, {"a": 3, "b": 3, "c": 3}) == {"a": 7, "b": 7, "c": 6}
+    assert split_proportionally(3, {"a": 1, "b": 0}) == {"a": 3, "b": 0}
+
+
+def test_repair_moves_students_of_under_min_teacher():
+    # TS0 は 8/1、TS1 は 8/2。T1 (min_classes 2、desired 2) は両日来られるが、生徒 S1 は 8/1 だけ。
+    # 8/1 のブロックでは desired の取り分に合わせて T1 が S1 を持つが、全体では 1コマで min_classes を割る。
+    # 修復で T1 を外して 8/1 を解き直すと、T2 が S1 を持つはず
+    dataset = make_dataset(
+        teachers={"T1": (["MS_Math"], [0, 1], 2), "T2": (["MS_Math"], [0], 0)},
+        students={"S1": ("Middle1", {"MS_Math": 1}, [0])},
+        n_slots=2,
+        weights={"shortagePenalty": 30, "teacherDesiredPenalty": 5})
+    dataset["timeslots"]["TS1"].date = "2025-08-02"
+    dataset["teachers"]["T1"].desired_shift_count = 2
+
+    shifts, shortage = solve_shifts_decomposed(**dataset, campaign_id="CAM1",
+                                               solver_params={"num_search_workers": 1}, max_workers=1)
+    assigned = {(sh.teacher.teacher_id, st.student_id) for sh in shifts for st in sh.assigned_students}
+    assert assigned == {("T2", "S1")}
+    assert sum(shortage.values()) == 0
@@ -0,0 +1,182 @@
+# tests/test_form_pipeline.py
+#
+# google_api_data.run_pipeline が、段を飛ばしたり差分で差し込んだりしても、
+# 書き出した CSV がいつもその段の結果と一致すること。
+# 回答の書き換え・削除・追加を取り込んだ結果が、全段をやり直した場合と同じになること。
+# INPUT_SOURCE = "forms" の読み込みが google_api_data.py の出力に触らないこと。
+
+import csv
+import os
+
+from google_api_data import run_pipeline, STAGES
+from conftest import make_form_sheets, add_form_response
+
+
+def _csv_files():
+    return [file_name for _, _, _, file_name in STAGES if file_name]
+
+
+def _read_csvs(out_dir):
+    rows = {}
+    for file_name in _csv_files():
+        with open(os.path.join(out_dir, file_name), encoding="utf-8", newline="") as f:
+            rows[file_name] = list(csv.reader(f))
+    return rows
+
+
+def _expected(sheets, tmp_path):
+    """キャッシュなしで全部作り直したときの CSV (ID 台帳は同じものを使う)"""
+    out_dir = str(tmp_path / "expected")
+    run_pipeline(sheets, out_dir=out_dir, cache_dir=None, id_registry_file=str(tmp_path / "ids.json"))
+    return _read_csvs(out_dir)
+
+
+def test_skipped_stage_rewrites_missing_or_edited_csv(tmp_path):
+    sheets = make_form_sheets()
+    out_dir = str(tmp_path / "data")
+    run_pipeline(sheets, out_dir=out_dir, cache_dir=str(tmp_path / "cache"),
+                 id_registry_file=str(tmp_path / "ids.json"))
+    students_csv, teachers_csv = (os.path.join(out_dir, f) for f in ("students.csv", "teachers.csv"))
+    with open(students_csv, "a", encoding="utf-8") as f:
+        f.write("edited by hand\n")
+    os.remove(teachers_csv)
+
+    result = run_pipeline(sheets, out_dir=out_dir, cache_dir=str(tmp_path / "cache"),
+                          id_registry_file=str(tmp_path / "ids.json"))
+
+    assert result["ran"] == []
+    assert sorted(result["written"]) == sorted([students_csv, teachers_csv])
+    assert _read_csvs(out_dir) == _expected(sheets, tmp_path)
+
+
+def test_changed_response_reruns_stages(tmp_path):
+    sheets = make_form_sheets()
+    out_dir = str(tmp_path / "data")
+    run_pipeline(sheets, out_dir=out_dir, cache_dir=str(tmp_path / "cache"),
+                 id_registry_file=str(tmp_path / "ids.json"))
+    add_form_response(sheets, "student", "生徒7")
+
+    result = run_pipeline(sheets, out_dir=out_dir, cache_dir=str(tmp_path / "cache"),
+                          id_registry_file=str(tmp_path / "ids.json"))
+
+    assert "students" in result["ran"] and "teachers" in result["skipped"]
+    assert _read_csvs(out_dir) == _expected(sheets, tmp_path)
+    with open(os.path.join(out_dir, "students.csv"), encoding="utf-8", newline="") as f:
+        assert any("生徒7" in row for row in csv.reader(f))
+
+
+def test_skipped_stage_rewrites_csv_left_stale_by_run_without_export(tmp_path):
+    sheets = make_form_sheets()
+    out_dir = str(tmp_path / "data")
+    run_pipeline(sheets, out_dir=out_dir, cache_dir=str(tmp_path / "cache"),
+                 id_registry_file=str(tmp_path / "ids.json"))
+    add_form_response(sheets, "student", "生徒7")
+    run_pipeline(sheets, out_dir=out_dir, cache_dir=str(tmp_path / "cache"), export_csv=False,
+                 id_registry_file=str(tmp_path / "ids.json"))
+
+    result = run_pipeline(sheets, out_dir=out_dir, cache_dir=str(tmp_path / "cache"),
+                          id_registry_file=str(tmp_path / "ids.json"))
+
+    assert result["ran"] == []
+    assert _read_csvs(out_dir) == _expected(sheets, tmp_path)
+    assert any(row[1] == "生徒7" for row in result["rows"]["students"][1:])
+
+
+def test_form_inputs_leave_cli_outputs_alone(tmp_path, monkeypatch):
+    # INPUT_SOURCE = "forms" の読み込みは、既定では DATA_DIR にも CLI のキャッシュにも書かない
+    import google_api_data
+
+    stub_dir = tmp_path / "forms"
+    stub_dir.mkdir()
+    for form, rows in make_form_sheets().items():
+        with open(stub_dir / f"{form}.csv", "w", encoding="utf-8", newline="") as f:
+            csv.writer(f).writerows(rows)
+    written = []
+    monkeypatch.setattr(google_api_data, "write_csv", lambda rows, path, append=False: written.append(path))
+
+    inputs = google_api_data.load_form_inputs(stub_dir=str(stub_dir), cache_dir=str(tmp_path / "cache"),
+                                              id_registry_file=str(tmp_path / "ids.json"))
+
+    assert written == []
+    assert sorted(inputs["students"]) == [f"S{i}" for i in range(1, 7)]
+
+
+def _run(sheets, tmp_path, export_csv=True):
+    return run_pipeline(sheets, out_dir=str(tmp_path / "data"), cache_dir=str(tmp_path / "cache"),
+                        export_csv=export_csv, id_registry_file=str(tmp_path / "ids.json"))
+
+
+def _full(sheets, tmp_path):
+    return run_pipeline(sheets, out_dir=str(tmp_path / "full"), cache_dir=None, force=True,
+                        id_registry_file=str(tmp_path / "ids.json"))
+
+
+def test_patched_stages_match_forced_full_run(tmp_path):
+    sheets = make_form_sheets()
+    _run(sheets, tmp_path)
+    # 生徒2 の希望コマを書き換え、生徒7 の回答を足す
+    edited = list(sheets["student"][2])
+    edited[0], edited[-1] = "2025/07/02 08:00:00", "2限"
+    sheets["student"][2] = edited
+    add_form_response(sheets, "student", "生徒7")
+    result = _run(sheets, tmp_path)
+    full = _full(sheets, tmp_path)
+
+    assert {"students", "student_requirements", "student_availability"} <= set(result["patched"])
+    assert result["changed"]["student_form"] == {"生徒2", "生徒7"}
+    assert result["rows"] == full["rows"]
+    assert _read_csvs(str(tmp_path / "data")) == _read_csvs(str(tmp_path / "full"))
+
+
+def test_deleted_response_is_dropped_from_patched_stages(tmp_path):
+    sheets = make_form_sheets()
+    _run(sheets, tmp_path)
+    # ID は台帳から引くので、回答を消しても後ろの人の ID はずれず、差し込みで済む
+    del sheets["student"][4]
+    result = _run(sheets, tmp_path)
+    full = _full(sheets, tmp_path)
+
+    assert "students" in result["patched"]
+    # 消えた回答は changed に入らず、patch_person_rows が行を落とす
+    assert result["changed"]["student_form"] == set()
+    assert all(row[1] != "生徒4" for row in result["rows"]["students"][1:])
+    assert result["rows"] == full["rows"]
+    assert _read_csvs(str(tmp_path / "data")) == _read_csvs(str(tmp_path / "full"))
+
+
+def test_appended_responses_are_spliced_onto_csv(tmp_path, monkeypatch):
+    import google_api_data
+
+    sheets = make_form_sheets()
+    _run(sheets, tmp_path)
+    add_form_response(sheets, "student", "生徒7")
+    appended = []
+    write_csv = google_api_data.write_csv
+
+    def spy(rows, path, append=False):
+        if append:
+            appended.append((os.path.basename(path), len(rows)))
+        write_csv(rows, path, append)
+
+    monkeypatch.setattr(google_api_data, "write_csv", spy)
+    result = _run(sheets, tmp_path)
+    _full(sheets, tmp_path)
+
+    assert "students" in result["patched"]
+    assert ("students.csv", 1) in appended
+    assert _read_csvs(str(tmp_path / "data")) == _read_csvs(str(tmp_path / "full"))
+
+
+def test_patched_stage_does_not_append_to_stale_csv(tmp_path):
+    sheets = make_form_sheets()
+    _run(sheets, tmp_path)
+    add_form_response(sheets, "student", "生徒7")
+    _run(sheets, tmp_path, export_csv=False)
+    add_form_response(sheets, "student", "生徒8", timestamp="2025/07/03 09:00:00")
+    result = _run(sheets, tmp_path)
+    _full(sheets, tmp_path)
+
+    assert "students" in result["patched"]
+    names = [row[1] for row in result["rows"]["students"][1:]]
+    assert names.count("生徒7") == 1 and names.count("生徒8") == 1
+    assert _read_csvs(str(tmp_path / "data")) == _read_csvs(str(tmp_path / "full"))
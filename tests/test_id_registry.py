@@ -0,0 +1,65 @@
+# tests/test_id_registry.py
+#
+# ID 台帳 (id_registry.IdRegistry) が取り込みをまたいで同じ ID を返し、消えた人の ID を使い回さないこと。
+# 台帳が書き換えられたら、run_pipeline は *_ids の段をキャッシュから飛ばさずにやり直すこと。
+
+import json
+
+import pytest
+
+from id_registry import IdRegistry
+from google_api_data import run_pipeline
+from conftest import make_form_sheets
+
+
+def _reimport(path, kind, keys):
+    registry = IdRegistry(str(path))
+    ids = registry.assign(kind, keys)
+    registry.save()
+    return ids
+
+
+def test_ids_are_stable_across_reimport(tmp_path):
+    path = tmp_path / "ids.json"
+    first = _reimport(path, "student", ["A", "B", "C"])
+    # 並びが変わっても、新しい人が先頭に来ても既存の ID は変わらない
+    second = _reimport(path, "student", ["D", "C", "A", "B"])
+
+    assert first == {"A": "S1", "B": "S2", "C": "S3"}
+    assert second == dict(first, D="S4")
+
+
+def test_ids_of_removed_entries_are_not_reused(tmp_path):
+    path = tmp_path / "ids.json"
+    _reimport(path, "teacher", ["A", "B", "C"])
+    after_removal = _reimport(path, "teacher", ["A", "C", "D"])
+    returned = _reimport(path, "teacher", ["B", "D"])
+
+    assert after_removal == {"A": "T1", "C": "T3", "D": "T4"}
+    assert returned == {"B": "T2", "D": "T4"}
+
+
+def test_unreadable_registry_raises(tmp_path):
+    path = tmp_path / "ids.json"
+    path.write_text("{not json", encoding="utf-8")
+
+    with pytest.raises(ValueError, match="ids.json is unreadable"):
+        IdRegistry(str(path))
+
+
+def test_edited_registry_reruns_id_stages(tmp_path):
+    sheets = make_form_sheets()
+    path = tmp_path / "ids.json"
+
+    def run():
+        return run_pipeline(sheets, out_dir=str(tmp_path / "data"), cache_dir=str(tmp_path / "cache"),
+                            id_registry_file=str(path))
+
+    run()
+    data = json.loads(path.read_text(encoding="utf-8"))
+    data["student"]["生徒1"] = "S10"
+    path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    result = run()
+
+    assert "student_ids" in result["ran"] and "teacher_ids" in result["skipped"]
+    assert ["S10", "生徒1"] == result["rows"]["students"][1][:2]
@@ -0,0 +1,67 @@
+# tests/test_incremental.py
+#
+# 差分モード (incremental.diff_inputs / affected_neighborhood + solve_shifts(affected=...)) のテスト。
+
+from incremental import snapshot_inputs, diff_inputs, affected_neighborhood
+from solver_cp_sat import solve_shifts
+from conftest import make_dataset
+
+WEIGHTS = {"maxTwoStudentsBonus": 10, "shortagePenalty": 30}
+
+
+def _dataset(student_ids):
+    # 教師 T1 はコマ TS0 だけ。生徒はみな MS_Math を1コマ希望し、TS0 に来られる
+    return make_dataset(
+        teachers={"T1": (["MS_Math"], [0], 0)},
+        students={s_id: ("Middle1", {"MS_Math": 1}, [0]) for s_id in student_ids},
+        n_slots=1,
+        weights=WEIGHTS)
+
+
+def _snapshot(dataset):
+    return snapshot_inputs(dataset["teachers"], dataset["students"], dataset["timeslots"],
+                           dataset["regular_classes"], dataset["constraint_weights"], "CAM1")
+
+
+def test_removed_student_counts_as_changed():
+    old = _snapshot(_dataset(["S1", "S2", "S3"]))
+    new = _snapshot(_dataset(["S2", "S3"]))
+    assert diff_inputs(old, new) == (set(), {"S1"})
+
+
+def test_removed_teacher_counts_as_changed():
+    old = _snapshot(_dataset(["S1"]))
+    new = dict(old, teachers={})
+    assert diff_inputs(old, new) == ({"T1"}, set())
+
+
+def test_changed_weights_fall_back_to_full_solve():
+    dataset = _dataset(["S1", "S2"])
+    old = _snapshot(dataset)
+    dataset["constraint_weights"] = dict(WEIGHTS, shortagePenalty=50)
+    assert diff_inputs(old, _snapshot(dataset)) is None
+
+
+def test_changed_campaign_timeslots_fall_back_to_full_solve():
+    dataset = _dataset(["S1", "S2"])
+    old = _snapshot(dataset)
+    dataset["timeslots"]["TS0"].campaign_id = "CAM2"
+    assert diff_inputs(old, _snapshot(dataset)) is None
+
+
+def test_former_teacher_of_removed_student_is_rescheduled():
+    # 前回: T1 は TS0 で S1, S2 を担当し、S3 は不足 1。
+    # 今回 S1 が抜けたので、T1 の空いた枠に S3 を入れ直せるはず
+    previous_assignment = {("T1", "S1", "MS_Math", "TS0"), ("T1", "S2", "MS_Math", "TS0")}
+    old = _snapshot(_dataset(["S1", "S2", "S3"]))
+    dataset = _dataset(["S2", "S3"])
+
+    changed_teachers, changed_students = diff_inputs(old, _snapshot(dataset))
+    affected = affected_neighborhood(changed_teachers, changed_students, previous_assignment)
+    assert "T1" in affected[0]
+
+    shifts, shortage = solve_shifts(**dataset, campaign_id="CAM1", solver_params={"num_search_workers": 1},
+                                    previous_assignment=previous_assignment, affected=affected)
+    assigned = {(sh.teacher.teacher_id, st.student_id) for sh in shifts for st in sh.assigned_students}
+    assert assigned == {("T1", "S2"), ("T1", "S3")}
+    assert sum(shortage.values()) == 0
@@ -0,0 +1,45 @@
+# tests/test_objective.py
+#
+# data/ と api_data/ を最適まで解いたときの目的関数値を固定する。
+# 同学年ボーナス (3-3) を (教師, コマ, 科目, 学年) のグループで作るようにしたときの値で、
+# モデルの組み方を変えても最適値が動かないことを確かめる。data/ と api_data/ では同学年の組が
+# 最適解に現れないので、同学年ボーナスそのものは小さな入力で値を確かめる。
+
+import os
+
+import pytest
+
+from reader import load_inputs_dir
+from solver_cp_sat import solve_shifts
+from conftest import ROOT, make_dataset
+
+# (データ, 最適値)
+EXPECTED_OBJECTIVES = [("data", -63.0), ("api_data", 46.0)]
+
+
+@pytest.mark.parametrize("encoding", ["reified", "linear"])
+@pytest.mark.parametrize("data_dir, expected", EXPECTED_OBJECTIVES)
+def test_optimal_objective_is_pinned(data_dir, expected, encoding):
+    dataset = load_inputs_dir(os.path.join(ROOT, data_dir))
+    stats = {}
+    solve_shifts(**dataset, campaign_id="CAM1", solver_params={"num_search_workers": 1},
+                 solve_stats=stats, encoding=encoding)
+    assert stats["status"] == "OPTIMAL"
+    assert stats["objective"] == expected
+
+
+@pytest.mark.parametrize("encoding", ["reified", "linear"])
+@pytest.mark.parametrize("grades, expected", [(("Middle1", "Middle1"), 15.0), (("Middle1", "Middle2"), 10.0)])
+def test_same_grade_pair_bonus(grades, expected, encoding):
+    # 教師1人・コマ1つに同じ科目の生徒2人。同学年なら 2名ボーナス 10 + 同学年ボーナス 5
+    dataset = make_dataset(
+        teachers={"T1": (["MS_Math"], [0], 0)},
+        students={"S1": (grades[0], {"MS_Math": 1}, [0]), "S2": (grades[1], {"MS_Math": 1}, [0])},
+        n_slots=1,
+        weights={"maxTwoStudentsBonus": 10, "sameGradeBonus": 5, "shortagePenalty": 30})
+    stats = {}
+    shifts, shortage = solve_shifts(**dataset, campaign_id="CAM1", solver_params={"num_search_workers": 1},
+                                    solve_stats=stats, encoding=encoding)
+    assert stats["status"] == "OPTIMAL"
+    assert stats["objective"] == expected
+    assert sum(shortage.values()) == 0
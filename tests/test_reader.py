@@ -0,0 +1,54 @@
+# tests/test_reader.py
+#
+# reader.iter_csv が形式の誤った CSV を CsvFormatError (「パス:行番号: 内容」) にすること。
+
+import pytest
+
+from reader import CsvFormatError, iter_csv, load_teachers, load_solver_params
+
+HEADER = "teacher_id,teacher_name,desired_shift_count,min_classes,teachable_subjects\n"
+
+
+def _write(tmp_path, text, name="teachers.csv"):
+    path = tmp_path / name
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def _error(func, *args):
+    with pytest.raises(CsvFormatError) as info:
+        func(*args)
+    return info.value
+
+
+def test_missing_column(tmp_path):
+    path = _write(tmp_path, "teacher_id,teacher_name,min_classes,teachable_subjects\nT1,A,1,\n")
+    error = _error(load_teachers, path, {})
+    assert (error.path, error.line) == (path, 1)
+    assert str(error) == f"{path}:1: missing column(s) desired_shift_count"
+
+
+def test_short_row(tmp_path):
+    path = _write(tmp_path, HEADER + "T1,A,3,1,MS_Math\n\nT2,B,3\n")
+    error = _error(load_teachers, path, {})
+    # 空行も行番号に数える
+    assert str(error) == f"{path}:4: expected 5 fields, got 3"
+
+
+def test_bad_int(tmp_path):
+    path = _write(tmp_path, HEADER + "T1,A,3,1,MS_Math\nT2,B,three,1,MS_Math\n")
+    error = _error(load_teachers, path, {})
+    assert (error.path, error.line) == (path, 3)
+    assert str(error) == f"{path}:3: invalid desired_shift_count 'three'"
+
+
+def test_short_row_may_omit_optional_columns(tmp_path):
+    path = _write(tmp_path, "subject_id,subject_name,category\nMS_Math,数学\n", "subjects.csv")
+    assert list(iter_csv(path, ["subject_id", "subject_name"], optional=["category"])) == [
+        ("MS_Math", "数学", None)]
+
+
+def test_bad_solver_param(tmp_path):
+    path = _write(tmp_path, "key,value\nmax_time_in_seconds,60\nnum_search_workers,many\n", "solver_params.csv")
+    error = _error(load_solver_params, path, {"max_time_in_seconds": 0, "num_search_workers": 0})
+    assert str(error) == f"{path}:3: invalid value 'many' for num_search_workers"
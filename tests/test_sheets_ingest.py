@@ -0,0 +1,86 @@
+# tests/test_sheets_ingest.py
+#
+# シートのメタデータ (worksheet() / sheet1) の呼び出しもクォータ超過 (429) なら再試行すること。
+# sync_sheets の差分取り込みは、新しい行・タイムスタンプが変わった行のセルだけを取ること。
+
+import pytest
+
+from sheets_ingest import SheetSource, StubAPIError, StubClient, fetch_sheets, sync_sheets
+
+ROWS = [["Timestamp", "name"], ["2025-07-01 10:00:00", "A"], ["2025-07-01 11:00:00", "B"]]
+
+
+class MetadataQuotaClient(StubClient):
+    """最初の fetch_sheet_metadata だけ 429 で失敗する StubClient"""
+
+    def _call(self, name: str):
+        super()._call(name)
+        if name == "fetch_sheet_metadata" and self.calls[name] == 1:
+            raise StubAPIError(429, "quota exceeded")
+
+
+@pytest.mark.parametrize("worksheet", [None, "Form Responses"])
+def test_fetch_retries_worksheet_metadata(worksheet):
+    client = MetadataQuotaClient({"KEY": {"Form Responses": ROWS}})
+    sheets = fetch_sheets(client, [SheetSource("teacher", "KEY", worksheet)], base_delay=0.0)
+    assert sheets["teacher"] == ROWS
+    assert client.calls["fetch_sheet_metadata"] == 2
+
+
+def test_sync_retries_worksheet_metadata():
+    client = MetadataQuotaClient({"KEY": {"Form Responses": ROWS}})
+    sheets, state = sync_sheets(client, [SheetSource("teacher", "KEY")], {}, {}, base_delay=0.0)
+    assert sheets["teacher"] == ROWS
+    assert client.calls["fetch_sheet_metadata"] == 2
+
+
+# 差分取り込み: 1行目とタイムスタンプの列、それに新しい行・タイムスタンプが変わった行のセルだけを取る
+SHEET = [["Timestamp", "name", "subject"]] + [[f"2025-07-01 10:0{i}:00", f"P{i}", "Math"] for i in range(5)]
+
+
+def _sync(client, previous=None, state=None):
+    return sync_sheets(client, [SheetSource("teacher", "KEY")], previous or {}, state or {}, base_delay=0.0)
+
+
+def test_sync_fetches_only_edited_and_appended_rows():
+    rows = [list(r) for r in SHEET]
+    client = StubClient({"KEY": {"Form Responses": rows}})
+    sheets, state = _sync(client)
+    # 初回は 1行目とタイムスタンプの列を読んだうえでシート全体を取る
+    assert client.calls["cells"] == 3 + (len(rows) - 1) + 3 * len(rows)
+
+    rows[2] = ["2025-07-02 09:00:00", "P1", "English"]
+    rows.append(["2025-07-02 09:30:00", "P5", "Science"])
+    client.calls.clear()
+    sheets, state = _sync(client, sheets, state)
+
+    assert sheets["teacher"] == rows
+    # ヘッダー 3 + タイムスタンプ 6 + 書き換えた行 3 + 足した行 3
+    assert client.calls["cells"] == 3 + (len(rows) - 1) + 3 + 3
+    assert state["teacher"]["last_sync"]["mode"] == "incremental"
+    assert state["teacher"]["last_sync"]["changed_rows"] == [1, 5]
+
+
+def test_sync_refetches_whole_sheet_after_deletion():
+    rows = [list(r) for r in SHEET]
+    client = StubClient({"KEY": {"Form Responses": rows}})
+    sheets, state = _sync(client)
+
+    del rows[3]
+    client.calls.clear()
+    sheets, state = _sync(client, sheets, state)
+
+    assert sheets["teacher"] == rows
+    assert client.calls["cells"] == 3 + (len(rows) - 1) + 3 * len(rows)
+    assert state["teacher"]["last_sync"]["mode"] == "full"
+
+
+def test_sync_without_changes_fetches_only_probe():
+    client = StubClient({"KEY": {"Form Responses": [list(r) for r in SHEET]}})
+    sheets, state = _sync(client)
+    client.calls.clear()
+    again, state = _sync(client, sheets, state)
+
+    assert again == sheets
+    assert client.calls["cells"] == 3 + (len(SHEET) - 1)
+    assert client.calls["values_batch_get"] == 1
@@ -0,0 +1,37 @@
+# tests/test_streaming.py
+#
+# StreamingSolutionCallback: 間引いた解も最後に書き出されること、書き出しに失敗した解は数えないこと。
+
+import os
+
+from reader import load_inputs_dir
+from profiling import RunProfiler
+from solver_cp_sat import solve_shifts
+from conftest import ROOT
+
+
+def _solve(on_solution, stream_interval):
+    dataset = load_inputs_dir(os.path.join(ROOT, "data"))
+    profiler, stats = RunProfiler(), {}
+    solve_shifts(**dataset, campaign_id="CAM1", solver_params={"num_search_workers": 1},
+                 on_solution=on_solution, stream_interval=stream_interval,
+                 profiler=profiler, solve_stats=stats)
+    return profiler, stats
+
+
+def test_last_throttled_solution_is_exported():
+    # 間隔を長く取ると途中の解はすべて間引かれるが、最後の解は終了時に書き出される
+    objectives = []
+    profiler, stats = _solve(lambda shifts, shortage, objective: objectives.append(objective), 1000.0)
+    assert objectives
+    assert objectives[-1] == stats["objective"]
+    assert profiler.counters["streamed_solutions"] == len(objectives)
+
+
+def test_failed_export_is_not_counted():
+    def fail(shifts, shortage, objective):
+        raise OSError("disk full")
+
+    profiler, stats = _solve(fail, 0.0)
+    assert stats["status"] == "OPTIMAL"
+    assert profiler.counters["streamed_solutions"] == 0